@@ -9,9 +9,17 @@ __author__ = "Kyle Vitatus Lopin"
 
 # standard libraries
 from datetime import date, datetime
+import logging
 import os
-import tkinter as tk
-from tkinter import ttk
+# local files
+import averaging
+import conversions
+import csv_writer
+import instrumentation
+import ring_buffer
+import session_store
+
+logger = logging.getLogger(__name__)
 
 WAVELENGTH_AS7262 = [450, 500, 550, 570, 600, 650]
 WAVELENGTH_AS7263 = [610, 680, 730, 760, 810, 860]
@@ -19,6 +27,9 @@ WAVELENGTH_AS7265X = [410, 435, 460, 485, 510, 535,
                       565, 585, 610, 645, 680, 705,
                       730, 760, 810, 860, 900, 940]
 LED_CURRENT = {0: "12.5 mA", 1: "25 mA", 2: "50 mA", 3: "100 mA"}
+NORMALIZE_CYCLES = 250  # integration cycles the data is scaled to
+DATA_FOLDER = "Data"  # folder the csv files are saved in
+SAVE_SESSION_STORE = False  # also save the reads in a numpy session store, see session_store.py
 
 
 class AS7262():
@@ -31,9 +42,11 @@ class AS7262():
         self.device = arduino
         self.wavelengths = WAVELENGTH_AS7262
         self.data = SensorData(self)
-        today = date.today()
-        self.filename = "Data/{0}_{1}.csv".format(today, self.name)
+        self.filename = self.make_filename()
         self.led_options = ["No lights", "Light on", "Flash light"]
+        # keeps the leaf and read numbers, replaced by a sensor_display.TrackerFrame when
+        # the sensor is displayed
+        self.tracker = ReadTracker()
 
     def __str__(self):
         button_str = "Button not found"
@@ -42,79 +55,40 @@ class AS7262():
         string = f"{self.name} sensor| port {self.qwiic_port}"
         return string
 
-    def display(self, master):
-        pad_y = 5
-        sensor_frame = tk.Frame(master, relief=tk.RIDGE, bd=5)
-        text_str = self.__str__()
-        tk.Label(sensor_frame, text=text_str).pack(side=tk.TOP, pady=pad_y)
-        sensor_frame.pack(side=tk.LEFT, expand=2, fill=tk.BOTH, pady=pad_y)
-
-        ind_options = ["Indicator LED off", "Indicator LED on", "Flash Indicator LED"]
-
-        if self.has_button:
-            ind_options.extend(["Button LED off", "Button LED on", "Flash Button LED"])
-
-        self.ind_opt_var = tk.StringVar()  # TODO: can remove self ?
-        self.ind_opt_var.set(ind_options[0])
-
-        tk.OptionMenu(sensor_frame, self.ind_opt_var, *ind_options,
-                      command=self.indicator_options).pack(side=tk.TOP, pady=pad_y)
-
-        # LED display options
-        tk.Label(sensor_frame, text="Measurement\nLighting options:").pack(side=tk.TOP, pady=pad_y)
+    def make_filename(self, day=None):
+        """ Name of the csv file to save the reads of a day (default today) in """
+        return os.path.join(DATA_FOLDER, "{0}_{1}.csv".format(day or date.today(), self.name))
 
-
-        self.led_opt_var = tk.StringVar()  # TODO: can remove self ?
-        self.led_opt_var.set(self.led_options[2])
-
-        tk.OptionMenu(sensor_frame, self.led_opt_var, *self.led_options,
-                      command=self.set_led_option).pack(side=tk.TOP, pady=pad_y)
-
-        tk.Button(sensor_frame, text="Read Sensor", command=self.read_sensor).pack(side=tk.TOP, pady=pad_y)
-
-        self.tracker = TrackerFrame(self, sensor_frame)
-        tk.Label(sensor_frame, text=text_str).pack(side=tk.TOP)
-        self.tracker.pack(side=tk.TOP, pady=5)
-        ttk.Separator(sensor_frame, orient=tk.HORIZONTAL).pack(side=tk.TOP, fill=tk.X, pady=2)
-
-        self.display_flag = tk.BooleanVar()
-        self.display_checkbutton = tk.Checkbutton(sensor_frame, text="Display reflectance",
-                                                  onvalue=True, offvalue=False, variable=self.display_flag,
-                                                  command=self.set_reflectance, height=1)
-        self.display_checkbutton.deselect()
-        self.display_checkbutton.pack()
-        self.reference_button = tk.Button(sensor_frame, text="Read reference data",
-                                          command=self.get_reference_data)
-        self.reference_button.pack(pady=2, fill=tk.X)
-        return sensor_frame
+    def display(self, master):
+        """ Make the tkinter widgets to control the sensor in master, tkinter is only
+        imported here so the sensors can be used without it, see main_headless.py """
+        import sensor_display
+        return sensor_display.display(self, master)
 
     def read_sensor(self):
-        print(f"read sensor: {self.qwiic_port}")
+        logger.debug("read sensor: %s", self.qwiic_port)
         self.device.write(f"Read:{self.qwiic_port}")
 
     def get_reference_data(self):
-        print("get reference data")
+        logger.debug("get reference data")
 
 
     def set_reflectance(self, *args):
-        print(f"set reflectance {args}, {self.display_flag.get()}")
+        logger.debug("set reflectance %s, %s", args, self.display_flag.get())
 
     def set_led_option(self, command):
-        print(command, self.qwiic_port)
+        logger.debug("LED option %s on port %s", command, self.qwiic_port)
         if command == self.led_options[0]:  # Don't measure with the light
             self.device.write(f"Set flash bulb:{self.qwiic_port}, {0}")
         elif command == self.led_options[2]:  # Measure with flash
             self.device.write(f"Set flash bulb:{self.qwiic_port}, {7}")  # use 7 to turn on all 3 bulbs of AS7265X
 
     def increase_read_num(self):
-        print('check333')
         self.tracker.update_read(increase=True)
 
     def indicator_options(self, command):
-        print(command, self.qwiic_port)
-        print('foobar')
+        logger.debug("Indicator option %s on port %s", command, self.qwiic_port)
         msg = "{0}:{1}".format(command, self.qwiic_port).encode()
-        print(self.device)
 
         if "Flash" in command:
             # this is not pretty below
@@ -128,54 +102,35 @@ class AS7262():
         self.ind_opt_var.set("No Indicator")
 
 
-class TrackerFrame(tk.Frame):
-    def __init__(self, sensor, master):
-        tk.Frame.__init__(self, master)
-        print(type(master))
-        print(type(self))
+class ReadTracker:
+    """ Leaf and read numbers of a sensor that is not displayed """
+    def __init__(self):
         self.read_num = 1
-        self.leaf_num = tk.IntVar()
-        self.leaf_num.set(1)
-        self.read_label = tk.Label(self,
-                          text="Read: {0}".format(self.read_num))
-        self.read_label.pack(side=tk.TOP)
-        # tk.Label(self, text="hello").pack(side=tk.TOP)
-        leaf_num_frame = tk.Frame(self)
-        tk.Label(leaf_num_frame, text="Leaf number:").pack(side=tk.LEFT)
-        tk.Spinbox(leaf_num_frame, from_=0, textvariable=self.leaf_num,
-                   command=self.increase_leaf, width=2).pack(side=tk.LEFT)
-        leaf_num_frame.pack(side=tk.TOP)
+        self.leaf_num = 1
 
     def update_read(self, increase: bool):
-        print('update readpPp:', self.read_num)
         if increase:
             self.read_num += 1
         else:
             self.read_num = 1
-        self.read_label.config(text="Read: {0}".format(self.read_num))
-        print('update read', self.read_num)
-    #
+
     def increase_leaf(self):
         self.update_read(False)
-        self.leaf_num.set(self.leaf_num.get()+1)
+        self.leaf_num += 1
 
     def get_read_num(self):
         return self.read_num
 
     def get_leave_num(self):
-        return self.leaf_num.get()
+        return self.leaf_num
 
 
 class AS7263(AS7262):
     def __init__(self, *args):
         # AS7262.__init__(self, kw)
-        print('++++')
-        print(args)
         super(AS7263, self).__init__(*args)
         self.name = "AS7263"
-        today = date.today()
-        self.filename = "Data/{0}_{1}.csv".format(today, self.name)
-        print(self.filename)
+        self.filename = self.make_filename()
         self.wavelengths = WAVELENGTH_AS7263
         self.data = SensorData(self)
 
@@ -184,8 +139,7 @@ class AS7265x(AS7262):
     def __init__(self, *args):
         super(AS7265x, self).__init__(*args)
         self.name = "AS7265x"
-        today = date.today()
-        self.filename = "Data/{0}_{1}.csv".format(today, self.name)
+        self.filename = self.make_filename()
         self.wavelengths = WAVELENGTH_AS7265X
         self.data = SensorData(self)
 
@@ -201,34 +155,68 @@ class SensorData():
         self.norm_data = []
         self.data_string = ""
         self.LED = "White LED"
+        self.writer = None  # type: csv_writer.BufferedCSVWriter
+        self.session = None  # type: session_store.SessionStore
+        self.averager = None  # set with set_averaging to average the reads before saving
+        # normalized data of the latest reads, for time courses
+        self.history = ring_buffer.RingBuffer(ring_buffer.DEFAULT_CAPACITY, len(self.wavelengths))
+        self.received_time = None  # instrumentation.now() when the device sent the latest read
 
     def set_led_current(self, new_current):
+        if LED_CURRENT[new_current] != self.led_current:
+            self.reset_average()
         self.led_current = LED_CURRENT[new_current]
 
     def set_int_cylces(self, new_cycles):
+        if new_cycles != self.int_cycles:
+            self.reset_average()
         self.int_cycles = new_cycles
 
     def set_LED(self, led):
+        if led != self.LED:
+            self.reset_average()
         self.LED = led
 
-    def set_data(self, new_data):
+    def set_averaging(self, mode=None, number_reads=1):
+        """ Average the reads before they are saved and displayed
+        :param mode: one of averaging.AVERAGE_MODES or None to not average
+        :param number_reads: number of reads to average
+        """
+        self.averager = averaging.make_averager(mode, number_reads) if mode else None
+
+    def reset_average(self):
+        if self.averager:
+            self.averager.reset()
+
+    def set_data(self, new_data) -> bool:
+        """ Set the data of a new read
+        :return: False if the read was added to the average but the average is not ready yet """
+        if self.averager:
+            new_data = self.averager.add(new_data)
+            if new_data is None:
+                return False
         self.data = new_data
-        self.norm_data = [x*250/self.int_cycles for x in self.data]
+        self.norm_data = conversions.normalize_counts(self.data, self.int_cycles,
+                                                      NORMALIZE_CYCLES)
+        self.history.append(self.norm_data)
+        return True
+
+    def make_header(self):
+        header = 'Leaf number,Read number,gain,integration time,'
+        for wavelength in self.wavelengths:
+            header += "{0} nm,".format(wavelength)
+        header += "led,led current,saturation check,time"
+        return header
 
     def save_data(self):
-        if not os.path.isfile(self.sensor.filename):
-            print("makeing new file")
-            header = 'Leaf number,Read number,gain,integration time,'
-            for wavelength in self.wavelengths:
-                header += "{0} nm,".format(wavelength)
-            header += "led,led current,saturation check,time"
-            with open(self.sensor.filename, mode='a',
-                      encoding='utf-8') as _file:
-                _file.write(header + '\n')
-
-        print('filename: ', self.sensor.filename)
-        print('leave number: ', self.sensor.tracker.get_leave_num())
-        print('read number: ', self.sensor.tracker.get_read_num())
+        start = instrumentation.now()
+        if not self.writer:
+            self.writer = csv_writer.get_writer(self.sensor.filename,
+                                                self.make_header())
+        if SAVE_SESSION_STORE and not self.session:
+            self.session = session_store.SessionStore(
+                self.wavelengths, self.sensor.filename.replace(".csv", "_session"))
+
         data_str = "{0},{1},{2},{3},".format(self.sensor.tracker.get_leave_num(),
                                              self.sensor.tracker.get_read_num(),
                                              self.gain, self.int_cycles)
@@ -236,9 +224,12 @@ class SensorData():
             data_str += "{0:10.3f},".format(data)
         data_str += "{0},{1},{2}\n".format(self.LED, self.led_current,
                                                datetime.now().strftime("%H:%M:%S"))
-        print(data_str)
-        with open(self.sensor.filename, mode='a',
-                  encoding='utf-8') as _file:
-            print("writing to file: ", self.sensor.filename)
-            _file.write(data_str)
+        logger.debug("Saving to %s: %s", self.sensor.filename, data_str)
+        self.writer.write_row(data_str)
+        if self.session:
+            self.session.append(self.norm_data, self.sensor.tracker.get_leave_num(),
+                                self.sensor.tracker.get_read_num(), self.gain,
+                                self.int_cycles, self.LED, self.led_current)
         self.sensor.increase_read_num()
+        instrumentation.record("save", start)
+        instrumentation.record_latency("saved", self.received_time)
@@ -6,13 +6,24 @@ Class to interact with an arduino
 
 __author__ = "Kyle Vitatus Lopin"
 # installed libraries
+import binascii
+from collections import namedtuple
+import logging
 import queue
 import serial  # pyserial
 import serial.tools.list_ports
+import struct
 import threading
 import time
 # local files
 import AS726XX
+import event_pump
+import instrumentation
+import line_parser
+import port_discovery
+import transport
+
+logger = logging.getLogger(__name__)
 
 # USB-UART Constants
 DESCRIPTOR_NAME_WIN1 = "USB Serial Port"
@@ -29,6 +40,59 @@ DESCRIPTOR_NAMES = [DESCRIPTOR_NAME_WIN1, DESCRIPTOR_NAME_WIN2,
                     DESCRIPTOR_NAME_ARTEMIS, "USB-SERIAL"]
 
 ID_NAME = b"Naresuan Color Sensor Setup"
+READ_TIMEOUT = 0.2  # seconds the reader thread blocks on the port before checking if it should stop
+PROBE_TIMEOUT = 0.1  # seconds to wait for the start up lines of a port being checked
+ID_TIMEOUT = 1  # seconds to wait for the response to the ID command
+
+# Binary framing, the host asks for it with BINARY_MODE_COMMAND and firmware that
+# supports it answers with BINARY_MODE_ACK, else the text protocol is kept.
+# frame: sync (2 bytes) | payload length (uint8) | payload | CRC-16-CCITT of length and payload
+# payload: port (uint8) | integration cycles (uint16) | LED current (uint8) |
+#          number of channels (uint8) | channels (float32 each), all little endian
+# Off by default: the released firmware does not have the Binary command, and the frames
+# do not have the LED, so the reads saved from them have the LED of the last text read
+USE_BINARY_FRAMES = False
+BINARY_MODE_COMMAND = b"Binary"
+BINARY_MODE_ACK = b"Binary frames on"
+FRAME_SYNC = b"\xaa\x55"
+FRAME_HEADER = struct.Struct("<BHBB")
+FRAME_CRC = struct.Struct("<H")
+CRC_START = 0xFFFF
+FRAME_MAX_PAYLOAD = FRAME_HEADER.size + 4 * 18  # 18 channels of an AS7265x
+
+DataFrame = namedtuple("DataFrame", ["port", "int_cycles", "led_current", "data"])
+
+
+def encode_frame(port: int, int_cycles: int, led_current: int, data) -> bytes:
+    """ Pack a data read into a binary frame, the same way the firmware does """
+    payload = (FRAME_HEADER.pack(port, int_cycles, led_current, len(data)) +
+               struct.pack("<{0}f".format(len(data)), *data))
+    body = bytes([len(payload)]) + payload
+    return FRAME_SYNC + body + FRAME_CRC.pack(binascii.crc_hqx(body, CRC_START))
+
+
+def decode_frame(body: bytes):
+    """ Unpack the payload length, payload and CRC of a frame (everything after the sync
+    bytes) into a DataFrame, or return None if the frame is corrupted """
+    crc, = FRAME_CRC.unpack_from(body, len(body) - FRAME_CRC.size)
+    if binascii.crc_hqx(body[:-FRAME_CRC.size], CRC_START) != crc:
+        return None
+    port, int_cycles, led_current, num_channels = FRAME_HEADER.unpack_from(body, 1)
+    if body[0] != FRAME_HEADER.size + 4 * num_channels:
+        return None
+    data = struct.unpack_from("<{0}f".format(num_channels), body, 1 + FRAME_HEADER.size)
+    return DataFrame(port, int_cycles, led_current, list(data))
+
+
+# lines of a Data package from the color sensors
+DATA_PARSER = line_parser.LineParser([
+    ("port", rb"Reading port: (\d+)", (int,)),
+    ("int_time", rb"Integration time: (\d+)", (int,)),
+    ("led_current", rb"LED current: (\d+)", (int,)),
+    ("data", rb"Data: (.*)", (line_parser.float_array,)),
+    ("led", rb"LED: (.*)", (line_parser.text,)),
+    ("read_end", rb"OK Read|Saturated Read", ())])
+
 
 class Arduino_old:
     def __init__(self):
@@ -54,11 +118,11 @@ class Arduino_old:
                             input = device.readline()
                             # it should respond with correct ID but may take a few lines
                             if ID_NAME in input:
-                                print("Found device")
+                                logger.info("Found device")
                                 return device  # a device could connect without an error so return
 
                     except Exception as error:  # didn't work so try other ports
-                        print("Port access error: ", error)
+                        logger.warning("Port access error: %s", error)
 
     def read_all(self):
         try:
@@ -66,7 +130,7 @@ class Arduino_old:
             data_packets = data_packet.split(b'\r\n')
             return data_packets
         except:
-            print("Error Reading")
+            logger.error("Error Reading")
 
     def is_connected(self):
         return self.device
@@ -77,10 +141,9 @@ class Arduino_old:
 
     def read_data(self, type):
         data = b""
-        print('====================START')
         while b"DONE" not in data:
             data = self.device.readline()
-            print('data: ', data)
+            logger.debug("data: %s", data)
             if b"Data:" in data:
                 data_pkt = AS726XRead(type, self.sort_index)
                 cal_data = data.split(b':')[1].split(b',')
@@ -92,14 +155,12 @@ class Arduino_old:
                 gain = int(gain_data_pre[1].split(b'|')[0])
                 int_time = int(gain_data_pre[2].split(b'\r')[0])
                 data_pkt.add_gain_n_integration(gain, int_time)
-        print('====================END')
         return data_pkt
 
     def write(self, message):
-        print('=======-----')
         if type(message) is str:
             message = message.encode()
-        print('writing message: ', message)
+        logger.debug("writing message: %s", message)
         self.device.write(message)
 
     def read_package(self, command):
@@ -115,43 +176,55 @@ class Arduino_old:
 
 
 class Arduino(threading.Thread):
-    def __init__(self):
+    def __init__(self, device=None):
+        """ :param device: open port or transport.ReplaySerial to use, if None the
+        device is looked for when the thread is started """
         threading.Thread.__init__(self)
         self.initial_lines = []
-        self.device = self.auto_find_com_port()
+        self.device = device
         self.running = False
         self.output = queue.Queue()
         self.command = None
         self.package = []
+        self.read_buffer = b""
+        self.binary_mode = False
+        self.write_lock = threading.Lock()
+        self.received_time = None  # instrumentation.now() when the bytes being parsed arrived
 
     def auto_find_com_port(self):
-        available_ports = serial.tools.list_ports
-        for port in available_ports.comports():  # type: serial.Serial
-            print(port.device)
-            print(port.name)
-            print('desc:', port.description)
-            print(DESCRIPTOR_NAMES)
-            # for name in DESCRIPTOR_NAMES:
-            #     print('name: {0}|{1}'.format(name, port.description))
-            if self.possibly_arduino(port):
-                print('----')
-                try:
-                    device = serial.Serial(port.device, baudrate=BAUD_RATE,
-                                           timeout=1)
-                    # device.readline()  # clear anything it may respond with first
-                    print('---2')
-                    self.initial_lines = self.process_initial_serial(device)
-                    device.write(b"Id")
-                    for i in range(10):
-                        input = device.readline()
-                        # it should respond with correct ID but may take a few lines
-                        print("Got input: ", input)
-                        if ID_NAME in input:
-                            print("Found device")
-                            return device  # a device could connect without an error so return
-
-                except Exception as error:  # didn't work so try other ports
-                    print("Port access error: ", error)
+        """ Check all the ports that could be an arduino at the same time, the first
+        one to respond with the ID_NAME is used """
+        ports = port_discovery.list_ports(self.possibly_arduino)
+        logger.info("Possible arduino ports: %s", ports)
+        result = port_discovery.find_device(ID_NAME, self.probe_port, ports,
+                                            release=lambda _result: _result[0].close())
+        if not result:
+            return None
+        device, self.initial_lines = result
+        return device
+
+    def probe_port(self, port_name: str):
+        """ Open a port and check if an arduino with the color sensor firmware is attached
+        :return: (device, the lines it sent when opened) if it is, else None """
+        try:
+            device = serial.Serial(port_name, baudrate=BAUD_RATE, timeout=PROBE_TIMEOUT)
+            # device.readline()  # clear anything it may respond with first
+            initial_lines = self.process_initial_serial(device)
+            device.timeout = ID_TIMEOUT
+            device.write(b"Id")
+            for i in range(10):
+                input = device.readline()
+                # it should respond with correct ID but may take a few lines
+                logger.debug("Got input: %s", input)
+                if not input:  # timed out so it is not the right device
+                    break
+                if ID_NAME in input:
+                    logger.info("Found device on: %s", port_name)
+                    return device, initial_lines
+            device.close()
+        except Exception as error:  # didn't work so try other ports
+            logger.warning("Port access error: %s", error)
+        return None
 
     @staticmethod
     def possibly_arduino(_port: serial.Serial):
@@ -172,44 +245,130 @@ class Arduino(threading.Thread):
         initial_lines = []
         while True:
             line = _device.readline()
-            print(line)
+            logger.debug("Initial line: %s", line)
             initial_lines.append(line)
             if not line:
                 break
         return initial_lines
 
+    def connect(self):
+        """ Look for the device, called by the thread so the program does not have to wait """
+        self.device = transport.wrap(self.auto_find_com_port(), "Arduino")
+        return self.device
+
+    def on_connect(self):
+        """ Place holder, this should be overwritten in implementation """
+        pass
+
+    def on_no_device(self):
+        """ Place holder, this should be overwritten in implementation """
+        logger.warning("No device found")
+
+    def on_disconnect(self):
+        """ Place holder, this should be overwritten in implementation """
+        logger.warning("Device disconnected")
+
     def run(self):
         self.running = True
-        if not self.device:  # not device so return
+        if not self.device and not self.connect():  # not device so return
+            self.running = False
+            self.on_no_device()
             return None
+        self.on_connect()
+        # block on the port instead of sleep polling it, the timeout only sets how
+        # often the running flag is checked when the device is quiet
+        self.device.timeout = READ_TIMEOUT
         while self.running:
-            # print('run loop')
             try:
-                time.sleep(.05)  # ease the load on the computer
-                if not self.output.empty():
-                    self.device.write(self.output.get())
-                if self.device.in_waiting:
-                    # everything could be \r\n terminated
-                    data_line = self.device.readline().strip(b'\r\n')
-                    print('run:', data_line)
+                self.send_output()
+                # wait for at least 1 byte, then take everything that has arrived
+                new_bytes = self.device.read(max(1, self.device.in_waiting))
+                if not new_bytes:
+                    continue
+                self.received_time = instrumentation.now()
+                packets = self.split_packets(new_bytes)
+                instrumentation.record("split", self.received_time)
+                for data_line in packets:
+                    if type(data_line) is DataFrame:
+                        self.parse_frame(data_line)
+                        continue
+                    logger.debug("run: %s", data_line)
                     self.parse_input(data_line)
                     # self.parse_package(data_line)
-            except:
-                pass  # TODO: try to reconnect
+            except (serial.SerialException, OSError) as error:
+                # the port is gone (e.g. the cable was unplugged), stop instead of
+                # retrying a port that will keep failing
+                logger.error("Device read error, stopping: %s", error)
+                self.running = False
+                self.on_disconnect()  # TODO: try to reconnect
+            except Exception:
+                # a bad package should not stop the reads, drop what was buffered and go on
+                logger.exception("Error handling the device data")
+                self.read_buffer = b""
+                time.sleep(READ_TIMEOUT)
+
+    def split_packets(self, new_bytes: bytes):
+        """ Add the new bytes to the read buffer and return every complete line and,
+        if binary mode was negotiated, every complete DataFrame in it.  Anything partial
+        is kept in the buffer till the rest of it arrives """
+        self.read_buffer += new_bytes
+        packets = []
+        while True:
+            newline = self.read_buffer.find(b'\n')
+            sync = self.read_buffer.find(FRAME_SYNC) if self.binary_mode else -1
+            if sync != -1 and (newline == -1 or sync < newline):
+                length_index = sync + len(FRAME_SYNC)
+                if len(self.read_buffer) <= length_index:
+                    break
+                payload_length = self.read_buffer[length_index]
+                end = length_index + 1 + payload_length + FRAME_CRC.size
+                frame = None
+                if payload_length <= FRAME_MAX_PAYLOAD:
+                    if len(self.read_buffer) < end:
+                        break
+                    frame = decode_frame(self.read_buffer[length_index:end])
+                if frame:
+                    packets.append(frame)
+                    self.read_buffer = self.read_buffer[end:]
+                else:  # bad frame, skip the sync bytes and look for the next one
+                    logger.warning("Corrupted data frame")
+                    self.read_buffer = self.read_buffer[length_index:]
+            elif newline != -1:
+                # everything could be \r\n terminated
+                line = self.read_buffer[:newline].strip(b'\r')
+                packets.append(line)
+                self.read_buffer = self.read_buffer[newline+1:]
+                if BINARY_MODE_ACK in line:
+                    # frames can come right after the ack in the same read
+                    self.binary_mode = True
+            else:
+                break
+        return packets
+
+    def send_output(self):
+        """ Write all the messages waiting in the output queue to the device.  The lock
+        lets both the reader thread and the thread calling write send the messages """
+        with self.write_lock:
+            while not self.output.empty():
+                self.device.write(self.output.get())
 
     def parse_input(self, dataline):
         """ Place holder, this should be overwritten in implementation """
+        if BINARY_MODE_ACK in dataline:
+            logger.info("Using binary data frames")
+            self.binary_mode = True
+            return
         # a command has already been received so collect the data
         if b"End" in dataline:
             end_command = dataline.split(b' ')[1].split(b'\r\n')[0]
-            print('end command: ', end_command, self.command)
+            logger.debug("end command: %s %s", end_command, self.command)
             if end_command == self.command:
                 # correct information
                 self.parse_package(end_command, self.package)
                 self.command = None
                 self.package = []
             else:
-                print("Error, ended the wrong command ", end_command, self.command)
+                logger.error("Ended the wrong command %s, expected %s", end_command, self.command)
 
         elif self.command:
             # print('have command: ', self.command)
@@ -217,67 +376,89 @@ class Arduino(threading.Thread):
 
         elif b"Starting" in dataline:
             self.command = dataline.split(b' ')[1].split(b'\r\n')[0]
-            print('Got command: ', self.command)
+            logger.debug("Got command: %s", self.command)
+
+    def parse_frame(self, frame: DataFrame):
+        """ Place holder, this should be overwritten in implementation """
+        logger.debug("Got data frame: %s", frame)
+
+    def request_binary_mode(self):
+        """ Ask the device to send data reads as binary frames, if the firmware
+        does not answer with BINARY_MODE_ACK the text protocol is used """
+        self.write(BINARY_MODE_COMMAND)
 
     def write(self, message):
         if type(message) is str:
             message = message.encode()
         self.output.put(message)
+        if self.running and self.device:
+            # send it now instead of waiting for the reader thread to wake up
+            try:
+                self.send_output()
+            except serial.SerialException as error:
+                logger.error("Write error: %s", error)  # TODO: try to reconnect
 
 
 class ArduinoColorSensors(Arduino):
-    def __init__(self, master):
-        print('check')
-        Arduino.__init__(self)
-        print("back")
+    def __init__(self, master, device=None, binary_frames=None):
+        """ :param binary_frames: ask the device for binary data frames, the default
+        is USE_BINARY_FRAMES """
+        Arduino.__init__(self, device)
+        self.use_binary_frames = USE_BINARY_FRAMES if binary_frames is None else binary_frames
         self.starting_up = True
         self.master = master
-        self.graph_event = threading.Event()
-        self.graph_queue = queue.Queue()
+        # items for the graph, [sensor] to show new data, [sensor, "Clear"] to clear the
+        # graph, or [None, "Setup"] / [None, "No device"] when the start up is finished
+        self.graph_queue = event_pump.EventPump()
         self.sensors = []
         self.has_mux = False
         self.port_list = dict()
-        if not self.device:
-            print("back3", self.device)
-            return
-        print("back2")
-        self.write(b"Setup")
-        print("Making startup")
-        if self.initial_lines:
-            for line in self.initial_lines:
-                print(line)
-            self.parse_package(b'Setup', self.initial_lines)
         self.sensor = None  # place holder for a single sensor in the self.sensors list
         self.new_data = False
+        # find the device and set it up on the thread so the GUI does not have to wait
         self.start()
 
+    def on_connect(self):
+        self.write(b"Setup")
+        logger.info("Making startup")
+        if self.initial_lines:
+            self.parse_package(b'Setup', self.initial_lines)
+
+    def on_no_device(self):
+        logger.warning("No device found")
+        self.starting_up = False
+        self.graph_queue.put([None, "No device"])
+
+    def on_disconnect(self):
+        logger.warning("Device disconnected")
+        self.graph_queue.put([None, "No device"])
+
     def parse_package(self, command, package):
-        print("parse: ", command)
-        print(package)
+        start = instrumentation.now()
+        self._parse_package(command, package)
+        instrumentation.record("package", start)
+
+    def _parse_package(self, command, package):
+        logger.debug("parse: %s %s", command, package)
         if command == b'Setup':
-            print("Setting up1")
             self.setup(package)
         elif command == b"Data":
             if self.new_data:
                 self.graph_queue.put([self.sensor, "Clear"])
-                self.graph_event.set()
                 self.new_data = False
-            print(self.sensors)
-            print(self.port_list)
             self.data_read(package)
 
         elif command == b"Inc":
-            print("inc read")
+            logger.debug("inc read")
             self.sensor.increase_read_num()
             self.new_data = True
 
         else:
-            print('===== NOT RECOGNIZED COMMAND ======')
+            logger.warning("Command not recognized: %s", command)
 
     def setup(self, packet):
-        print("Setting up2")
         for line in packet:
-            print(line)
+            logger.debug("Setup line: %s", line)
             has_button = True
             if b"No button attached" in line:
                 has_button = False
@@ -286,6 +467,8 @@ class ArduinoColorSensors(Arduino):
             port = None
             if b"to port:" in line:
                 port = int(line.split(b":")[1].split(b'|')[0])
+            if port in self.port_list:  # the setup can be sent more than once
+                continue
             if b"AS7262 device attached" in line:
                 self.sensors.append(AS726XX.AS7262(self, has_button, port))
                 self.port_list[port] = self.sensors[-1]
@@ -295,70 +478,70 @@ class ArduinoColorSensors(Arduino):
             elif b"AS7265x device attached" in line:
                 self.sensors.append(AS726XX.AS7265x(self, has_button, port))
                 self.port_list[port] = self.sensors[-1]
-        for sensor in self.sensors:
-            print(sensor)
-        print(self.port_list)
+        logger.info("Sensors found: %s", [str(sensor) for sensor in self.sensors])
+        if self.use_binary_frames:
+            self.request_binary_mode()
         self.starting_up = False
-        print("end setup")
+        self.graph_queue.put([None, "Setup"])
 
     def data_read(self, package):
-        sensor = None  # set scope
         for line in package:
-            print('data line: ', line)
-            if b"Reading port" in line:
-                port_number = int(line.split(b': ')[1])
-                print('port number: ', port_number)
-                print(self.port_list[port_number])
-                self.sensor = self.port_list[port_number]  # type: AS726XX.AS7262
-            elif b"Integration time" in line:
-                integration_time = int(line.split(b": ")[1])
-                print('integration time: ', integration_time)
-                self.sensor.data.set_int_cylces(integration_time)
-            elif b"LED current" in line:
-                led_current = int(line.split(b": ")[1])
-                print('led current: ', led_current)
-                self.sensor.data.set_led_current(led_current)
-            elif b"Data:" in line:
-                data = line.split(b': ')[1].split(b',')
-                data = [float(x) for x in data]
-                print(data)
-                print(type(self.sensor.data))
-                self.sensor.data.set_data(data)
-                # save data and update graph
-                self.sensor.data.save_data()
-                self.graph_queue.put([self.sensor])
-                self.graph_event.set()
-            elif b"LED:" in line:
-                led = line.split(b": ")[1]
-                print('led: ', led)
-                self.sensor.data.set_LED(led)
-
-            elif b'OK Read' in line or b"Saturated Read" in line:
-                saturation = line
-                # last line to recieve so save the data and update graph
-                # depricated
-
-        # print('check222')
-        # sensor.increase_read_num()
+            kind, values = DATA_PARSER.parse(line)
+            if kind == "port":
+                self.sensor = self.port_list[values[0]]  # type: AS726XX.AS7262
+            elif kind == "int_time":
+                self.sensor.data.set_int_cylces(values[0])
+            elif kind == "led_current":
+                self.sensor.data.set_led_current(values[0])
+            elif kind == "data":
+                self.store_data(values[0])
+            elif kind == "led":
+                self.sensor.data.set_LED(values[0])
+            # "OK Read" or "Saturated Read" is the last line, the data is already saved
+
+    def parse_frame(self, frame: DataFrame):
+        """ A binary frame has the same information as the text lines of a Data package """
+        if self.new_data:
+            self.graph_queue.put([self.sensor, "Clear"])
+            self.new_data = False
+        if frame.port not in self.port_list:
+            logger.warning("Data frame from unknown port: %s", frame.port)
+            return
+        self.sensor = self.port_list[frame.port]
+        self.sensor.data.set_int_cylces(frame.int_cycles)
+        self.sensor.data.set_led_current(frame.led_current)
+        self.store_data(frame.data)
+
+    def store_data(self, data):
+        instrumentation.record_latency("parsed", self.received_time)
+        self.sensor.data.received_time = self.received_time
+        if not self.sensor.data.set_data(data):
+            return  # waiting for more reads to average
+        # save data and update graph
+        self.sensor.data.save_data()
+        self.graph_queue.put([self.sensor])
 
     def indicator_options(self, **kwargs):
-        print(kwargs)
-        print("Arudion color sensor set indicator options")
+        logger.debug("Arduino color sensor set indicator options: %s", kwargs)
 
     def set_led_option(self, **kwargs):
-        print(kwargs)
-        print("Arudion color sensor set led options")
+        logger.debug("Arduino color sensor set led options: %s", kwargs)
 
     def run_command(self, command):
         self.current_command = command
         self.write('Start: {0}'.format(command))
 
     def read_sensor(self):
-        print("read sensor")
+        logger.debug("read sensor")
 
 
 class ArduinoMock():
     def __init__(self, master):
+        self.master = master
         self.sensors = [AS726XX.AS7262(self, True, 2),
                         AS726XX.AS7265x(self, True, 3)]
-        self.graph_event = threading.Event()
+        self.port_list = {sensor.qwiic_port: sensor for sensor in self.sensors}
+        self.graph_queue = event_pump.EventPump()
+
+    def write(self, message):
+        logger.debug("Mock write: %s", message)
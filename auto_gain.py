@@ -0,0 +1,95 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Check the sensor counts for saturation and pick the gain and integration time that
+put the brightest channel near a target count.  The counts scale with
+gain x integration time, so the next settings are calculated directly from 1 read
+instead of stepping through the gains.  If the read was saturated the true counts
+are not known, so a second read is made with the least exposure the sensor can use
+and the settings are calculated from that, so at most 2 reads are needed.
+
+All the functions work on numpy arrays, the last axis is the channels so the counts
+of several sensors (sensors x channels) can be checked at once.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# installed libraries
+import numpy as np
+
+GAINS = [1, 3.7, 16, 64]  # AS726X gain settings, the index is the setting sent to the sensor
+FULL_SCALE_COUNTS = 65535  # 16 bit adc
+SATURATION_COUNTS = 65000
+TARGET_COUNTS = 0.5 * FULL_SCALE_COUNTS  # where to put the brightest channel
+
+
+def is_saturated(counts, threshold=SATURATION_COUNTS):
+    """ Check if any channel of a read is saturated
+    :param counts: channels, or reads x channels array
+    :return: bool, or array with 1 bool per read
+    """
+    return np.asarray(counts).max(axis=-1) > threshold
+
+
+def next_settings(counts, gain, int_time, gains=GAINS, int_time_range=None,
+                  target=TARGET_COUNTS):
+    """ Calculate the gain and integration time that puts the brightest channel at
+    the target.  The integration time is kept if a gain can get close to the target,
+    else the integration time is changed to make up the difference.
+
+    :param counts: channels, or reads x channels array read with gain and int_time
+    :param gain: gain the counts were read with, or 1 per read
+    :param int_time: integration time the counts were read with, or 1 per read
+    :param gains: the gains the sensor can use
+    :param int_time_range: (shortest, longest) integration time allowed, default is to
+    only change the gain
+    :param target: counts to put the brightest channel at
+    :return: (gain, integration time), arrays if counts had more than 1 read
+    """
+    counts = np.asarray(counts, dtype=float)
+    gain = np.asarray(gain, dtype=float)
+    int_time = np.asarray(int_time, dtype=float)
+    gains = np.asarray(gains, dtype=float)
+    if int_time_range is None:
+        int_time_range = (int_time, int_time)
+    peak = counts.max(axis=-1)
+    exposure = gain * int_time
+
+    # exposure (gain x integration time) that puts the brightest channel at the target
+    with np.errstate(divide='ignore'):
+        wanted_exposure = np.where(peak > 0, exposure * target / peak, np.inf)
+    # saturated counts are lower than the real light level, so use the least exposure possible
+    wanted_exposure = np.where(peak > SATURATION_COUNTS,
+                               gains[0] * np.asarray(int_time_range[0], dtype=float),
+                               wanted_exposure)
+
+    # largest gain that does not go over the target at the current integration time
+    gain_index = np.searchsorted(gains, wanted_exposure / int_time, side='right') - 1
+    new_gain = gains[np.clip(gain_index, 0, len(gains) - 1)]
+    new_int_time = np.clip(wanted_exposure / new_gain, *int_time_range)
+    if new_gain.ndim == 0:
+        return float(new_gain), float(new_int_time)
+    return new_gain, new_int_time
+
+
+def auto_expose(read, apply, gain, int_time, gains=GAINS, int_time_range=None,
+                target=TARGET_COUNTS):
+    """ Set the gain and integration time of a sensor with at most 2 reads
+
+    :param read: function that reads the sensor and returns the counts
+    :param apply: function that takes (gain, integration time) and sets the sensor to them
+    :param gain: current gain of the sensor
+    :param int_time: current integration time of the sensor
+    :return: (gain, integration time) the sensor was set to
+    """
+    for _ in range(2):
+        counts = read()
+        if counts is None:
+            break
+        saturated = is_saturated(counts)
+        gain, int_time = next_settings(counts, gain, int_time, gains=gains,
+                                       int_time_range=int_time_range, target=target)
+        apply(gain, int_time)
+        if not np.any(saturated):
+            break
+    return gain, int_time
@@ -0,0 +1,103 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Average the reads of a sensor before they are displayed and saved.  Each averager
+is given the reads one at a time with add(), which returns the averaged read when
+one is ready or None if more reads are needed.  The averages are updated as the
+reads come in, only the median has to hold on to (the last N) reads.
+
+    averager = make_averager("Mean", 5)
+    for read in reads:
+        averaged_read = averager.add(read)  # an average of 5 reads every 5th read
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# installed libraries
+import numpy as np
+
+MEAN = "Mean"
+RUNNING_AVERAGE = "Running average"
+MEDIAN = "Median"
+AVERAGE_MODES = [MEAN, RUNNING_AVERAGE, MEDIAN]
+AVERAGE_NUMBERS = [1, 2, 3, 5, 10, 20]  # number of reads options to show the user
+
+
+class MeanAverager:
+    """ Mean of each block of n reads, only the sum of the reads is kept """
+    def __init__(self, n: int):
+        self.n = max(1, int(n))
+        self.total = None
+        self.count = 0
+
+    def add(self, read):
+        read = np.asarray(read, dtype=float)
+        if self.total is None:
+            self.total = np.zeros_like(read)
+        self.total += read
+        self.count += 1
+        if self.count < self.n:
+            return None
+        average = self.total / self.count
+        self.reset()
+        return average
+
+    def reset(self):
+        self.total = None
+        self.count = 0
+
+
+class ExponentialAverager:
+    """ Running exponential average, an average is returned for every read.  The weight
+    of each new read is 2 / (n + 1), so it is about as smooth as an n read mean """
+    def __init__(self, n: int):
+        self.n = max(1, int(n))
+        self.alpha = 2. / (self.n + 1)
+        self.average = None
+
+    def add(self, read):
+        read = np.asarray(read, dtype=float)
+        if self.average is None:
+            self.average = read.copy()
+        else:
+            self.average += self.alpha * (read - self.average)
+        return self.average.copy()
+
+    def reset(self):
+        self.average = None
+
+
+class MedianAverager:
+    """ Median of each block of n reads, to reject single bad reads """
+    def __init__(self, n: int):
+        self.n = max(1, int(n))
+        self.reads = None  # preallocated n x channels block
+        self.count = 0
+
+    def add(self, read):
+        read = np.asarray(read, dtype=float)
+        if self.reads is None:
+            self.reads = np.zeros((self.n, read.size))
+        self.reads[self.count] = read
+        self.count += 1
+        if self.count < self.n:
+            return None
+        self.count = 0
+        return np.median(self.reads, axis=0)
+
+    def reset(self):
+        self.count = 0
+
+
+AVERAGERS = {MEAN: MeanAverager, RUNNING_AVERAGE: ExponentialAverager,
+             MEDIAN: MedianAverager}
+
+
+def make_averager(mode: str, n: int):
+    """ Make an averager
+    :param mode: one of AVERAGE_MODES
+    :param n: number of reads to average
+    """
+    if mode not in AVERAGERS:
+        raise ValueError("Average mode has to be one of {0}".format(AVERAGE_MODES))
+    return AVERAGERS[mode](n)
@@ -0,0 +1,78 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time the conversion of counts to power and umol levels in data_class.SpectrometerData,
+for 1 read at a time (update_data, what the GUI does for each read) and for a block
+of reads converted at once with conversions.SpectralConverter.
+
+Run from the top folder:
+    python benchmarks/bench_conversions.py
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import os
+import sys
+import timeit
+# installed libraries
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# local files
+import data_class
+import device_settings
+
+REPEATS = 20000
+BLOCK_READS = 1000  # reads converted at once in the block benchmark
+
+
+class Variable:
+    """ Holds a value like the tkinter variables of the settings, without needing a display """
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class BenchSettings:
+    """ The parts of device_settings.AS726X_Settings that SpectrometerData uses """
+    def __init__(self, wavelengths=device_settings.WAVELENGTH_AS7262,
+                 measurement_mode=device_settings.DisplayTypes.power.value):
+        self.wavelengths = wavelengths
+        self.gain_var = Variable("16")
+        self.integration_time_var = Variable("100")
+        self.measurement_mode_var = Variable(measurement_mode)
+
+
+def run(repeats=REPEATS) -> dict:
+    """ :return: dict of reads / s for each way of converting """
+    settings = BenchSettings()
+    data = data_class.SpectrometerData(settings)
+    rng = np.random.default_rng(0)
+    reads = rng.uniform(0, 65000, (repeats, len(settings.wavelengths)))
+    read_lists = reads.tolist()  # the devices give lists of floats
+    block = reads[:BLOCK_READS]
+
+    def update_data():
+        for read in read_lists:
+            data.update_data(read)
+
+    def convert_block():
+        data.converter.to_power(block)
+        data.converter.to_umol(block)
+
+    results = dict()
+    seconds = min(timeit.repeat(update_data, number=1, repeat=3))
+    results["SpectrometerData.update_data"] = {"reads / s": repeats / seconds}
+    number = max(1, repeats // BLOCK_READS)
+    seconds = min(timeit.repeat(convert_block, number=number, repeat=3))
+    results["SpectralConverter block of {0}".format(BLOCK_READS)] = {
+        "reads / s": number * BLOCK_READS / seconds}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{0}: {1:.0f} reads / s".format(name, result["reads / s"]))
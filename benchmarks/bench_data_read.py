@@ -0,0 +1,99 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time how fast ArduinoColorSensors turns the text the color sensors send into reads:
+splitting the bytes into lines and collecting the packages (split_packets and
+parse_input), and parsing the lines of a Data package (data_read).  The reads are
+not saved, bench_save.py times that.
+
+Run from the top folder:
+    python benchmarks/bench_data_read.py
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# local files
+import arduino
+import AS726XX
+import event_pump
+from bench_line_parser import TRANSCRIPT_FOLDER
+
+TRANSCRIPT = "color_sensors_data.txt"
+REPEATS = 500
+SENSOR_CLASSES = {6: AS726XX.AS7262, 18: AS726XX.AS7265x}  # number of channels: sensor
+
+
+def load_packages(filename=TRANSCRIPT):
+    """ Split a transcript into the lines of each Data package """
+    with open(os.path.join(TRANSCRIPT_FOLDER, filename), 'rb') as _file:
+        text = _file.read()
+    packages = []
+    for line in text.split(b'\n'):
+        line = line.strip(b'\r')
+        if line == b"Starting Data":
+            packages.append([])
+        elif line != b"End Data" and packages:
+            packages[-1].append(line)
+    return text, packages
+
+
+def make_device(packages):
+    """ Make an ArduinoColorSensors that is not connected to anything, with a sensor
+    for each port in the packages """
+    device = arduino.ArduinoColorSensors.__new__(arduino.ArduinoColorSensors)
+    arduino.Arduino.__init__(device, device=None)  # the thread is never started
+    device.graph_queue = event_pump.EventPump()
+    device.sensors = []
+    device.port_list = dict()
+    device.sensor = None
+    device.new_data = False
+    device.starting_up = False
+    port = None
+    for line in [line for package in packages for line in package]:
+        kind, values = arduino.DATA_PARSER.parse(line)
+        if kind == "port":
+            port = values[0]
+        elif kind == "data" and port not in device.port_list:
+            sensor = SENSOR_CLASSES[len(values[0])](device, True, port)
+            device.sensors.append(sensor)
+            device.port_list[port] = sensor
+    # only keep the read, saving is timed on its own
+    device.store_data = lambda data: device.sensor.data.set_data(data)
+    return device
+
+
+def run(repeats=REPEATS) -> dict:
+    """ :return: dict of lines / s and reads / s for the parts of the text path """
+    text, packages = load_packages()
+    device = make_device(packages)
+    num_lines = sum(len(package) for package in packages)
+    num_reads = sum(line.startswith(b"Data:") for package in packages for line in package)
+
+    def data_read():
+        for package in packages:
+            device.data_read(package)
+
+    def split_and_parse():
+        for line in device.split_packets(text):
+            device.parse_input(line)
+
+    results = dict()
+    for name, func, lines in (("data_read", data_read, num_lines),
+                              ("split_packets + parse_input", split_and_parse,
+                               len(text.split(b'\n')))):
+        seconds = min(timeit.repeat(func, number=repeats, repeat=3))
+        results[name] = {"lines / s": lines * repeats / seconds,
+                         "reads / s": num_reads * repeats / seconds}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{0}: {1:.0f} lines / s, {2:.0f} reads / s".format(
+            name, result["lines / s"], result["reads / s"]))
@@ -0,0 +1,104 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time the table driven line parser against the substring search and split parsing
+it replaced, on the transcripts of device output in benchmarks/transcripts.
+
+Run from the top folder:
+    python benchmarks/bench_line_parser.py
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# local files
+import arduino
+import serial_comm
+
+TRANSCRIPT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+REPEATS = 2000
+
+
+def load_transcript(filename: str) -> list:
+    with open(os.path.join(TRANSCRIPT_FOLDER, filename), 'rb') as _file:
+        return _file.read().split(b'\n')
+
+
+def old_wipy_parse(lines, sensor_tag=b"AS7262"):
+    for dataline in lines:
+        if (b'%s START READ' % sensor_tag) in dataline:
+            pass
+        elif (b'%s RAW DATA:' % sensor_tag) in dataline:
+            data_str = dataline.split(b'[')[1].split(b']')[0]
+            [float(x) for x in data_str.split(b',')]
+        elif (b'%s CAL DATA:' % sensor_tag) in dataline:
+            data_str = dataline.split(b'[')[1].split(b']')[0]
+            [float(x) for x in data_str.split(b',')]
+        elif b'integration cycles:' in dataline:
+            num_str = dataline.split(b'|')
+            int(num_str[1]), float(num_str[3])
+        elif b'END READ' in dataline:
+            pass
+
+
+def old_arduino_serial_parse(lines):
+    for data in lines:
+        if b"Data:" in data:
+            [float(x) for x in data.split(b':')[1].split(b',')]
+        elif b"Gain:" in data:
+            gain_data_pre = data.split(b':')
+            int(gain_data_pre[1].split(b'|')[0])
+            int(gain_data_pre[2].split(b'\r')[0])
+
+
+def old_color_sensor_parse(lines):
+    for line in lines:
+        if b"Reading port" in line:
+            int(line.split(b': ')[1])
+        elif b"Integration time" in line:
+            int(line.split(b": ")[1])
+        elif b"LED current" in line:
+            int(line.split(b": ")[1])
+        elif b"Data:" in line:
+            [float(x) for x in line.split(b': ')[1].split(b',')]
+        elif b"LED:" in line:
+            line.split(b": ")[1]
+
+
+def new_parse(parser):
+    def parse(lines):
+        for line in lines:
+            parser.parse(line)
+    return parse
+
+
+BENCHMARKS = [("WiPy AS7262 sweep", "wipy_as7262_sweep.txt", old_wipy_parse,
+               new_parse(serial_comm.WIPY_READ_PARSER)),
+              ("Arduino serial AS7265x", "arduino_serial_as7265x.txt", old_arduino_serial_parse,
+               new_parse(serial_comm.ARDUINO_READ_PARSER)),
+              ("Color sensor data packages", "color_sensors_data.txt", old_color_sensor_parse,
+               new_parse(arduino.DATA_PARSER))]
+
+
+def run(repeats=REPEATS) -> dict:
+    """ Time each parser on each transcript
+    :return: dict of transcript name to microseconds per line for the old and new parsers """
+    results = dict()
+    for name, filename, old_parser, new_parser in BENCHMARKS:
+        lines = load_transcript(filename)
+        results[name] = {"lines": len(lines)}
+        for label, parser in (("old", old_parser), ("new", new_parser)):
+            seconds = min(timeit.repeat(lambda: parser(lines), number=repeats, repeat=3))
+            results[name][label] = 1e6 * seconds / (repeats * len(lines))
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{0}: {1} lines, old {2:.2f} us / line, new {3:.2f} us / line".format(
+            name, result["lines"], result["old"], result["new"]))
@@ -0,0 +1,85 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time how many frames a second pyplot_embed.SpectroPlotterBasic can draw, with the
+Agg backend so no display is needed.  The graph is made without its tkinter frame
+and drawn on a FigureCanvasAgg.  Each frame every line is given new data with
+update_data and then the frame is rendered, like the tkinter main loop would do, but
+without waiting for the MAX_FPS frame rate, so this is the most frames the graph can draw.
+
+Frames where only the lines change are blitted, frames where the y scale changes
+are a full redraw, both are timed.
+
+Run from the top folder:
+    python benchmarks/bench_plot.py
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import os
+import sys
+import time
+# installed libraries
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# local files
+import AS726XX
+import pyplot_embed
+
+FRAMES = 200
+LINE_COUNTS = (1, 8)  # number of sensors shown on the graph
+
+
+def make_plotter():
+    """ Make a SpectroPlotterBasic on an Agg canvas, with no tkinter frame """
+    plotter = pyplot_embed.SpectroPlotterBasic.__new__(pyplot_embed.SpectroPlotterBasic)
+    plotter.init_throttle()
+    figure = Figure(figsize=(5, 4))
+    plotter.init_figure(figure, FigureCanvasAgg(figure))
+    # there is no tkinter main loop to schedule the render, it is called by the benchmark
+    plotter.after = lambda delay, func: "render job"
+    return plotter
+
+
+def time_frames(num_lines: int, frames: int, rescale: bool) -> float:
+    """ Draw frames updates of num_lines lines
+    :param rescale: change the y scale every frame so each frame is a full redraw
+    :return: frames a second """
+    plotter = make_plotter()
+    wavelengths = AS726XX.WAVELENGTH_AS7262
+    rng = np.random.default_rng(0)
+    labels = ["sensor {0}".format(i) for i in range(num_lines)]
+    for label in labels:  # make the lines first, adding a line is always a full redraw
+        plotter.update_data(wavelengths, rng.uniform(10, 20, len(wavelengths)), label)
+    plotter.render()
+    scales = [20, 200]
+    start = time.perf_counter()
+    for frame in range(frames):
+        top = scales[frame % 2] if rescale else scales[0]
+        # update all the lines and draw them as 1 frame
+        for label in labels:
+            plotter.update_data(wavelengths, rng.uniform(0.5 * top, top, len(wavelengths)), label)
+        plotter.render()
+    return frames / (time.perf_counter() - start)
+
+
+def run(frames=FRAMES) -> dict:
+    """ :return: dict of frames / s for each number of lines, blitted and fully redrawn """
+    results = dict()
+    for num_lines in LINE_COUNTS:
+        results["{0} lines".format(num_lines)] = {
+            "blit frames / s": time_frames(num_lines, frames, rescale=False),
+            "redraw frames / s": time_frames(num_lines, max(1, frames // 4), rescale=True)}
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{0}: {1:.1f} blitted frames / s, {2:.1f} redrawn frames / s".format(
+            name, result["blit frames / s"], result["redraw frames / s"]))
@@ -0,0 +1,63 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Time how many reads a second AS726XX.SensorData.save_data can save to the csv file,
+and to the csv file and the numpy session store.  The files are written to a
+temporary folder that is deleted after.
+
+Run from the top folder:
+    python benchmarks/bench_save.py
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import os
+import sys
+import tempfile
+import time
+# installed libraries
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# local files
+import AS726XX
+import csv_writer
+
+ROWS = 5000
+
+
+def save_rows(folder: str, rows: int, session_store: bool) -> float:
+    """ Save rows reads of an AS7262
+    :return: seconds it took, including writing out the buffered rows """
+    sensor = AS726XX.AS7262(None, True, 0)
+    sensor.filename = os.path.join(folder, "bench_{0}.csv".format(session_store))
+    sensor.data.set_data(np.random.default_rng(0).uniform(0, 65000, len(sensor.wavelengths)))
+    save_session = AS726XX.SAVE_SESSION_STORE
+    AS726XX.SAVE_SESSION_STORE = session_store
+    try:
+        start = time.perf_counter()
+        for _ in range(rows):
+            sensor.data.save_data()
+        sensor.data.writer.close()
+        if sensor.data.session:
+            sensor.data.session.save()
+        return time.perf_counter() - start
+    finally:
+        AS726XX.SAVE_SESSION_STORE = save_session
+
+
+def run(rows=ROWS) -> dict:
+    """ :return: dict of rows / s for each way of saving """
+    results = dict()
+    with tempfile.TemporaryDirectory() as folder:
+        for name, session_store in (("csv", False), ("csv + session store", True)):
+            seconds = min(save_rows(folder, rows, session_store) for _ in range(3))
+            results[name] = {"rows / s": rows / seconds}
+        csv_writer.close_all()
+    return results
+
+
+if __name__ == '__main__':
+    for name, result in run().items():
+        print("{0}: {1:.0f} rows / s".format(name, result["rows / s"]))
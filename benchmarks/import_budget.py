@@ -0,0 +1,208 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Check how long the main files take to import against a budget for each, and that
+the files used without a GUI do not import the GUI libraries.  Each file is imported
+in a new python so nothing is already loaded, and the fastest of a few imports is used
+so the disk cache does not change the numbers much.
+
+The budgets are relative to how long python takes to start with nothing to import
+(python -c pass), measured in the same run, so they hold on faster and slower
+computers.  If a display is available, the time to show a window with the
+SpectroPlotterBasic graph is also measured, and matplotlib must not be loaded by then.
+
+Run from the top folder:
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --report  # only print the times
+
+Exits with 1 if a file is over its budget or imports a library it should not.  The
+budgets are about 1.5 times what the imports took when they were set, numpy is most
+of what is left and is imported by every file that handles the reads.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+TOP_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+REPEATS = 5
+
+# file: most times the python start up time its import can take, start up included
+BUDGETS = {"serial_comm": 17,
+           "arduino": 20,
+           "main_headless": 20,
+           "data_class": 17,
+           "usb_comm": 19,
+           "pyplot_embed": 17,
+           "main_gui": 20}
+# file: libraries it should not import, they are loaded when they are needed
+NOT_IMPORTED = {"serial_comm": ("tkinter", "matplotlib"),
+                "arduino": ("tkinter", "matplotlib"),
+                "main_headless": ("tkinter", "matplotlib"),
+                "data_class": ("tkinter", "matplotlib"),
+                "usb_comm": ("usb", "matplotlib"),
+                "pyplot_embed": ("matplotlib",),
+                "main_gui": ("matplotlib",)}
+WINDOW = "window"  # name of the time to show the graph window in the results
+# show a window with the graph, prints "no display" if there is not one, else if
+# matplotlib was loaded before the window was shown
+WINDOW_SCRIPT = """
+import sys
+import tkinter as tk
+import pyplot_embed
+try:
+    root = tk.Tk()
+except tk.TclError:
+    print("no display")
+    sys.exit()
+pyplot_embed.SpectroPlotterBasic(root).pack()
+root.update()
+print("matplotlib" in sys.modules)
+"""
+WINDOW_BUDGET = 30  # most times the python start up time it can take to show the window
+
+
+def run_time(command: list):
+    """ Run a python command in a new python
+    :return: seconds it took and what it printed """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + command, cwd=TOP_FOLDER, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    seconds = time.perf_counter() - start
+    if result.returncode:
+        raise ImportError("Could not run {0}: {1}".format(
+            " ".join(command), result.stderr.strip().splitlines()[-1]))
+    return seconds, result.stdout.strip()
+
+
+def fastest(command: list, repeats=REPEATS):
+    """ :return: fastest milliseconds of repeats runs and what the last run printed """
+    times = []
+    output = ""
+    for _ in range(repeats):
+        seconds, output = run_time(command)
+        times.append(1000. * seconds)
+    return min(times), output
+
+
+def start_up_time(repeats=REPEATS) -> float:
+    """ :return: milliseconds python takes to start and exit with nothing to import """
+    return fastest(["-c", "pass"], repeats)[0]
+
+
+def import_time(module: str):
+    """ Import module in a new python with -X importtime
+    :return: milliseconds the import took, including everything it imported, and the
+    set of names of the modules that were imported """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=TOP_FOLDER, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode:
+        raise ImportError("Could not import {0}: {1}".format(
+            module, result.stderr.strip().splitlines()[-1]))
+    cumulative = None
+    imported = set()
+    # lines are "import time: <self us> | <cumulative us> | <indented module name>"
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # the header line
+        name = fields[2].strip()
+        imported.add(name)
+        if name == module:
+            cumulative = int(fields[1]) / 1000.
+    return cumulative, imported
+
+
+def measure(module: str, repeats=REPEATS):
+    """ :return: fastest milliseconds of repeats imports and the modules imported """
+    milliseconds, _ = fastest(["-c", "import " + module], repeats)
+    _, imported = import_time(module)
+    return milliseconds, imported
+
+
+def measure_window(repeats=REPEATS):
+    """ :return: fastest milliseconds to show the graph window and if matplotlib was
+    loaded before it was shown, or None, None if there is no display """
+    milliseconds, output = fastest(["-c", WINDOW_SCRIPT], repeats)
+    if output == "no display":
+        return None, None
+    return milliseconds, output == "True"
+
+
+def check(modules=None, repeats=REPEATS) -> list:
+    """ Import each module and print its time and budget
+    :return: list of strings of the problems found, empty if all were in budget """
+    problems = []
+    start_up = start_up_time(repeats)
+    print("{0:>15}: {1:6.1f} ms".format("python start up", start_up))
+    for module in modules or BUDGETS:
+        try:
+            milliseconds, imported = measure(module, repeats)
+        except ImportError as error:
+            problems.append(str(error))
+            continue
+        budget = BUDGETS.get(module)
+        print("{0:>15}: {1:6.1f} ms, {2:4.1f} x start up (budget {3} x)".format(
+            module, milliseconds, milliseconds / start_up, budget))
+        if budget and milliseconds > budget * start_up:
+            problems.append("{0} took {1:.1f} x the start up time, budget is {2} x".format(
+                module, milliseconds / start_up, budget))
+        for library in NOT_IMPORTED.get(module, ()):
+            if library in imported:
+                problems.append("{0} imports {1}".format(module, library))
+    if modules:
+        return problems
+    milliseconds, loaded_matplotlib = measure_window(repeats)
+    if milliseconds is None:
+        print("{0:>15}: no display, not measured".format(WINDOW))
+        return problems
+    print("{0:>15}: {1:6.1f} ms, {2:4.1f} x start up (budget {3} x)".format(
+        WINDOW, milliseconds, milliseconds / start_up, WINDOW_BUDGET))
+    if milliseconds > WINDOW_BUDGET * start_up:
+        problems.append("the window took {0:.1f} x the start up time, budget is {1} x".format(
+            milliseconds / start_up, WINDOW_BUDGET))
+    if loaded_matplotlib:
+        problems.append("matplotlib is loaded before the window is shown")
+    return problems
+
+
+def run(repeats=REPEATS) -> dict:
+    """ For run_benchmarks.py
+    :return: dict of the milliseconds each file takes to import and how many times the
+    python start up time that is """
+    start_up = start_up_time(repeats)
+    results = {"python start up": {"ms": start_up}}
+    for module in BUDGETS:
+        milliseconds = measure(module, repeats)[0]
+        results[module] = {"ms": milliseconds, "x start up": milliseconds / start_up}
+    milliseconds, _ = measure_window(repeats)
+    if milliseconds is not None:
+        results[WINDOW] = {"ms": milliseconds, "x start up": milliseconds / start_up}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import times against their budgets")
+    parser.add_argument("modules", nargs="*", help="files to check, default is all in BUDGETS "
+                                                   "and the time to show the window")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--report", action="store_true",
+                        help="only print the times, do not fail if they are over budget")
+    args = parser.parse_args()
+
+    problems = check(args.modules, args.repeats)
+    for problem in problems:
+        print("Failed:", problem)
+    return 1 if problems and not args.report else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
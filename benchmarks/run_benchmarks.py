@@ -0,0 +1,123 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Run all the benchmarks and save the results to a JSON file, so the numbers of
+different versions of the program can be compared.  Nothing needs a display or a
+device, the graph is drawn with the Agg backend.
+
+Run from the top folder:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<older file>.json
+
+The results are saved in benchmarks/results/<date>_<git commit>.json.  With --compare
+every number is also shown as a ratio to the older results, more than 1 is faster.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import argparse
+from datetime import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+# installed libraries
+import matplotlib
+matplotlib.use("Agg")  # before anything imports pyplot
+import numpy as np
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FOLDER = os.path.join(BENCHMARK_FOLDER, "results")
+sys.path.insert(0, BENCHMARK_FOLDER)
+# local files
+import bench_conversions
+import bench_data_read
+import bench_line_parser
+import bench_plot
+import bench_save
+import import_budget
+
+# name in the results: module with a run() function that returns a dict of results
+BENCHMARKS = {"line parser (us / line)": bench_line_parser,
+              "data read": bench_data_read,
+              "conversions": bench_conversions,
+              "save": bench_save,
+              "plot": bench_plot,
+              "import time (ms / import)": import_budget}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=BENCHMARK_FOLDER, stderr=subprocess.DEVNULL
+                                       ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_all(names=None) -> dict:
+    results = {"commit": git_commit(),
+               "date": datetime.now().isoformat(timespec='seconds'),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "matplotlib": matplotlib.__version__,
+               "platform": platform.platform(),
+               "benchmarks": dict()}
+    for name, module in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        print("Running", name)
+        results["benchmarks"][name] = module.run()
+    return results
+
+
+def save_results(results: dict, filename=None) -> str:
+    if not filename:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        filename = os.path.join(RESULTS_FOLDER, "{0}_{1}.json".format(
+            results["date"][:10], results["commit"]))
+    with open(filename, 'w') as _file:
+        json.dump(results, _file, indent=2)
+    return filename
+
+
+def show_results(results: dict, older=None):
+    """ Print every number, and its ratio to the same number in the older results """
+    for name, benchmark in results["benchmarks"].items():
+        print(name)
+        for test, numbers in benchmark.items():
+            for key, value in numbers.items():
+                line = "  {0}, {1}: {2:.4g}".format(test, key, value)
+                try:
+                    old_value = older["benchmarks"][name][test][key]
+                except (TypeError, KeyError):
+                    old_value = None
+                if old_value and key != "lines":  # the line parser's number of lines is not a time
+                    ratio = value / old_value
+                    if "us /" in name or "ms /" in name:  # smaller is faster
+                        ratio = old_value / value if value else float('inf')
+                    line += " ({0:.2f}x of {1})".format(ratio, older["commit"])
+                print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmarks")
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON file of older results to compare to")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS),
+                        help="only run these benchmarks")
+    args = parser.parse_args()
+
+    older = None
+    if args.compare:
+        with open(args.compare) as _file:
+            older = json.load(_file)
+    results = run_all(args.only)
+    print("Saved results to", save_results(results, args.output))
+    show_results(results, older)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Convert sensor counts to power and photon flux (umol) levels with numpy.  The
+conversion vectors are only recalculated when the gain or integration time is
+changed, and can be applied to a single spectrum or a reads x channels array.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# installed libraries
+import numpy as np
+
+UW_PER_COUNT = 1 / 45.0  # AS7262 datasheet
+CALIBRATION_INTEGRATION_SETTING = 166.0  # AS7262 datasheet
+CALIBRATION_GAIN_SETTING = 16.0  # AS7262 datasheet
+
+CONVERSION_eV_TO_nm = 1.0 / 1239.8  # nm (wavelength) * eV
+CONVERSION_uJ_TO_eV = 6.241 * (10**12)  # eV / uJ
+CONVERT_COUNT_TO_uMOLE = 1.0 / (6.022 * (10**17))
+CONCENTRATION_SCALE_FACTOR = 10**8
+
+
+class SpectralConverter:
+    def __init__(self, wavelengths):
+        self.wavelengths = np.asarray(wavelengths, dtype=float)
+        # energy of a photon at each wavelength and the unit conversions, does not
+        # depend on the settings so is only calculated once
+        self.photon_factors = (CONVERSION_uJ_TO_eV * self.wavelengths * CONVERSION_eV_TO_nm *
+                               CONCENTRATION_SCALE_FACTOR * CONVERT_COUNT_TO_uMOLE)
+        self.gain = None
+        self.integration_time = None
+        self.power_conversion = None
+        self.umol_conversion = None
+
+    def set_settings(self, gain: float, integration_time: float):
+        """ Calculate the conversion factors for a gain and integration time (ms),
+        does nothing if the settings have not changed """
+        if gain == self.gain and integration_time == self.integration_time:
+            return
+        self.gain = gain
+        self.integration_time = integration_time
+        self.power_conversion = (UW_PER_COUNT *
+                                 (CALIBRATION_INTEGRATION_SETTING / integration_time) *
+                                 (CALIBRATION_GAIN_SETTING / gain))
+        self.umol_conversion = self.power_conversion * self.photon_factors
+
+    def to_power(self, counts):
+        """ Convert counts to uW / cm2, counts can be 1 spectrum or a reads x channels array """
+        return np.asarray(counts, dtype=float) * self.power_conversion
+
+    def to_umol(self, counts):
+        """ Convert counts to umol / (cm2 x s) (x 10^-8), counts can be 1 spectrum or a
+        reads x channels array """
+        return np.asarray(counts, dtype=float) * self.umol_conversion
+
+
+def normalize_counts(counts, integration_time, reference_time):
+    """ Scale counts read with integration_time to what they would be if read with
+    reference_time, both have to be in the same units.  integration_time can also be
+    an array with 1 time for each row of counts """
+    counts = np.asarray(counts, dtype=float)
+    integration_time = np.asarray(integration_time, dtype=float)
+    if integration_time.ndim:
+        integration_time = integration_time[:, np.newaxis]
+    return counts * (reference_time / integration_time)
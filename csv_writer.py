@@ -0,0 +1,107 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Buffered writer to append rows of data to csv files.  The file is kept open and
+the rows are written in batches so a read does not have to open and close the file
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import atexit
+import logging
+import os
+import threading
+
+MAX_BUFFERED_ROWS = 20  # write the rows to the file after this many reads
+MAX_FLUSH_DELAY = 2.0  # seconds a row can wait in the buffer before it is written
+
+logger = logging.getLogger(__name__)
+
+_writers = dict()  # filename: BufferedCSVWriter, so every part of the program shares 1 writer per file
+_writers_lock = threading.Lock()
+
+
+class BufferedCSVWriter:
+    def __init__(self, filename: str, header: str,
+                 max_rows=MAX_BUFFERED_ROWS, max_delay=MAX_FLUSH_DELAY):
+        self.filename = filename
+        self.header = header
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.rows = []
+        self.lock = threading.Lock()
+        self.timer = None
+        self._file = None
+
+    def write_row(self, row: str):
+        """ Add a line to the buffer, it is written when the buffer is full or
+        max_delay seconds after the first line was added to an empty buffer """
+        if not row.endswith('\n'):
+            row += '\n'
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= self.max_rows:
+                self._flush()
+            elif not self.timer:
+                self.timer = threading.Timer(self.max_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if not self.rows:
+            return
+        if not self._file:
+            self.open_file()
+        self._file.write(''.join(self.rows))
+        self._file.flush()
+        self.rows = []
+
+    def open_file(self):
+        # only check for the header when the file is opened, not on every read
+        new_file = not os.path.isfile(self.filename)
+        if os.path.dirname(self.filename):
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        self._file = open(self.filename, mode='a', encoding='utf-8')
+        if new_file and self.header:
+            logger.info("making new file: %s", self.filename)
+            self._file.write(self.header + '\n')
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def get_writer(filename: str, header: str) -> BufferedCSVWriter:
+    """ Get the writer for a file, making it if needed.  The header is only
+    written if the file does not exist yet """
+    with _writers_lock:
+        if filename not in _writers:
+            _writers[filename] = BufferedCSVWriter(filename, header)
+        return _writers[filename]
+
+
+def flush_all():
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+def close_all():
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+# make sure no data is left in a buffer when the program exits
+atexit.register(close_all)
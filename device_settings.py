@@ -1,14 +1,16 @@
 # standard libraries
 from enum import Enum
 import logging
-import tkinter as tk
 
 # local files
+import averaging
 import data_class
 # import psoc_spectrometers
 
 __author__ = 'Kyle Vitautas Lopin'
 
+logger = logging.getLogger(__name__)
+
 # this might not be needed
 WAVELENGTH_AS7262 = [450, 500, 550, 570, 600, 650]
 WAVELENGTH_AS7263 = [610, 680, 730, 760, 810, 860]
@@ -54,8 +56,8 @@ class IndPowerSetting(Enum):
 
 class DisplayTypes(Enum):
     counts = "Counts"
-    power = "uW / cm2"
-    concentration = "umol / cm2"
+    power = u'\u03bcW / cm\u00B2'
+    concentration = u"\u03bcmol / (cm\u00B2 \u00D7 s) (\u00D7 10\u207B\u2078)"
 
 
 READ_RATE_MAP = {"200 ms": 0.2, "500 ms": 0.5, "1 sec": 1, "5 sec": 5,
@@ -66,9 +68,10 @@ READ_RATE_MAP = {"200 ms": 0.2, "500 ms": 0.5, "1 sec": 1, "5 sec": 5,
 
 class AS726X_Settings(object):
     def __init__(self, device, type):
+        import tkinter as tk  # only the GUI makes settings, the enums and maps do not need it
         self.device = device
         self.type = type
-        logging.debug('type: {0}'.format(type))
+        logger.debug("type: %s", type)
         self.gain = GainSetting.GAIN_SETTING_1X.value
         self.measurement_mode = BankMode.BANK_MODE_3.value
         self.integration_time = 5.6 * 255
@@ -85,6 +88,17 @@ class AS726X_Settings(object):
         # if the device should continuously read and average the data to show
         self.average_reads = tk.BooleanVar()
         self.average_reads.set(True)
+        self.average_mode_var = tk.StringVar()
+        self.average_mode_var.set(averaging.MEAN)
+        self.average_mode_var.trace("w", self.set_averaging)
+        self.average_number_var = tk.StringVar()
+        self.average_number_var.set("1")  # 1 read does not change the data
+        self.average_number_var.trace("w", self.set_averaging)
+        self.averager = averaging.make_averager(averaging.MEAN, 1)
+        # if the gain and integration time should be set automatically before continuous reads,
+        # off so the settings picked by the user are kept unless they turn it on
+        self.use_auto_gain = tk.BooleanVar()
+        self.use_auto_gain.set(False)
 
         self.gain_var = tk.StringVar()
         self.gain_var.set("1")
@@ -109,24 +123,27 @@ class AS726X_Settings(object):
             self.wavelengths = WAVELENGTH_AS7262
         elif type == "AS7263":
             self.wavelengths = WAVELENGTH_AS7263
-        logging.debug('type: {0}; wavelengthss: {1}'.format(type, self.wavelengths))
+        logger.debug("type: %s; wavelengthss: %s", type, self.wavelengths)
 
         self.graph = None
 
     def gain_var_set(self, *args):
         # self.gain = GAIN_SETTING_MAP[self.gain_var.get()].value
         self.gain = GAIN_SETTING_MAP[self.gain_var.get()].value
-        logging.info("gain ={0}".format(self.gain))
+        logger.info("gain =%s", self.gain)
+        self.averager.reset()
         self.device.set_gain(self.gain)
 
     def integration_time_set(self, *args):
         self.integration_time = int(float(self.integration_time_var.get()))
+        self.averager.reset()
         self.device.set_integration_time(self.integration_time)
 
     def LED_power_set(self, *args):
-        logging.debug("Got LED power: ".format(self.LED_power_level_var.get()))
+        logger.debug("Got LED power: %s", self.LED_power_level_var.get())
         self.LED_power_level = LED_POWER_MAP[self.LED_power_level_var.get()]
-        logging.debug("New LED power level: ".format(self.LED_power_level.value))
+        logger.debug("New LED power level: %s", self.LED_power_level.value)
+        self.averager.reset()
         self.device.set_LED_power_level(self.LED_power_level.value)
 
     def toggle_LED(self, turn_LED_on: bool):
@@ -134,14 +151,31 @@ class AS726X_Settings(object):
             self.LED_on = True
         else:
             self.LED_on = False
+        self.averager.reset()
         self.device.set_LED_power(self.LED_on)
 
+    def set_averaging(self, *args):
+        """ Make a new averager when the average mode or number of reads is changed """
+        self.averager = averaging.make_averager(self.average_mode_var.get(),
+                                                int(self.average_number_var.get()))
+        logger.info("averaging: %s of %s reads", self.average_mode_var.get(),
+                    self.average_number_var.get())
+
+    def average(self, data):
+        """ Pass a read through the averager if averaging is on
+        :return: the data to display, or None if the averager needs more reads """
+        if not self.average_reads.get():
+            return data
+        return self.averager.add(data)
+
     def read_period_set(self, *args):
-        self.read_period = 1000.0 * float(self.read_period_var.get().split()[0])
+        # the options are e.g. "200 ms" or "5 sec", READ_RATE_MAP has them in seconds
+        self.read_period = 1000.0 * READ_RATE_MAP[self.read_period_var.get()]
         self.device.set_read_period(self.read_period)
 
-    def toggle_read(self, graph, *args):
-        self.graph = graph
+    def toggle_read(self, *args):
+        """ Called by the reading trace, set graph to the graph to show the reads on first """
+        graph = self.graph
         if self.reading.get():  # has just been set to true
             # run_integration_time = max(self.integration_time, 200)
             # logging.debug("starting continuous read with integration time: {0}".format(run_integration_time))
@@ -149,9 +183,9 @@ class AS726X_Settings(object):
         else:
             self.device.stop_read()
 
-    def single_read(self, graph, flash=False):
+    def single_read(self, graph, flash=False, callback=None):
         # save run settings
         self.run_settings = {'gain': self.gain, 'integration time': self.integration_time, 'flash': flash,
                              'power': self.LED_power_level, 'LED on': self.LED_on}
         # print('single read: ', self)
-        self.device.read_once(graph, flash)
+        return self.device.read_once(graph, flash, callback=callback)
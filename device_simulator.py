@@ -0,0 +1,300 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Simulated Arduino with color sensors on a virtual serial port (pty), to load test the
+program without the hardware.  It answers the same commands and sends the same Setup,
+Data and Inc packages as the color sensor firmware, with any number of AS7262, AS7263
+and AS7265x sensors on the mux ports, each read read_rate times a second.
+
+    simulator = DeviceSimulator(["AS7262", "AS7263", "AS7265x"], read_rate=10)
+    simulator.start()
+    device = serial.Serial(simulator.port_name, baudrate=arduino.BAUD_RATE)
+    arduino.ArduinoColorSensors(master, device=device)
+
+Run the file to find how many ports and reads a second the program keeps up with:
+    python device_simulator.py --rate 10 --max-ports 8 --duration 10
+
+Only works on posix systems (linux and mac) because it uses a pty.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import argparse
+import contextlib
+import os
+import pty
+import re
+import select
+import tempfile
+import threading
+import time
+import tty
+# installed libraries
+import numpy as np
+import serial
+# local files
+import arduino
+import csv_writer
+
+CHANNELS = {"AS7262": 6, "AS7263": 6, "AS7265x": 18}
+FIRST_PORT = 0  # mux port of the first sensor
+DEFAULT_READ_RATE = 10.  # reads a second of each sensor
+COMMAND_POLL_TIME = 0.1  # seconds the command thread waits for the host before checking if it should stop
+SETUP_TIMEOUT = 5  # seconds the load test waits for the program to set up the sensors
+# commands the host can send, anything else (LED and indicator settings) is ignored
+COMMAND_REGEX = re.compile(rb"(?P<id>Id)|(?P<setup>Setup)|(?P<binary>Binary)|Read:\s*(?P<read>\d+)")
+
+
+class SimulatedSensor:
+    def __init__(self, name: str, port: int, rng: np.random.Generator):
+        self.name = name
+        self.port = port
+        self.int_cycles = 150 if name != "AS7265x" else 49
+        self.led_current = 0
+        self.led = b"White LED"
+        self.rng = rng
+        # each sensor gets its own spectrum so the graphs can be told apart
+        self.spectrum = rng.uniform(2000, 30000, CHANNELS[name])
+
+    def read(self):
+        return self.spectrum + self.rng.normal(0, 200, len(self.spectrum))
+
+    def attached_line(self) -> bytes:
+        return b"%s device attached to port: %d|\r\n" % (self.name.encode(), self.port)
+
+    def text_package(self) -> bytes:
+        data = b",".join([b"%.2f" % count for count in self.read()])
+        return (b"Starting Data\r\n"
+                b"Reading port: %d\r\n"
+                b"Integration time: %d\r\n"
+                b"LED current: %d\r\n"
+                b"Data: %s\r\n"
+                b"LED: %s\r\n"
+                b"OK Read\r\n"
+                b"End Data\r\n" % (self.port, self.int_cycles, self.led_current, data, self.led))
+
+    def frame(self) -> bytes:
+        return arduino.encode_frame(self.port, self.int_cycles, self.led_current, self.read())
+
+
+class DeviceSimulator(threading.Thread):
+    def __init__(self, sensors=("AS7262",), read_rate=DEFAULT_READ_RATE, has_mux=True,
+                 has_button=True, inc_every=0, binary_frames=True, seed=None):
+        """ Make the virtual port, start the thread to start sending data after the
+        host sends the Setup command
+
+        :param sensors: type of sensor on each mux port, from CHANNELS
+        :param read_rate: reads a second of each sensor
+        :param has_button: if False the setup says no button is attached
+        :param inc_every: send an Inc package (leaf number increase) after this many reads
+        of each sensor, 0 to never send one
+        :param binary_frames: answer the Binary command and send the reads as binary frames,
+        if False the firmware acts like it does not know the command and sends text packages
+        """
+        threading.Thread.__init__(self, daemon=True)
+        rng = np.random.default_rng(seed)
+        self.sensors = [SimulatedSensor(name, FIRST_PORT + i, rng)
+                        for i, name in enumerate(sensors)]
+        self.ports = {sensor.port: sensor for sensor in self.sensors}
+        self.read_rate = read_rate
+        self.has_mux = has_mux
+        self.has_button = has_button
+        self.inc_every = inc_every
+        self.binary_frames = binary_frames
+        self.binary_mode = False
+        self.master_fd, self.slave_fd = pty.openpty()
+        tty.setraw(self.slave_fd)
+        # keep the slave end open so the port does not close when the host closes it
+        self.port_name = os.ttyname(self.slave_fd)
+        self.write_lock = threading.Lock()
+        self.streaming = threading.Event()
+        self.running = threading.Event()
+        self.command_thread = threading.Thread(target=self.read_commands, daemon=True)
+        # performance metrics
+        self.commands = []
+        self.reads_sent = 0
+        self.bytes_sent = 0
+        self.late_cycles = 0  # read cycles that started after the next one was due
+
+    def start(self):
+        self.running.set()
+        self.command_thread.start()
+        threading.Thread.start(self)
+
+    def stop(self):
+        self.running.clear()
+        self.streaming.set()  # wake up the data thread if it is still waiting for the setup
+        if self.is_alive():
+            self.join()
+        if self.command_thread.is_alive():
+            self.command_thread.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def send(self, message: bytes):
+        with self.write_lock:
+            # the write blocks if the host stops reading, like a full usb serial buffer
+            os.write(self.master_fd, message)
+        self.bytes_sent += len(message)
+
+    def read_commands(self):
+        while self.running.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], COMMAND_POLL_TIME)
+            if not ready:
+                continue
+            try:
+                message = os.read(self.master_fd, 1024)
+            except OSError:  # the host closed the port
+                continue
+            for match in COMMAND_REGEX.finditer(message):
+                self.run_command(match)
+
+    def run_command(self, match):
+        self.commands.append(match.group(0))
+        if match.lastgroup == "id":
+            self.send(arduino.ID_NAME + b"\r\n")
+        elif match.lastgroup == "setup":
+            self.send(self.setup_package())
+            self.streaming.set()
+        elif match.lastgroup == "binary" and self.binary_frames:
+            self.binary_mode = True
+            self.send(arduino.BINARY_MODE_ACK + b"\r\n")
+        elif match.lastgroup == "read":
+            sensor = self.ports.get(int(match.group("read")))
+            if sensor:
+                self.send_read(sensor)
+
+    def setup_package(self) -> bytes:
+        lines = [b"Starting Setup\r\n"]
+        if not self.has_button:
+            lines.append(b"No button attached\r\n")
+        if self.has_mux:
+            lines.append(b"Has mux\r\n")
+        lines.extend([sensor.attached_line() for sensor in self.sensors])
+        lines.append(b"End Setup\r\n")
+        return b"".join(lines)
+
+    def send_read(self, sensor: SimulatedSensor):
+        self.send(sensor.frame() if self.binary_mode else sensor.text_package())
+        self.reads_sent += 1
+
+    def run(self):
+        """ Read every sensor read_rate times a second after the host asks for the setup """
+        self.streaming.wait()
+        period = 1. / self.read_rate
+        next_cycle = time.monotonic()
+        cycle = 0
+        while self.running.is_set():
+            for sensor in self.sensors:
+                self.send_read(sensor)
+            cycle += 1
+            if self.inc_every and cycle % self.inc_every == 0:
+                self.send(b"Starting Inc\r\nEnd Inc\r\n")
+            next_cycle += period
+            delay = next_cycle - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:  # the host is not reading fast enough, don't try to catch up
+                self.late_cycles += 1
+                next_cycle = time.monotonic()
+
+
+def run_load_test(num_ports: int, read_rate=DEFAULT_READ_RATE, duration=10.,
+                  sensor_type="AS7262", binary_frames=True, quiet=True) -> dict:
+    """ Connect an ArduinoColorSensors to a simulator and count how many of the reads
+    sent it saves and passes on to the graph.  The graph queue is emptied in this thread,
+    the way the tkinter main loop would, but nothing is drawn.  The csv files are saved
+    in the Data folder of the working directory, which has to exist.
+
+    :param num_ports: number of sensors on the mux
+    :param read_rate: reads a second of each sensor
+    :param duration: seconds to send data for
+    :param quiet: hide what the program prints, printing to a terminal is slow
+    :return: dict of the results
+    """
+    simulator = DeviceSimulator([sensor_type] * num_ports, read_rate=read_rate,
+                                binary_frames=binary_frames)
+    simulator.start()
+    device = serial.Serial(simulator.port_name, baudrate=arduino.BAUD_RATE)
+    graph_items = {"reads": 0, "clears": 0}
+
+    def handle(item):
+        if len(item) == 1:
+            graph_items["reads"] += 1
+        elif item[1] == "Clear":
+            graph_items["clears"] += 1
+
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext():
+            sensors = arduino.ArduinoColorSensors(None, device=device,
+                                                  binary_frames=binary_frames)
+            pump = sensors.graph_queue
+            pump.set_handler(handle)
+            setup_deadline = time.monotonic() + SETUP_TIMEOUT
+            while sensors.starting_up and time.monotonic() < setup_deadline:
+                time.sleep(0.01)
+            pump.dispatch()
+            start_time = time.monotonic()
+            reads_at_start = simulator.reads_sent
+            graph_items["reads"] = 0
+            while time.monotonic() - start_time < duration:
+                time.sleep(0.01)
+                pump.dispatch()
+            elapsed = time.monotonic() - start_time
+            reads_sent = simulator.reads_sent - reads_at_start
+            # give the program a moment to finish the reads already sent
+            simulator.stop()
+            time.sleep(0.2)
+            pump.dispatch()
+            sensors.running = False
+            sensors.join()
+            device.close()
+            csv_writer.flush_all()
+
+    pump_stats = pump.get_stats()
+    return {"ports": num_ports, "read rate": read_rate,
+            "reads wanted": int(num_ports * read_rate * duration),
+            "reads sent": reads_sent, "reads handled": graph_items["reads"],
+            "reads handled / s": graph_items["reads"] / elapsed,
+            "late cycles": simulator.late_cycles,
+            "binary frames": simulator.binary_mode,
+            "max queue depth": pump_stats["max queue depth"],
+            "p95 latency": pump_stats.get("p95 latency", 0.)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the color sensor program "
+                                                 "with a simulated Arduino")
+    parser.add_argument("--rate", type=float, default=DEFAULT_READ_RATE,
+                        help="reads a second of each sensor")
+    parser.add_argument("--max-ports", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10., help="seconds per test")
+    parser.add_argument("--sensor", default="AS7262", choices=list(CHANNELS))
+    parser.add_argument("--text", action="store_true",
+                        help="send text packages instead of binary frames")
+    parser.add_argument("--verbose", action="store_true", help="show what the program prints")
+    args = parser.parse_args()
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)  # the sensors save to Data/ in the working directory
+        os.makedirs("Data")
+        try:
+            for num_ports in range(1, args.max_ports + 1):
+                result = run_load_test(num_ports, args.rate, args.duration, args.sensor,
+                                       binary_frames=not args.text, quiet=not args.verbose)
+                print("{0} ports: sent {1} of {2} reads, handled {3} ({4:.1f} / s), "
+                      "{5} late cycles, max queue depth {6}, "
+                      "p95 latency {7:.1f} ms".format(
+                        num_ports, result["reads sent"], result["reads wanted"],
+                        result["reads handled"], result["reads handled / s"],
+                        result["late cycles"], result["max queue depth"],
+                        1000 * result["p95 latency"]))
+        finally:
+            csv_writer.close_all()
+            os.chdir(working_directory)
+
+
+if __name__ == '__main__':
+    main()
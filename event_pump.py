@@ -0,0 +1,109 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Queue to pass items from the device threads to the tkinter main loop.  Putting an
+item in the queue wakes up the main loop with a virtual event, and the main loop
+then handles every item waiting in the queue.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+from collections import deque
+import queue
+import threading
+import time
+
+WAKE_EVENT = "<<EventPumpWake>>"
+FALLBACK_POLL_TIME = 250  # milliseconds, backup check of the queue in case a wake up is missed
+LATENCY_SAMPLES = 500  # number of latest items to keep the latency of
+UNBOUND_MAX_ITEMS = 1000  # items kept if nothing handles the queue, the oldest are dropped
+
+
+class EventPump:
+    def __init__(self, maxsize=0):
+        self.queue = queue.Queue(maxsize)
+        self.root = None
+        self.handler = None
+        self.poll_time = FALLBACK_POLL_TIME
+        self.loop_running = False  # tkinter calls from other threads fail till the main loop starts
+        self.wake_sent = threading.Event()
+        # performance metrics
+        self.items_handled = 0
+        self.items_dropped = 0
+        self.max_depth = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)  # seconds from put to being handled
+
+    def bind(self, root, handler, poll_time=FALLBACK_POLL_TIME):
+        """ Call handler(item) in the tkinter main loop of root for every item put in the queue
+        :param root: any tkinter widget, its main loop will handle the items
+        :param handler: function to call with each item
+        :param poll_time: milliseconds between checks of the queue if no wake up event is received
+        """
+        self.root = root
+        self.handler = handler
+        self.poll_time = poll_time
+        root.bind(WAKE_EVENT, self.dispatch, add='+')
+        root.after(0, self.poll)
+
+    def set_handler(self, handler):
+        """ Handle the items without tkinter, the items are handled when the thread
+        using the pump calls dispatch """
+        self.handler = handler
+
+    def put(self, item):
+        """ Add an item to the queue, can be called from any thread """
+        if not self.handler and self.queue.qsize() >= UNBOUND_MAX_ITEMS:
+            # nothing is handling the items, e.g. running without a GUI, so don't let them pile up
+            try:
+                self.queue.get_nowait()
+                self.items_dropped += 1
+            except queue.Empty:
+                pass
+        self.queue.put((time.monotonic(), item))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        self.wake()
+
+    def wake(self):
+        # only send 1 wake up event till the main loop handles it
+        if not self.root or not self.loop_running or self.wake_sent.is_set():
+            return
+        self.wake_sent.set()
+        try:
+            self.root.event_generate(WAKE_EVENT, when='tail')
+        except Exception:  # RuntimeError or TclError if the main loop stopped, the poll will get the item
+            self.wake_sent.clear()
+
+    def dispatch(self, event=None):
+        """ Handle every item in the queue, has to be run in the main loop """
+        self.wake_sent.clear()
+        while True:
+            try:
+                put_time, item = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.latencies.append(time.monotonic() - put_time)
+            self.items_handled += 1
+            self.handler(item)
+
+    def poll(self):
+        self.loop_running = True
+        self.dispatch()
+        self.root.after(self.poll_time, self.poll)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def empty(self):
+        return self.queue.empty()
+
+    def get_stats(self) -> dict:
+        """ Get the queue depth and latency (seconds) numbers of the pump """
+        latencies = sorted(self.latencies)
+        stats = {"queue depth": self.qsize(), "max queue depth": self.max_depth,
+                 "items handled": self.items_handled, "items dropped": self.items_dropped}
+        if latencies:
+            stats["mean latency"] = sum(latencies) / len(latencies)
+            stats["p95 latency"] = latencies[int(0.95 * (len(latencies) - 1))]
+            stats["max latency"] = latencies[-1]
+        return stats
@@ -0,0 +1,125 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Timing of the stages a read goes through: the bytes received in Arduino.run, the
+package parsed, the row saved in SensorData.save_data and the frame drawn by
+SpectroPlotterBasic.  Each stage keeps the times of its latest SAMPLES events so the
+percentiles roll with the program, and the numbers can be printed with dump or shown
+in the status bar with summary.
+
+Two kinds of times are kept for a stage, both in seconds:
+    duration: how long the stage's code took, from a start time to when record is called
+    latency: time since the bytes of the read were received, from a received time
+
+    start = instrumentation.now()
+    ... save the row ...
+    instrumentation.record("save", start)
+    instrumentation.record_latency("saved", received_time)
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+from collections import deque, OrderedDict
+import threading
+import time
+
+ENABLED = True  # set to False to skip all the timing
+SAMPLES = 1000  # number of latest events of each stage to keep
+PERCENTILES = (50, 95, 99)
+# stages shown in the status bar summary
+SUMMARY_STAGES = ("saved", "drawn")
+
+now = time.monotonic
+
+
+class StageTimes:
+    """ Times of the latest events of a stage """
+    def __init__(self, samples=SAMPLES):
+        self.times = deque(maxlen=samples)
+        self.count = 0  # events since the program started, not just the ones kept
+
+    def add(self, seconds: float):
+        self.times.append(seconds)
+        self.count += 1
+
+    def percentiles(self, percents=PERCENTILES) -> dict:
+        times = sorted(self.times)
+        if not times:
+            return dict()
+        return {percent: times[min(len(times) - 1, int(percent / 100. * len(times)))]
+                for percent in percents}
+
+    def get_stats(self) -> dict:
+        stats = {"count": self.count}
+        if self.times:
+            stats["max"] = max(self.times)
+            for percent, seconds in self.percentiles().items():
+                stats["p{0}".format(percent)] = seconds
+        return stats
+
+
+_durations = OrderedDict()  # stage name: StageTimes, in the order the stages were first seen
+_latencies = OrderedDict()
+_lock = threading.Lock()  # only for adding new stages, the deques are thread safe
+
+
+def _get_stage(stages: dict, name: str) -> StageTimes:
+    stage = stages.get(name)
+    if stage is None:
+        with _lock:
+            stage = stages.setdefault(name, StageTimes())
+    return stage
+
+
+def record(stage: str, start: float):
+    """ Record the time from start (from now()) till now as the duration of stage """
+    if ENABLED:
+        _get_stage(_durations, stage).add(now() - start)
+
+
+def record_latency(stage: str, received_time):
+    """ Record the time since the read was received, nothing is recorded if
+    the received time is not known (None) """
+    if ENABLED and received_time is not None:
+        _get_stage(_latencies, stage).add(now() - received_time)
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _latencies.clear()
+
+
+def get_stats() -> dict:
+    """ Get the count, max and percentiles (in seconds) of every stage
+    :return: {"duration": {stage: stats}, "latency": {stage: stats}} """
+    return {"duration": {name: stage.get_stats() for name, stage in list(_durations.items())},
+            "latency": {name: stage.get_stats() for name, stage in list(_latencies.items())}}
+
+
+def format_stats(stats: dict) -> str:
+    line = "{0:>6} events".format(stats["count"])
+    for key in ["p{0}".format(percent) for percent in PERCENTILES] + ["max"]:
+        if key in stats:
+            line += ", {0} {1:8.2f} ms".format(key, 1000 * stats[key])
+    return line
+
+
+def dump(file=None):
+    """ Print the times of every stage, to the terminal or file """
+    stats = get_stats()
+    for kind, title in (("duration", "Stage durations"), ("latency", "Time since the read was received")):
+        print(title + ":", file=file)
+        for name, stage_stats in stats[kind].items():
+            print("  {0:<12} {1}".format(name, format_stats(stage_stats)), file=file)
+
+
+def summary(stages=SUMMARY_STAGES) -> str:
+    """ Short p95 latency of the stages to show in a status bar """
+    parts = []
+    for name in stages:
+        stage = _latencies.get(name)
+        if stage and stage.times:
+            parts.append("{0} p95 {1:.1f} ms".format(name, 1000 * stage.percentiles((95,))[95]))
+    return " | ".join(parts)
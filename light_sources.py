@@ -7,8 +7,6 @@
 # standard libraries
 from collections import OrderedDict
 import tkinter as tk
-# local files
-import main_wipy
 
 __author__ = "Kyle Vitatus Lopin"
 
@@ -20,8 +18,8 @@ LP55231_LEFT_ADDR = 0x33
 LP55231_START_LED_PWM_REG_ADDR = 0x16
 LP55231_START_LED_CURRENT_REG_ADDR = 0x26
 
-USE_SINGLE_LED = main_wipy.USE_SINGLE_LED
-USE_MULTIPLE_LEDS = main_wipy.USE_MULTIPLE_LEDS
+USE_SINGLE_LED = 0
+USE_MULTIPLE_LEDS = 1
 
 
 class LEDFrame(tk.Frame):
@@ -0,0 +1,78 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Table driven parser for the text lines the devices send.  All the line types of a
+protocol are compiled into 1 regular expression, so each line is matched once and
+the name of the line type that matched is used to pick the decoders for its values.
+Lists of numbers are decoded straight into numpy arrays.  The line types are
+matched at the start of the line (after any white space).
+
+    parser = LineParser([("data", rb"Data: (.*)", (float_array,)),
+                         ("port", rb"Reading port: (\\d+)", (int,)),
+                         ("end", rb"END READ", ())])
+    kind, values = parser.parse(b"Data: 1.0,2.5,3.0\\r\\n")
+    # kind = "data", values = (array([1. , 2.5, 3. ]),)
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import re
+# installed libraries
+import numpy as np
+
+
+def float_array(payload: bytes):
+    """ Decode a comma separated list of numbers to a numpy array """
+    return np.array(payload.split(b','), dtype=float)
+
+
+def text(payload: bytes):
+    """ Keep the value as bytes but remove the white space around it """
+    return payload.strip()
+
+
+NO_MATCH = (None, ())
+
+
+class LineParser:
+    def __init__(self, table):
+        """ Make a parser for the line types in table
+        :param table: list of (name, pattern, decoders) for each type of line.  name has to be a
+        valid python identifier, the pattern is a bytes regular expression that has to match
+        the start of the line and decoders has a function for each group in the pattern to convert
+        the text of the group, e.g. int, float, float_array or text.  Patterns are tried in order
+        if more than 1 could match the same place in a line.
+        """
+        patterns = []
+        self.decoders = dict()
+        for name, pattern, decoders in table:
+            compiled = re.compile(pattern)
+            if compiled.groups != len(decoders):
+                raise ValueError("{0} has {1} groups but {2} decoders".format(
+                    name, compiled.groups, len(decoders)))
+            patterns.append(b"(?P<%s>%s)" % (name.encode(), pattern))
+            self.decoders[name] = decoders
+        self.regex = re.compile(rb"\s*(?:" + b"|".join(patterns) + b")")
+        # the groups of each pattern come right after the group with the pattern's name
+        self.groups = {name: tuple(range(self.regex.groupindex[name] + 1,
+                                         self.regex.groupindex[name] + 1 + len(decoders)))
+                       for name, decoders in self.decoders.items()}
+
+    def parse(self, line: bytes):
+        """ Find the type of the line and decode its values
+        :return: (line type name, tuple of values) or (None, ()) if no line type matches
+        """
+        match = self.regex.match(line)
+        if not match:
+            return NO_MATCH
+        name = match.lastgroup
+        decoders = self.decoders[name]
+        if len(decoders) == 1:
+            return name, (decoders[0](match.group(self.groups[name][0])),)
+        if not decoders:
+            return name, ()
+        values = match.group(*self.groups[name])
+        if len(decoders) == 2:  # most lines with more than 1 value, skip the zip for them
+            return name, (decoders[0](values[0]), decoders[1](values[1]))
+        return name, tuple([decode(value) for decode, value in zip(decoders, values)])
@@ -0,0 +1,89 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Set up the logging of the program.  The modules log to their own logger
+(logging.getLogger(__name__)) with %-style arguments, so a message is only formatted
+if its level is turned on:
+    logger.debug("Got line: %s", data_line)
+
+setup_logging puts a QueueHandler on the root logger, so the threads reading the
+devices only put the log records in a queue, and a QueueListener thread formats
+and writes them to the terminal (and a file if given).
+
+The level of each module can be set in MODULE_LEVELS, with the module_levels
+argument, or the SPECTRO_LOG environment variable, e.g.
+    SPECTRO_LOG="arduino=DEBUG,serial_comm=INFO" python main_gui.py
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FORMAT = "%(asctime)s %(threadName)s %(name)s %(levelname)s: %(message)s"
+DEFAULT_LEVEL = logging.WARNING
+# level of each module's logger, the modules not listed use the DEFAULT_LEVEL
+MODULE_LEVELS = {"arduino": logging.INFO,
+                 "usb_comm": logging.INFO}
+ENVIRONMENT_VARIABLE = "SPECTRO_LOG"
+
+_listener = None  # type: logging.handlers.QueueListener
+
+
+def parse_levels(setting: str) -> dict:
+    """ Convert "module=LEVEL,module2=LEVEL" to a dict of module: level, a
+    LEVEL without a module sets the root level with the key None """
+    levels = dict()
+    for part in setting.split(","):
+        if not part.strip():
+            continue
+        name, _, level = part.rpartition("=")
+        levels[name.strip() or None] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=DEFAULT_LEVEL, module_levels=None, filename=None):
+    """ Send the log records through a queue to a listener thread that writes them,
+    calling it again changes the levels but keeps the same listener
+
+    :param level: level of the loggers not in module_levels
+    :param module_levels: dict of logger name: level, added to MODULE_LEVELS
+    :param filename: also write the log to this file
+    """
+    global _listener
+    levels = dict(MODULE_LEVELS)
+    levels.update(module_levels or dict())
+    levels.update(parse_levels(os.environ.get(ENVIRONMENT_VARIABLE, "")))
+    root = logging.getLogger()
+    root.setLevel(levels.pop(None, level))
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    if _listener:
+        return
+    handlers = [logging.StreamHandler()]
+    if filename:
+        handlers.append(logging.FileHandler(filename))
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    for handler in root.handlers[:]:  # e.g. from a basicConfig call
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers,
+                                               respect_handler_level=True)
+    _listener.start()
+    # write out the records still in the queue when the program closes
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
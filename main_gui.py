@@ -8,7 +8,7 @@ GUI to interact with an arduino connected to multiple AS7262, AS7263, and/or AS7
 __author__ = "Kyle Vitatus Lopin"
 
 # standard libraries
-import time
+import logging
 import tkinter as tk
 import tkinter.font as tkFont
 from tkinter import ttk
@@ -17,8 +17,15 @@ import numpy as np
 # local files
 import arduino
 import AS726XX  # for type hinting
+import instrumentation
+import log_config
 import pyplot_embed
 
+logger = logging.getLogger(__name__)
+
+SHOW_TIMING_STATUS = False  # show the read timing percentiles in a status bar
+TIMING_STATUS_UPDATE = 1000  # milliseconds between updates of the timing status bar
+
 
 class SpectralSensorGUI(tk.Tk):
     def __init__(self, parent=None):
@@ -27,13 +34,10 @@ class SpectralSensorGUI(tk.Tk):
         style = ttk.Style(self)
         style.configure('lefttab.TNotebook', tabposition='ne')
         # access the class to control the Arduino
-        #  Red board that the sensor are attached to
+        #  Red board that the sensor are attached to, the device is found and
+        #  set up on its own thread, and the sensors are added when it is done
         self.device = arduino.ArduinoColorSensors(self)
-        print(self.device)
-        while self.device.starting_up:
-            print("waiting for startup")
-            time.sleep(1)
-            pass  # wait till sensor is setup (is on a seperate thread)
+        logger.debug("device: %s", self.device)
         data_notebook = ttk.Notebook(self)
 
         # make the graph area
@@ -43,36 +47,42 @@ class SpectralSensorGUI(tk.Tk):
         data_notebook.pack(side=tk.LEFT, fill=tk.BOTH, expand=2)
         # self.graph.grid(columnspan=2, rowspan=2)
         self.device_frame = ButtonFrame(self, self.device)
-        print('done device frame')
         # device_frame.grid(column=1, rowspan=3)
         self.device_frame.pack(side=tk.RIGHT, fill=tk.BOTH)
-        print('done device frame2')
         self.device_frame.pack_propagate(1)
-        print('done device frame23')
-        self.after(100, self.look_for_data)
-
-    def look_for_data(self):
-        if self.device.graph_event.is_set():
-            print('look for data event')
-            self.device.graph_event.clear()
-            sensor = self.device.graph_queue.get()  # type: AS726XX
-            print(sensor)
-            if sensor == 'Clear':  # this is a hack, fix later
-                self.graph.delete_data()
-            else:
-                sensor = sensor[0]
-                data = sensor.data
-                label = "{0}: {1} cycles, {2} {3} led current".format(sensor.name,
-                                  data.int_cycles, data.led_current, data.LED)
-                print("============>>>>>>>>>>>>>>>>>>> ", label)
-                tab_text = "{0} [{1}]".format(sensor.name, sensor.qwiic_port)
-                print(tab_text)
-                print(self.device_frame.notebook.select())
-                self.device_frame.change_notebook_tab(sensor)
-                self.graph.update_data(data.wavelengths,
-                                       data.norm_data,
-                                       label)
-        self.after(100, self.look_for_data)
+        # the device thread puts the sensors with new data in the graph queue,
+        # and the queue calls show_data in the tkinter main loop
+        self.device.graph_queue.bind(self, self.show_data)
+        # print the timing of every stage of the reads on demand
+        self.bind("<Control-t>", lambda event: instrumentation.dump())
+        if SHOW_TIMING_STATUS:
+            self.timing_str = tk.StringVar()
+            tk.Label(self, textvariable=self.timing_str, anchor=tk.W).pack(side=tk.BOTTOM, fill=tk.X)
+            self.update_timing_status()
+
+    def update_timing_status(self):
+        self.timing_str.set(instrumentation.summary())
+        self.after(TIMING_STATUS_UPDATE, self.update_timing_status)
+
+    def show_data(self, graph_item):
+        sensor = graph_item[0]  # type: AS726XX.AS7262
+        if sensor is None:  # status message from the device
+            self.device_frame.update_status(graph_item[1])
+            return
+        if len(graph_item) > 1 and graph_item[1] == "Clear":
+            self.graph.delete_data()
+            return
+        data = sensor.data
+        label = "{0}: {1} cycles, {2} {3} led current".format(sensor.name,
+                          data.int_cycles, data.led_current, data.LED)
+        self.device_frame.change_notebook_tab(sensor)
+        self.graph.update_data(data.wavelengths,
+                               data.norm_data,
+                               label, received_time=data.received_time)
+
+    def get_queue_stats(self) -> dict:
+        """ Get the queue depth and latency numbers of the data sent to the graph """
+        return self.device.graph_queue.get_stats()
 
 
 class ButtonFrame(tk.Frame):
@@ -81,13 +91,33 @@ class ButtonFrame(tk.Frame):
         tk.Frame.__init__(self, master=master)
         # notebook = ttk.Notebook(self, style='lefttab.TNotebook')
         self.notebook = ttk.Notebook(self)
-        self.sensors = device.sensors
-        print('=======', len(self.sensors))
+        self.device = device
+        self.sensors = []
         self.tabs = []
         self.tab_names = []
-        for sensor in self.sensors:
+        self.notebook.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+
+        self.status_str = tk.StringVar()
+        self.status_str.set("Discovering device...")
+        tk.Label(self, textvariable=self.status_str).pack(side=tk.BOTTOM, fill=tk.X)
+
+        self.add_sensors(device.sensors)
+
+    def update_status(self, status):
+        """ Show the start up state of the device, status is "Setup" when the device has
+        sent its sensors or "No device" if no device was found """
+        if status == "Setup":
+            self.add_sensors(self.device.sensors)
+            self.status_str.set("Connected, {0} sensors found".format(len(self.sensors)))
+        elif status == "No device":
+            self.status_str.set("No device found")
+
+    def add_sensors(self, sensors):
+        """ Make the tab and summary of any sensor that does not have them yet """
+        new_sensors = [sensor for sensor in sensors if sensor not in self.sensors]
+        logger.debug("adding %s sensors", len(new_sensors))
+        for sensor in new_sensors:
             tab = tk.Frame(self)
-            print(f"sensor: {sensor}")
             sensor.display(tab)
             # self.make_sensor_display(sensor, tab)
             # SensorFrame(tab, sensor)
@@ -95,15 +125,15 @@ class ButtonFrame(tk.Frame):
             self.notebook.add(tab, text=tab_display)
             self.tabs.append(tab)
             self.tab_names.append(sensor.name)
-        self.notebook.pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+        self.sensors.extend(new_sensors)
 
-        self.make_summary_frame()
+        self.make_summary_frame(new_sensors)
 
-    def make_summary_frame(self):
+    def make_summary_frame(self, sensors):
         pad_y = 5
 
         _font = tkFont.Font(family="Helvetica", size=10)
-        for sensor in self.sensors:
+        for sensor in sensors:
             sum_frame = tk.Frame(self, relief=tk.RIDGE, bd=2)
             sum_frame.bind("<Button-1>", lambda event, s=sensor: self.label_press(event, s))
             _label = tk.Label(sum_frame, font=_font,
@@ -111,10 +141,8 @@ class ButtonFrame(tk.Frame):
             _label.pack(side=tk.TOP, expand=1, fill=tk.BOTH,
                         pady=pad_y, padx=2)
             _label.bind("<Button-1>", lambda event, s=sensor: self.label_press(event, s))
-            print("bind")
             # _label.bind("<Button-1>", lambda event, s=sensor: self.label_press(event, s))
 
-            print("bind2")
             tk.Button(sum_frame, text="Read Sensor",
                       command=sensor.read_sensor
                       ).pack(side=tk.TOP, expand=1, fill=tk.BOTH,
@@ -123,13 +151,7 @@ class ButtonFrame(tk.Frame):
             sum_frame.pack(side=tk.TOP, fill=tk.BOTH)
 
     def label_press(self, event, sensor):
-        if event:
-            print(event.widget)
-            print(dir(event))
-            print(dir(event.widget))
-            print(sensor)
-        print(sensor.name)
-        print(self.tab_names.index(sensor.name))
+        logger.debug("showing the tab of %s", sensor)
         tab_index = self.tab_names.index(sensor.name)
         self.notebook.select(self.tabs[tab_index])
 
@@ -140,8 +162,6 @@ class ButtonFrame(tk.Frame):
 
 class SensorFrame_depricated(tk.Frame):
     def __init__(self, master, sensor):
-        print(f"sensor: {type(sensor)}")
-        print(f"master: {type(master)}")
         tk.Frame.__init__(self, master)
         pad_y = 5
         # sensor_frame = tk.Frame(tab, relief=tk.RIDGE, bd=5)
@@ -186,14 +206,12 @@ class SensorFrame_depricated(tk.Frame):
         settings_frame = tk.Frame(self, relief=tk.GROOVE)
 
     def indicator_options(self):
-        print("TODO: fill in indicator options")
+        logger.debug("TODO: fill in indicator options")
 
 
 class TrackerFrame(tk.Frame):
     def __init__(self, sensor, master):
         tk.Frame.__init__(self, master)
-        print(type(master))
-        print(type(self))
         self.read_num = 0
         self.leaf_num = tk.IntVar()
         self.leaf_num.set(1)
@@ -208,13 +226,12 @@ class TrackerFrame(tk.Frame):
         leaf_num_frame.pack(side=tk.TOP)
 
     def update_read(self, increase: bool):
-        print('update readpPp:', self.read_num)
         if increase:
             self.read_num += 1
         else:
             self.read_num = 1
         self.read_label.config(text="Read: {0}".format(self.read_num))
-        print('update read', self.read_num)
+        logger.debug("read number: %s", self.read_num)
     #
     def increase_leaf(self):
         self.update_read(False)
@@ -228,6 +245,7 @@ class TrackerFrame(tk.Frame):
 
 
 if __name__ == '__main__':
+    log_config.setup_logging()
     app = SpectralSensorGUI()
     app.title("Spectrograph")
     app.geometry("1050x650")
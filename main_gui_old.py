@@ -13,7 +13,9 @@ from enum import Enum
 # installed libraries
 # local files
 import arduino
+import averaging
 import device_settings
+import log_config
 # import psoc_spectrometers
 import pyplot_embed
 import reg_toplevel
@@ -32,6 +34,8 @@ AS7265X_SORT_INDEX = sorted(range(len(AS7265X_WAVELENGTHS)),
 
 __author__ = 'Kyle Vitautas Lopin'
 
+logger = logging.getLogger(__name__)
+
 # if getattr(sys, 'frozen', False):
 #     # we are running in a |PyInstaller| bundle
 #     basedir = sys._MEIPASS
@@ -67,8 +71,7 @@ class SpectrometerGUI(tk.Tk):
         """
 
         tk.Tk.__init__(self, parent)
-        # logging.basicConfig(format='%(asctime)s %(module)s %(lineno)d: %(levelname)s %(message)s',
-        #                     datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.DEBUG)
+        log_config.setup_logging()
 
         self.device = arduino.ArduinoColorSensors()
         # check what devices are attached
@@ -199,6 +202,17 @@ class AS726XButtonFrame(tk.Frame):
         self.run_button = tk.Button(self, text="Start Reading", command=self.run_toggle)
         self.run_button.pack(side="top", pady=BUTTON_PADY)
 
+        tk.Checkbutton(self, text="Auto gain", variable=self.settings.use_auto_gain
+                       ).pack(side="top", pady=BUTTON_PADY)
+
+        # options to average the reads before they are displayed
+        tk.Checkbutton(self, text="Average reads", variable=self.settings.average_reads,
+                       command=self.average_reads).pack(side="top", pady=BUTTON_PADY)
+        tk.OptionMenu(self, self.settings.average_mode_var,
+                      *averaging.AVERAGE_MODES).pack(side="top", pady=BUTTON_PADY)
+        tk.OptionMenu(self, self.settings.average_number_var,
+                      *[str(n) for n in averaging.AVERAGE_NUMBERS]).pack(side="top", pady=BUTTON_PADY)
+
         # button to save the data, this will open a toplevel with the data printed out, and an option to save to file
         tk.Button(self, text="Save Data", command=self.save_data).pack(side="top", pady=BUTTON_PADY)
 
@@ -253,20 +267,22 @@ class AS726XButtonFrame(tk.Frame):
         self.read_button.config(state=tk.ACTIVE)
 
     def average_reads(self):
-        """ Not implemented yet """
-        print("average read: ", self.settings.average_reads.get())
+        """ Turn averaging on or off, start the average over either way """
+        logger.debug("average reads: %s", self.settings.average_reads.get())
+        self.settings.averager.reset()
 
     def read_once(self):
         """
         Take a single sensor read
         """
         self.read_button.config(state=tk.DISABLED)
-        logging.debug("read once with flash: {0}".format(self.use_flash.get()))
-        self.settings.single_read(self.use_flash.get())
-        self.read_button.config(state=tk.ACTIVE)
+        logger.debug("read once with flash: %s", self.use_flash.get())
+        # the read is done in the background, turn the button back on when it is finished
+        self.settings.single_read(self.graph, self.use_flash.get(),
+                                  callback=lambda _data: self.read_button.config(state=tk.ACTIVE))
 
     def read_just_data(self):
-        self.settings.device.read_data()
+        self.settings.device.read_data(self.graph)
 
     def save_data(self):
         """
@@ -304,7 +320,7 @@ class UniversalButtonsAS726X(tk.Frame):
         # tk.Button(self, text="Check commands", command=self.get_message).pack()
 
     def toggle_display_type(self, *args):
-        logging.debug("Changing display type to: {0}".format(self.display_type.get()))
+        logger.debug("Changing display type to: %s", self.display_type.get())
         self.graph.change_data_units(self.display_type.get())
 
 
@@ -346,7 +362,7 @@ class StatusFrame(tk.Frame):
         # self.status_label = tk.Label(self, textvariable=self.status_str)
 
     def device_connection_test(self, *args):
-        logging.debug("Checking the status of the device")
+        logger.debug("Checking the status of the device")
 
         psoc_spectrometers.ConnectionStatusToplevel(self.master, self.status_str)
 
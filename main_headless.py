@@ -0,0 +1,211 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Read the color sensors of the arduino without a GUI, for unattended runs on a computer
+with no display.  Uses the same arduino.ArduinoColorSensors and sensor classes as
+main_gui.py, reads every sensor on a schedule and saves the reads to the csv files
+(and session stores) as they come in.  Neither tkinter nor matplotlib is imported.
+
+    python main_headless.py --interval 60 --duration 43200  # read every minute for 12 hours
+    python main_headless.py --port /dev/ttyUSB0 --interval 0  # only save what the device sends
+    python main_headless.py --average Mean --average-reads 5  # save the mean of every 5 reads
+
+Stop it with Ctrl+C or SIGTERM, the buffered reads are written before it exits.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import argparse
+from datetime import date
+import logging
+import signal
+import sys
+import threading
+import time
+# installed libraries
+import serial  # pyserial
+# local files
+import arduino
+import AS726XX
+import averaging
+import csv_writer
+import instrumentation
+import log_config
+import session_store
+import transport
+
+DATA_FOLDER = AS726XX.DATA_FOLDER
+SETUP_TIMEOUT = 30  # seconds to wait for the device to be found and send its sensors
+DISPATCH_TIME = 0.1  # seconds between handling the reads the device thread has queued
+STATUS_INTERVAL = 300  # seconds between logging how many reads have been saved
+
+logger = logging.getLogger(__name__)
+
+
+class HeadlessAcquisition:
+    def __init__(self, device=None, data_folder=DATA_FOLDER, interval=60., ports=None,
+                 average_mode=None, average_reads=1):
+        """ Find (or use) the device and read its sensors on a schedule
+
+        :param device: open port or transport replay to use, if None the device is looked for
+        :param data_folder: folder to save the csv files in
+        :param interval: seconds between reads of each sensor, 0 to not ask for reads and
+        only save the reads the device sends on its own (e.g. button presses)
+        :param ports: mux ports of the sensors to read, None to read all of them
+        :param average_mode: one of averaging.AVERAGE_MODES to average the reads of each
+        sensor before they are saved, None to save every read
+        :param average_reads: number of reads to average
+        """
+        self.interval = interval
+        self.ports = ports
+        self.average_mode = average_mode
+        self.average_reads = average_reads
+        self.file_date = date.today()
+        self.stop_event = threading.Event()
+        self.no_device = False
+        self.reads_saved = 0
+        AS726XX.DATA_FOLDER = data_folder  # the sensors make their file names with it
+        self.device = arduino.ArduinoColorSensors(None, device=device)
+        # with no tkinter main loop the queued items are handled in run
+        self.device.graph_queue.set_handler(self.handle_item)
+
+    def wait_for_setup(self, timeout=SETUP_TIMEOUT) -> bool:
+        """ Wait for the device to send its sensors
+        :return: True if the sensors were set up """
+        deadline = time.monotonic() + timeout
+        while self.device.starting_up and time.monotonic() < deadline:
+            time.sleep(DISPATCH_TIME)
+        self.device.graph_queue.dispatch()
+        for sensor in self.device.sensors:
+            sensor.data.set_averaging(self.average_mode, self.average_reads)
+        return not self.device.starting_up and not self.no_device and bool(self.device.sensors)
+
+    def handle_item(self, item):
+        sensor = item[0]  # type: AS726XX.AS7262
+        if sensor is None:  # status message from the device
+            logger.info("Device status: %s", item[1])
+            if item[1] == "No device":
+                self.no_device = True
+                self.stop_event.set()
+        elif len(item) > 1 and item[1] == "Clear":
+            logger.info("Next leaf")
+        else:
+            self.reads_saved += 1
+            logger.debug("Saved read of %s", sensor)
+
+    def sensors_to_read(self):
+        return [sensor for sensor in self.device.sensors
+                if self.ports is None or sensor.qwiic_port in self.ports]
+
+    def update_files(self):
+        """ Save to a new file each day """
+        today = date.today()
+        if today == self.file_date:
+            return
+        self.file_date = today
+        for sensor in self.device.sensors:
+            sensor.filename = sensor.make_filename(today)
+            # the writer and session store are made again for the new file with the next read
+            sensor.data.writer = None
+            sensor.data.session = None
+        csv_writer.flush_all()
+        logger.info("Saving to the files of %s", today)
+
+    def read_sensors(self):
+        for sensor in self.sensors_to_read():
+            sensor.read_sensor()
+
+    def log_status(self):
+        logger.info("%s reads saved, %s", self.reads_saved,
+                    instrumentation.summary() or "no timing yet")
+
+    def run(self, duration=0.):
+        """ Read the sensors every interval till duration seconds have passed (0 to run till
+        stopped) or stop is called """
+        start = time.monotonic()
+        next_read = start
+        next_status = start + STATUS_INTERVAL
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if duration and now - start >= duration:
+                break
+            self.update_files()
+            if self.interval and now >= next_read:
+                self.read_sensors()
+                # skip the reads that were missed instead of sending them all at once
+                next_read += self.interval * max(1, int((now - next_read) / self.interval) + 1)
+            if now >= next_status:
+                self.log_status()
+                next_status += STATUS_INTERVAL
+            self.device.graph_queue.dispatch()
+            self.stop_event.wait(DISPATCH_TIME)
+        self.close()
+
+    def stop(self, *args):
+        """ Can be called from a signal handler or another thread """
+        self.stop_event.set()
+
+    def close(self):
+        self.device.running = False
+        if self.device.is_alive():
+            self.device.join()
+        self.device.graph_queue.dispatch()
+        csv_writer.close_all()
+        session_store.save_all()
+        if self.device.device:
+            self.device.device.close()
+        self.log_status()
+
+
+def open_device(args):
+    if args.replay:
+        return transport.open_replay(args.replay, args.replay_speed)
+    if args.port:
+        return serial.Serial(args.port, baudrate=arduino.BAUD_RATE)
+    return None  # look for it
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the color sensors without a GUI")
+    parser.add_argument("--port", help="serial port of the arduino, found automatically if not given")
+    parser.add_argument("--interval", type=float, default=60.,
+                        help="seconds between reads of each sensor, 0 to only save "
+                             "the reads the device sends on its own")
+    parser.add_argument("--duration", type=float, default=0.,
+                        help="seconds to run for, 0 to run till stopped")
+    parser.add_argument("--sensor-ports", type=int, nargs="*",
+                        help="mux ports of the sensors to read, default is all of them")
+    parser.add_argument("--average", choices=averaging.AVERAGE_MODES,
+                        help="average the reads of each sensor before they are saved")
+    parser.add_argument("--average-reads", type=int, default=5,
+                        help="number of reads to average")
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    parser.add_argument("--session-store", action="store_true",
+                        help="also save the reads in numpy session stores")
+    parser.add_argument("--replay", help="use a recording made with transport.py instead of a device")
+    parser.add_argument("--replay-speed", type=float, default=1.)
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--log-file")
+    args = parser.parse_args()
+
+    log_config.setup_logging(args.log_level.upper(), filename=args.log_file)
+    AS726XX.SAVE_SESSION_STORE = args.session_store
+    acquisition = HeadlessAcquisition(open_device(args), args.data_folder,
+                                      args.interval, args.sensor_ports,
+                                      args.average, args.average_reads)
+    signal.signal(signal.SIGTERM, acquisition.stop)
+    if not acquisition.wait_for_setup():
+        logger.error("No sensors found")
+        acquisition.close()
+        return 1
+    logger.info("Reading %s", [str(sensor) for sensor in acquisition.sensors_to_read()])
+    try:
+        acquisition.run(args.duration)
+    except KeyboardInterrupt:
+        acquisition.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,15 +14,18 @@ from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
-import os
 # local files
+import auto_gain
+import csv_writer
 import light_sources
+import log_config
 import progress_toplevel
 import pyplot_embed
 import serial_comm
 
 __author__ = 'Kyle Vitautas Lopin'
 
+logger = logging.getLogger(__name__)
 
 AS7262_WAVELENGTHS = [450, 500, 550, 570, 600, 650]
 AS7263_WAVELENGTHS = [610, 680, 730, 760, 810, 860]
@@ -38,7 +41,6 @@ AS7265X_WAVELENGTHS = [410, 435, 460, 485, 510, 535,
 # sort the wavelenghts of AS7265x
 AS7265X_SORT_INDEX = sorted(range(len(AS7265X_WAVELENGTHS)),
                             key=AS7265X_WAVELENGTHS.__getitem__)
-print(AS7265X_SORT_INDEX)
 
 
 def sort_data_as7265x(data_list):
@@ -46,7 +48,6 @@ def sort_data_as7265x(data_list):
 
 
 AS7265X_SORTED_WAVELENGTHS = sort_data_as7265x(AS7265X_WAVELENGTHS)
-print(AS7265X_SORTED_WAVELENGTHS)
 
 ONBOARD_LEDS = ["White LED", "IR LED", "UV LED"]
 LP55231_LEDS_RIGHT = [390, 395, 400, 405, 410, 425, 525, 890, 000]
@@ -54,8 +55,8 @@ LP55231_LEDS_LEFT = [455, 475, 480, 465, 470, 505, 630, 000, 940]
 
 LIGHTS = OrderedDict()
 
-USE_SINGLE_LED = 0
-USE_MULTIPLE_LEDS = 1
+USE_SINGLE_LED = light_sources.USE_SINGLE_LED
+USE_MULTIPLE_LEDS = light_sources.USE_MULTIPLE_LEDS
 
 INT_TIMES_AS7265X = [5, 10, 20, 40, 60, 80, 120, 160, 200, 250]  # milliseconds
 # INT_TIMES_AS7265X = [50, 100]  # for quick testing
@@ -66,8 +67,7 @@ class AS726X_GUI_v1(tk.Tk):
 
     def __init__(self, parent=None):
         tk.Tk.__init__(self, parent)
-        logging.basicConfig(format='%(asctime)s %(message)s',
-                            datefmt='%m/%d/%Y %I:%M:%S %p', level=logging.INFO)
+        log_config.setup_logging(logging.INFO)
 
         # self.device = serial_comm.WiPySerial(self, AS7265X_SORT_INDEX)
         # print('----=====-----', self.device.is_connected())
@@ -160,9 +160,8 @@ class AS726X_GUI_v1(tk.Tk):
             self.led_choice.pack(side='top')
 
     def read_as7262_old(self, save=True):
-        print('toooooo')
         all_data = self.device.read_as7262()
-        print('end: ', all_data)
+        logger.debug("AS7262 read: %s", all_data)
         all_data.print_data(with_header=True)
         if save:
             self.save_data(all_data, "AS7262")
@@ -184,24 +183,25 @@ class AS726X_GUI_v1(tk.Tk):
                                                            INT_TIMES_AS7265X,
                                                            DELAY_BETWEEN_READS)
         self.graph.delete_data()
-        for int_time in INT_TIMES_AS7265X:
+        commands = ["AS7265X_Read({0}, {1}, {2})".format(int_time, _lp55231_leds, _onboard_leds)
+                    for int_time in INT_TIMES_AS7265X]
+
+        def show_progress(int_time):
             progress_bar.update_progress(int_time)
             progress_bar.update()
-            msg = "AS7265X_Read({0}, {1}, {2})".format(int_time,
-                                                       _lp55231_leds,
-                                                       _onboard_leds)
-            print("writing: ", msg)
-            self.device.write(msg)
-            data = self.device.read_single_data_read(b"AS7265X")
-
-            if self.check_if_saturated(data.raw_data):
-                messagebox.showerror("Saturation Error",
-                                     "Saturated data at {0} ms integration time".format(2.8 * int_time))
-
+        try:
+            sweep = self.device.sweep(commands, INT_TIMES_AS7265X, b"AS7265X",
+                                      progress=show_progress)
+        except TimeoutError as error:
+            progress_bar.destroy()
+            messagebox.showerror("Read Error", str(error))
+            return
+        for int_time, data in zip(sweep.int_times, sweep.reads):
             self.graph.update_data(AS7265X_WAVELENGTHS, data.norm_data, int_time)
             self.save_as7265x_data(data, "AS7265X", led_str)
-            print("Light source: {0}".format(led_str))
+        logger.debug("Light source: %s", led_str)
         progress_bar.destroy()
+        self.show_saturation_error(sweep)
 
     def read_as7265x(self):
         progress_bar = progress_toplevel.ProgressIndicator(self.master,
@@ -227,94 +227,85 @@ class AS726X_GUI_v1(tk.Tk):
 
             self.graph.update_data(AS7265X_WAVELENGTHS, data.norm_data, led)
             self.save_data(data, "AS7265X", led_str)
-            print("Light source: {0}".format(led_str))
+            logger.debug("Light source: %s", led_str)
         progress_bar.destroy()
 
     def save_as7265x_data(self, data, _type, light_str):
-        print('end4: ', data, light_str, _type)
-        print(light_str, _type)
-        print('=================')
-        print('saving data: ', data.print_data())
+        logger.debug("saving %s data with %s: %s", _type, light_str, data)
 
         if _type == "AS7262":
             filename = self.as7262_filename
         elif _type == "AS7265X":
             filename = self.as7265x_filename
-        print("headker1: ", os.path.isfile(filename), filename)
-        # if there is not a file yet, add the header file
-        if not os.path.isfile(filename):
-            print('++++++++++++++++++_----------------------')
-            header = 'read number, sensor type, gain, integration time, data type,'
-            for wavelength in AS7265X_SORTED_WAVELENGTHS:
-                header += " {0} nm,".format(wavelength)
-            header += " data type,"
-            for wavelength in AS7265X_SORTED_WAVELENGTHS:
-                header += " {0} nm,".format(wavelength)
-            print("headker2: ")
-            print(header)
-            with open(filename, 'a') as _file:
-                _file.write(header+'\n')
-
-        with open(filename, 'a') as _file:
-            print("leave: ", self.read_number_spinbox.get())
-            _file.write("Leaf: {0}, ".format(self.read_number_spinbox.get()))
-            _file.write(data.print_data())
-            print('time stamp: ', datetime.now().strftime("%H:%M:%S"))
-            _file.write(", {0}, {1}, {2}\n".format(datetime.now().strftime("%H:%M:%S"),
-                                                   self.description.get(), light_str))
+        header = 'read number, sensor type, gain, integration time, data type,'
+        for wavelength in AS7265X_SORTED_WAVELENGTHS:
+            header += " {0} nm,".format(wavelength)
+        header += " data type,"
+        for wavelength in AS7265X_SORTED_WAVELENGTHS:
+            header += " {0} nm,".format(wavelength)
+        # the header is only added if there is not a file yet
+        writer = csv_writer.get_writer(filename, header)
+        # the log records have the time stamp
+        logger.debug("leaf: %s", self.read_number_spinbox.get())
+        writer.write_row("Leaf: {0}, {1}, {2}, {3}, {4}".format(self.read_number_spinbox.get(),
+                                                                data.print_data(),
+                                                                datetime.now().strftime("%H:%M:%S"),
+                                                                self.description.get(), light_str))
 
     def save_data(self, data, type, led_str=""):
-        print('saving data: ', data.print_data())
+        logger.debug("saving %s data: %s", type, data)
         if type == "AS7262":
             filename = self.as7262_filename
         elif type == "AS7265X":
             filename = self.as7265x_filename
 
-        if not os.path.isfile(filename):
-            print('++++++++++++++++++_----------------------')
-            header = 'read number, sensor type, gain, integration time, data type,'
-            if type == "AS7262":
-                for wavelength in AS7262_WAVELENGTHS:
-                    header += " {0} nm,".format(wavelength)
-            elif type == "AS7265X":
-                for wavelength in AS7265X_WAVELENGTHS:
-                    header += " {0} nm,".format(wavelength)
-
-            print("headker2: ")
-            print(header)
-            with open(filename, 'a') as _file:
-                _file.write(header + '\n')
-
-        with open(filename, 'a') as _file:
-            # print("leave: ", self.read_number_spinbox.get())
-            _file.write("read: {0}, ".format(self.read_number_spinbox.get()))
-            _file.write(data.print_data())
-            # print('time stamp: ', datetime.now().strftime("%H:%M:%S"))
-            _file.write(", {0}, {1}, {2}\n".format(datetime.now().strftime("%H:%M:%S"),
-                                                   self.description.get(), led_str))
+        header = 'read number, sensor type, gain, integration time, data type,'
+        if type == "AS7262":
+            for wavelength in AS7262_WAVELENGTHS:
+                header += " {0} nm,".format(wavelength)
+        elif type == "AS7265X":
+            for wavelength in AS7265X_WAVELENGTHS:
+                header += " {0} nm,".format(wavelength)
+        # the header is only added if there is not a file yet
+        writer = csv_writer.get_writer(filename, header)
+
+        # print("leave: ", self.read_number_spinbox.get())
+        # print('time stamp: ', datetime.now().strftime("%H:%M:%S"))
+        writer.write_row("read: {0}, {1}, {2}, {3}, {4}".format(self.read_number_spinbox.get(),
+                                                                data.print_data(),
+                                                                datetime.now().strftime("%H:%M:%S"),
+                                                                self.description.get(), led_str))
 
     def read_as7262_range(self):
-        data_range = self.device.read_as7262_read_range()
-        for key, data in data_range.items():
-            if self.check_if_saturated(data.raw_data):
-                messagebox.showerror("Saturation Error",
-                                     "Saturated data at {0} ms integration time".format(2.8*key))
-            print('kk: ', data)
-            self.graph.update_data(AS7262_WAVELENGTHS, data.norm_data, key)
-            print('end3: ', data)
+        try:
+            sweep = self.device.read_as7262_read_range()
+        except TimeoutError as error:
+            messagebox.showerror("Read Error", str(error))
+            return
+        for int_time, data in zip(sweep.int_times, sweep.reads):
+            self.graph.update_data(AS7262_WAVELENGTHS, data.norm_data, int_time)
             self.save_data(data, "AS7262")
+        self.show_saturation_error(sweep)
         self.read_number += 1
         self.read_number_spinbox.delete(0, "end")  # delete value in
         self.read_number_spinbox.insert(0, self.read_number)
 
     def read_and_save_as7262(self):
         data = self.read_as7262(save=True)
-        print('end2: ', data)
+        logger.debug("AS7262 read saved: %s", data)
+
+    @staticmethod
+    def show_saturation_error(sweep: serial_comm.SweepResult):
+        saturated_times = sweep.int_times[sweep.saturated]
+        if saturated_times.size:
+            messagebox.showerror("Saturation Error",
+                                 "Saturated data at {0} ms integration time".format(
+                                     ", ".join("{0:.1f}".format(2.8 * int_time)
+                                               for int_time in saturated_times)))
 
     @staticmethod
     def check_if_saturated(data_list):
-        print(data_list)
-        return max(data_list) > 65000  # 16 bit adc
+        return bool(auto_gain.is_saturated(data_list))
 
     def toggle_as726x_indicator(self):
         print("toggle")
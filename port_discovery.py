@@ -0,0 +1,134 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Find the serial port a device is attached to.  All the candidate ports are checked
+at the same time, and the port each device was last found on is saved so it can be
+tried first the next time the program is started.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import logging
+import os
+import threading
+# installed libraries
+import serial.tools.list_ports
+
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".spectrometer_gui_ports.json")
+MAX_WORKERS = 16  # most ports to check at the same time
+
+logger = logging.getLogger(__name__)
+
+_cache_lock = threading.Lock()
+
+
+def list_ports(port_filter=None) -> list:
+    """ Get the names of the serial ports on the computer
+    :param port_filter: function that takes a serial.tools.list_ports ListPortInfo and returns
+    True if the device could be on that port
+    """
+    return [port.device for port in serial.tools.list_ports.comports()
+            if not port_filter or port_filter(port)]
+
+
+def find_device(device_id, probe, ports: list, release=None, checks_id=True):
+    """ Find the port a device is on by calling probe on the ports.  The port the device
+    was last found on is tried first, then all the other ports are probed at the same time.
+
+    :param device_id: string or bytes to identify the device type in the cache, e.g. its ID message
+    :param probe: function that takes a port name and returns anything but None if the device is on it
+    :param ports: list of port names to try
+    :param release: function to call on extra probe results, e.g. to close the port
+    :param checks_id: False if probe can not tell the device apart from other devices (e.g. it
+    only opens the port), then the first port in ports that works is used, the same one every
+    time, and it is not saved in the cache
+    :return: the result of probe on the port the device is on or None if not found
+    """
+    if not checks_id:
+        return _find_first(probe, ports, release)
+    cached_port = get_cached_port(device_id)
+    if cached_port:
+        result = probe(cached_port)
+        if result is not None:
+            return result
+    ports = [port for port in ports if port != cached_port]
+    if not ports:
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=min(len(ports), MAX_WORKERS))
+    futures = {executor.submit(probe, port): port for port in ports}
+    found = None
+    for future in as_completed(futures):
+        if not future.exception() and future.result() is not None:
+            found = future
+            break
+    if found:
+        # return without waiting for the slower ports, release them when they are done
+        for future in futures:
+            if future is not found and release:
+                future.add_done_callback(lambda _future: _release(_future, release))
+        remember_port(device_id, futures[found])
+    executor.shutdown(wait=False)
+    return found.result() if found else None
+
+
+def _find_first(probe, ports: list, release=None):
+    """ Probe the ports at the same time and return the result of the first port in ports
+    the probe works on, the results of the other ports are released """
+    if not ports:
+        return None
+    with ThreadPoolExecutor(max_workers=min(len(ports), MAX_WORKERS)) as executor:
+        futures = [executor.submit(probe, port) for port in ports]
+        results = [None if future.exception() else future.result() for future in futures]
+    found = None
+    for port, result in zip(ports, results):
+        if result is None:
+            continue
+        if found is None:
+            found = result
+            logger.info("Using port: %s", port)
+        elif release:
+            release(result)
+    return found
+
+
+def _release(future, release):
+    if not future.exception() and future.result() is not None:
+        release(future.result())
+
+
+def _key(device_id) -> str:
+    if isinstance(device_id, bytes):
+        return device_id.decode("utf-8", "replace")
+    return str(device_id)
+
+
+def _read_cache() -> dict:
+    try:
+        with open(CACHE_FILE, 'r') as _file:
+            return json.load(_file)
+    except (OSError, ValueError):
+        return dict()
+
+
+def get_cached_port(device_id):
+    """ Get the port the device was last found on, or None """
+    with _cache_lock:
+        return _read_cache().get(_key(device_id))
+
+
+def remember_port(device_id, port_name: str):
+    with _cache_lock:
+        cache = _read_cache()
+        if cache.get(_key(device_id)) == port_name:
+            return
+        cache[_key(device_id)] = port_name
+        try:
+            with open(CACHE_FILE, 'w') as _file:
+                json.dump(cache, _file, indent=2)
+        except OSError as error:
+            logger.warning("Could not save port cache: %s", error)
+
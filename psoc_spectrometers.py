@@ -3,6 +3,7 @@
 """ Classes to represent different color spectrometers, implimented so far: AS7262"""
 
 # standard libraries
+from concurrent.futures import Future, ThreadPoolExecutor
 import logging
 import queue
 import threading
@@ -10,7 +11,9 @@ import time
 import tkinter as tk
 from tkinter import messagebox
 # local files
+import auto_gain
 import device_settings
+import event_pump
 # import main_gui_old
 import pyplot_embed
 import spectro_frame
@@ -18,7 +21,11 @@ import usb_comm
 
 __author__ = 'Kyle Vitautas Lopin'
 
+logger = logging.getLogger(__name__)
+
 DEVICE_TYPE = "WiPy"
+STREAM = "Stream"  # read_results item to show the frames buffered by the data collector
+MAX_INTEGRATION_CYCLES = 255  # longest integration time the AS726X can use, in 5.6 ms cycles
 
 class PSoC(object):
     def __init__(self, master_app: tk.Tk):
@@ -27,7 +34,7 @@ class PSoC(object):
         self.usb = usb_device.usb  # alias to easier attribute
         self.sensors_list = self.usb.spectrometer
         self.sensors = []
-        logging.debug("sensor list: {0}".format(self.sensors_list))
+        logger.debug("sensor list: %s", self.sensors_list)
         if self.sensors_list and "No Sensor" not in self.sensors_list[0]:
             for sensor in self.sensors_list:
                 self.sensors.append(AS726X(self.usb, sensor, master_app))
@@ -53,13 +60,13 @@ class USB(object):
         # the USB will not make the program hang.
         self.data_queue = queue.Queue()
         self.data_acquired_event = threading.Event()
-        self.termination_flag = False  # flag to set when streaming data should be stopped
+        self.termination_flag = threading.Event()  # set to stop the streaming data thread
 
         self.usb = usb_comm.PSoC_USB(self, self.data_queue, self.data_acquired_event,
                                      self.termination_flag)
 
     def data_process(self, *args):
-        print("original process_data")
+        logger.debug("original process_data")
         pass
 
 
@@ -74,6 +81,19 @@ class AS726X(object):
         self.reading = None
         self.after_delay = int(max(float(self.settings.integration_time), 200))
         self.currently_running = False
+        # reads are done on this thread so the main loop does not wait on the sensor,
+        # the finished reads are passed back to the main loop through the read_results pump
+        self.acquisition_thread = ThreadPoolExecutor(max_workers=1,
+                                                     thread_name_prefix=sensor_type)
+        self.read_results = event_pump.EventPump()
+        self.read_results.bind(master_app, self.show_read)
+        self.stream_graph = None
+        self.stream_update_pending = threading.Event()
+        self.streaming = False  # True if the device is streaming the continuous reads
+        self.stream_confirmed = threading.Event()  # set when the first streamed frame arrives
+        # if the firmware streams the continuous reads with the START / STOP commands, None
+        # till the first continuous read checks it, older firmware only has READ_SINGLE
+        self.stream_supported = None
 
     def initialize_device(self, new_master_graph):
         self.master.graph = new_master_graph
@@ -83,78 +103,226 @@ class AS726X(object):
         self.set_LED_power(False)
         self.set_LED_power(0)
 
+    def write(self, message: str):
+        """ Send a command on the acquisition thread, so it is not sent in the middle of a read
+        and the main loop does not wait for a read to finish """
+        self.acquisition_thread.submit(self.usb.usb_write, message)
+
     def set_gain(self, gain_setting):
-        self.usb.usb_write("{0}|GAIN|{1}".format(self.sensor_type, gain_setting))
+        self.write("{0}|GAIN|{1}".format(self.sensor_type, gain_setting))
         self.master.graph.update_data_conversion_factors()
 
     def set_integration_time(self, integration_time_ms):
         integration_cycles = int(integration_time_ms / self.integration_time_per_cycle)
-        self.usb.usb_write("{0}|INTEGRATE_TIME|{1}".format(self.sensor_type, str(integration_cycles).zfill(3)))
+        self.write("{0}|INTEGRATE_TIME|{1}".format(self.sensor_type, str(integration_cycles).zfill(3)))
         self.after_delay = int(max(float(self.settings.integration_time), 200))
         self.master.graph.update_data_conversion_factors()
 
     def set_read_period(self, read_period_ms: float):
-        self.usb.usb_write("SET_CONT_READ_PERIOD|{0}".format(str(int(read_period_ms)).zfill(5)))
+        self.write("SET_CONT_READ_PERIOD|{0}".format(str(int(read_period_ms)).zfill(5)))
 
     def start_continuous_read(self, graph):
-        self.reading = True
-        self.reading_run(graph)
-
-    def reading_run(self, graph):
-        # self.reading = self.master.after((self.settings.read_period - 100), self.reading_run)
-        # print("try to read", time.time())
+        """ Have the device read the sensor every read period and stream the data back,
+        the data collector thread buffers the frames till the main loop displays them """
         if self.reading:
-            self.read_once(graph)
-            self.master.after(int(self.settings.read_period - 100), self.reading_run)
+            return
+        self.reading = True
+        self.stream_graph = graph
+        if self.settings.use_auto_gain.get():
+            # set the gain and integration time first, then start the stream
+            future = self.acquisition_thread.submit(self.acquire_auto_gain)
+            future.add_done_callback(
+                lambda _future: self.read_results.put((None, _future, self.apply_auto_gain)))
+        else:
+            self.start_stream()
+
+    def start_stream(self):
+        if not self.reading:
+            return  # stopped while the gain was being set
+        if self.stream_supported is False:
+            self.host_timed_read(self.stream_graph)
+            return
+        collector = self.usb.data_aquire_thread
+        frame_timeout = (float(self.settings.read_period) + float(self.settings.integration_time) +
+                         usb_comm.DEFAULT_TIMEOUT)
+        self.streaming = True
+        self.stream_confirmed.clear()
+        self.set_read_period(self.settings.read_period)
+        self.acquisition_thread.submit(collector.start_streaming, self.stream_frame,
+                                       frame_timeout)
+        self.write("{0}|START".format(self.sensor_type))
+        self.master.after(int(frame_timeout), self.check_stream)
+
+    def check_stream(self):
+        """ Check the firmware streamed the first frame, if it did not it does not have the
+        START command, so the host timed reads are used from now on """
+        if not self.streaming or self.stream_confirmed.is_set():
+            return
+        logger.warning("%s firmware does not stream reads, using host timed reads",
+                       self.sensor_type)
+        self.stream_supported = False
+        self.stop_stream()
+        self.host_timed_read(self.stream_graph)
+
+    def stop_stream(self):
+        self.streaming = False
+        self.usb.data_aquire_thread.stop_running()
+        self.write("{0}|STOP".format(self.sensor_type))
+
+    def host_timed_read(self, graph):
+        """ Read the sensor every read period, the next read is started when the
+        last one is done so the reads can not pile up """
+        if not self.reading:
+            return
+        start = time.monotonic()
+
+        def read_done(data):
+            if data is None:
+                self.reading = False  # the device is not working, show_data has told the user
+            elif self.reading:
+                wait = float(self.settings.read_period) - 1000. * (time.monotonic() - start)
+                self.master.after(max(0, int(wait)), self.host_timed_read, graph)
+        self.read_once(graph, callback=read_done)
+
+    def acquire_auto_gain(self):
+        """ Find the gain and integration time for the current light with at most 2 reads,
+        runs on the acquisition thread
+        :return: (gain, integration time in ms) """
+        def read_counts():
+            data = self.acquire_read(False)
+            if data and data[6] == 0:
+                return data[:6]
+            return None
+
+        def apply(gain, int_time):
+            self.usb.usb_write("{0}|GAIN|{1}".format(self.sensor_type,
+                                                     auto_gain.GAINS.index(gain)))
+            self.usb.usb_write("{0}|INTEGRATE_TIME|{1}".format(
+                self.sensor_type, str(int(int_time / self.integration_time_per_cycle)).zfill(3)))
+        # the full range of the sensor, so a dim read after a bright one can go back up
+        int_time_range = (self.integration_time_per_cycle,
+                          MAX_INTEGRATION_CYCLES * self.integration_time_per_cycle)
+        return auto_gain.auto_expose(read_counts, apply, auto_gain.GAINS[self.settings.gain],
+                                     float(self.settings.integration_time),
+                                     int_time_range=int_time_range)
+
+    def apply_auto_gain(self, settings):
+        """ Show the settings found by acquire_auto_gain and start the stream, in the main loop """
+        if settings:
+            gain, int_time = settings
+            self.settings.gain_var.set("{0:g}".format(gain))
+            self.settings.integration_time_var.set("{0:.1f}".format(int_time))
+        self.start_stream()
+
+    def stream_frame(self, _data):
+        """ Called from the data collector thread for each frame, only wake up the main
+        loop if it has handled the frames sent before """
+        self.stream_confirmed.set()
+        self.stream_supported = True
+        if not self.stream_update_pending.is_set():
+            self.stream_update_pending.set()
+            self.read_results.put((self.stream_graph, STREAM, None))
 
     def data_read(self):
         while not self.termination_flag:
-            logging.debug("data read call: {0}".format(self.termination_flag, hex(id(self.termination_flag))))
+            logger.debug("data read call: %s %s", self.termination_flag, hex(id(self.termination_flag)))
             self.data_acquired_event.wait(timeout=0.2)  # wait for the usb communication thread to
             self.data_acquired_event.clear()
             if not self.data_queue.empty():  # make sure there is data in the queue to process
                 new_data = self.data_queue.get()
                 self.master.update_graph(new_data)
 
-        logging.debug("exiting data read")
+        logger.debug("exiting data read")
 
     def data_process(self, _data):
         self.master.update_graph(_data)
 
     def stop_read(self):
-        # self.usb.usb_write("AS7262|STOP")
         self.reading = False
-
-    def read_once(self, graph, flash_on=False):
-        logging.debug("read once")
-        if flash_on:
-            self.usb.usb_write("{0}|READ_SINGLE|FLASH".format(self.sensor_type))
+        if self.streaming:
+            self.stop_stream()
+
+    def read_once(self, graph, flash_on=False, callback=None) -> Future:
+        """ Start a read of the sensor on the acquisition thread and return right away.
+        When the read is done the graph is updated in the main loop, and then
+        callback(data) is called, data is None if the read failed
+        :return: Future of the data read
+        """
+        logger.debug("read once")
+        return self.submit_read(graph, self.acquire_read, flash_on, callback=callback)
+
+    def read_data(self, graph, callback=None) -> Future:
+        """ Get the data of a read that is already started, the same as read_once """
+        return self.submit_read(graph, self.acquire_data, callback=callback)
+
+    def submit_read(self, graph, read_function, *args, callback=None) -> Future:
+        future = self.acquisition_thread.submit(read_function, *args)
+        future.add_done_callback(lambda _future: self.read_results.put((graph, _future, callback)))
+        return future
+
+    def show_stream(self, graph):
+        """ Display all of the frames the data collector has buffered """
+        self.stream_update_pending.clear()
+        for _, data in self.usb.data_aquire_thread.get_frames():
+            self.show_data(graph, data)
+        if not self.usb.data_aquire_thread.running.is_set() and self.reading and self.streaming:
+            # the collector stopped because the device is not working
+            self.reading = False
+            self.streaming = False
+            self.show_data(graph, None)
+
+    def acquire_read(self, flash_on):
+        """ Send the read command and wait for the data, runs on the acquisition thread """
+        with self.usb.io_lock:
+            if flash_on:
+                self.usb.usb_write("{0}|READ_SINGLE|FLASH".format(self.sensor_type))
+            else:
+                self.usb.usb_write("{0}|READ_SINGLE|NO_FLASH".format(self.sensor_type))
+            return self.acquire_data()
+
+    def acquire_data(self):
+        # the data is sent as soon as the integration is done, so wait for it at most the
+        # integration time plus the normal response time
+        return self.usb.read_all_data(timeout=float(self.settings.integration_time) +
+                                      usb_comm.DEFAULT_TIMEOUT)
+
+    def show_read(self, read_result):
+        """ Display a finished read, called in the main loop by the read_results pump """
+        graph, future, callback = read_result
+        if future is STREAM:
+            self.show_stream(graph)
+            return
+        if future.exception():
+            logger.error("Read failed: %s", future.exception())
+            data = None
         else:
-            self.usb.usb_write("{0}|READ_SINGLE|NO_FLASH".format(self.sensor_type))
-        # print(self.settings.integration_time)
-        time.sleep(self.settings.integration_time/1000.+0.2)
-        self.read_data(graph)
-
-    def read_data(self, graph):
-        data = self.usb.read_all_data()
-        print(data)
+            data = future.result()
+        if graph is not None:
+            self.show_data(graph, data)
+        if callback:
+            callback(data)
+
+    def show_data(self, graph, data):
+        logger.debug("Got data: %s", data)
         if data and (data[6] == 0):
-            graph.update_data(data[:6])
+            averaged_data = self.settings.average(data[:6])
+            if averaged_data is not None:
+                graph.update_data(averaged_data)
         elif data and data[6] == 255:
-            logging.info("sensor has problem, error byte set")
+            logger.info("sensor has problem, error byte set")
             messagebox.showerror("Error", "Error in getting data.  Please submit bug report")
         else:
-            logging.info("device not working ch")
+            logger.info("device not working ch")
             self.master.device_not_working()
 
     def set_LED_power(self, LED_on):
         var_str = "OFF"
         if LED_on:
             var_str = "ON"
-        self.usb.usb_write("{0}|LED_CTRL|{1}".format(self.sensor_type, var_str))
+        self.write("{0}|LED_CTRL|{1}".format(self.sensor_type, var_str))
 
     def set_LED_power_level(self, power_level):
-        self.usb.usb_write("{0}|POWER_LEVEL|{1}".format(self.sensor_type, power_level))
+        self.write("{0}|POWER_LEVEL|{1}".format(self.sensor_type, power_level))
 
 
 class ThreadedDataLoop(threading.Thread):
@@ -167,7 +335,7 @@ class ThreadedDataLoop(threading.Thread):
         while not self.termination_flag:
             new_data = self.comm_queue.get()
             self.master.update_graph(new_data)
-        logging.debug("Ending threaded data loop")
+        logger.debug("Ending threaded data loop")
 
 
 class ConnectionStatusToplevel(tk.Toplevel):
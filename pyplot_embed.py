@@ -6,20 +6,28 @@
 import logging
 import queue
 import threading
+import time
 import tkinter as tk
 from tkinter import messagebox
 # installed libraries
-import matplotlib as mp
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-from matplotlib import pyplot as plt
+# matplotlib is imported by load_matplotlib when the first graph is made
 # local files
 import data_class
 import device_settings
+import instrumentation
 
 __author__ = 'Kyle Vitautas Lopin'
 
-plt.style.use('ggplot')
+logger = logging.getLogger(__name__)
 
+# set by load_matplotlib
+Figure = None
+FigureCanvasTkAgg = None
+NavigationToolbar2Tk = None
+
+MAX_FPS = 20  # most times a second a graph is redrawn, faster updates are merged
+SHOW_GRAPH_DELAY = 50  # milliseconds after the window is shown to make the SpectroPlotterBasic graph
+SCALE_ROOM = 1.2  # y axis top as a multiple of the data when it is past the last COUNT_SCALE
 COUNT_SCALE = [0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30, 50, 100, 300, 500, 1000, 3000, 5000, 10000, 30000, 50000, 100000]
 
 # structure (marker style, fill, color)
@@ -27,15 +35,83 @@ MARKERS = {'White LED': ('o', 'none', 'black'), 'UV LED': ('o', 'full', 'blue'),
            'IR LED': ('o', 'full', 'darkred'), 'AS7262': ('x', 'none', 'black'),
            'AS7262': ('x', 'none', 'black'), 'All': ('o', 'none', 'black')}
 
-class SpectroPlotter(tk.Frame):
-    def __init__(self, parent, sensor, _size=(6, 3)):
+
+def load_matplotlib():
+    """ Import the parts of matplotlib the graphs use and set the graph style.  Called
+    when a graph is made instead of when this file is imported, matplotlib takes longer
+    to import than the rest of the program.  pyplot is not used, the figures are made
+    directly so the tkinter backend does not have to be set up to make them """
+    global Figure, FigureCanvasTkAgg, NavigationToolbar2Tk
+    if Figure is not None:
+        return
+    import matplotlib.style
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    from matplotlib.figure import Figure
+    matplotlib.style.use('ggplot')
+
+
+class RenderThrottle:
+    """ Mixin for the plotters to take updates at any rate but only draw them max_fps
+    times a second.  Updates to a data series that come in before it is drawn replace
+    the older update, so only the newest data of each series is drawn.  The class
+    using this has to be a tkinter widget and implement render_updates """
+    def init_throttle(self, max_fps=MAX_FPS):
+        self.max_fps = max_fps
+        self.pending_updates = {}  # series label: newest update not drawn yet
+        self.render_job = None
+        self.last_render = 0
+        # counters to check the performance of the graph
+        self.frames_drawn = 0
+        self.updates_dropped = 0  # updates replaced by a newer update before being drawn
+        self.last_render_time = 0.0  # seconds to draw the last frame
+        self.total_render_time = 0.0
+
+    def queue_update(self, label, update):
+        if label in self.pending_updates:
+            self.updates_dropped += 1
+        self.pending_updates[label] = update
+        if not self.render_job:
+            wait_time = self.last_render + 1.0 / self.max_fps - time.monotonic()
+            self.render_job = self.after(max(0, int(1000 * wait_time)), self.render)
+
+    def render(self):
+        self.render_job = None
+        updates, self.pending_updates = self.pending_updates, {}
+        start = time.monotonic()
+        if updates:
+            self.render_updates(updates)
+        self.last_render = time.monotonic()
+        self.last_render_time = self.last_render - start
+        self.total_render_time += self.last_render_time
+        self.frames_drawn += 1
+
+    def cancel_updates(self):
+        """ Remove any updates waiting to be drawn """
+        self.pending_updates = {}
+        if self.render_job:
+            self.after_cancel(self.render_job)
+            self.render_job = None
+
+    def render_updates(self, updates: dict):
+        raise NotImplementedError
+
+    def get_render_stats(self) -> dict:
+        mean_time = self.total_render_time / self.frames_drawn if self.frames_drawn else 0.0
+        return {"frames drawn": self.frames_drawn, "updates dropped": self.updates_dropped,
+                "last render time": self.last_render_time, "mean render time": mean_time}
+
+
+class SpectroPlotter(tk.Frame, RenderThrottle):
+    def __init__(self, parent, sensor, _size=(6, 3), max_fps=MAX_FPS):
         tk.Frame.__init__(self, master=parent)
+        load_matplotlib()
+        self.init_throttle(max_fps)
         self.settings = sensor.settings  # type: device_settings.AS726X_Settings
         self.data = data_class.SpectrometerData(self.settings)
         self.scale_index = 7
 
         # routine to make and embed the matplotlib graph
-        self.figure_bed = plt.figure(figsize=_size)
+        self.figure_bed = Figure(figsize=_size)
         self.axis = self.figure_bed.add_subplot(111)
 
         # self.figure_bed.set_facecolor('white')
@@ -60,14 +136,18 @@ class SpectroPlotter(tk.Frame):
         self.data.calculate_conversion_factors()
 
     def update_data(self, new_count_data=None):
-        logging.debug("updating data")
+        logger.debug("updating data")
 
-        if new_count_data:
+        if new_count_data is not None:  # the averaged reads are numpy arrays
             self.data.update_data(new_count_data)
         else:
             self.data.set_data_type()
-        display_data = self.data.current_data
-        print(display_data)
+        # the data is updated now but only drawn at the frame rate
+        self.queue_update(None, self.data.current_data)
+
+    def render_updates(self, updates: dict):
+        display_data = updates[None]
+        logger.debug("display data: %s", display_data)
         if max(display_data) > COUNT_SCALE[-1]:
 
             messagebox.showerror("Error", "Error in getting data.  Please submit bug report")
@@ -103,66 +183,158 @@ class SpectroPlotter(tk.Frame):
         #     # update canvas
         #     self.canvas.draw()
 
-        if self.data.current_data:
+        if self.data.current_data is not None:
             self.update_data()
 
 
-class SpectroPlotterBasic(tk.Frame):
-    def __init__(self, parent=None, _size=(5, 4)):
-        tk.Frame.__init__(self, master=parent)
-        self.scale_index = 7
+class SpectroPlotterBasic(tk.Frame, RenderThrottle):
+    def __init__(self, parent=None, _size=(5, 4), max_fps=MAX_FPS):
+        # take the room of the figure (at 100 dpi) till it is made
+        tk.Frame.__init__(self, master=parent, width=int(100 * _size[0]),
+                          height=int(100 * _size[1]))
+        self.init_throttle(max_fps)
+        self.figure_size = _size
+        # matplotlib is loaded and the figure is made after the window is shown, or
+        # when the first data is drawn if that is sooner, so the window does not wait on it
+        self.canvas = None
+        self.bind("<Map>", self.on_map)
+
+    def on_map(self, event):
+        self.unbind("<Map>")
+        self.after(SHOW_GRAPH_DELAY, self.make_figure)
+
+    def make_figure(self):
+        """ Load matplotlib and embed the graph in the frame, if it is not made yet """
+        if self.canvas is not None:
+            return
+        load_matplotlib()
+        figure = Figure(figsize=self.figure_size)
+        self.init_figure(figure, FigureCanvasTkAgg(figure, self))
+        # self.canvas._tkcanvas.config(highlightthickness=0)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
 
-        # routine to make and embed the matplotlib graph
-        self.figure = mp.figure.Figure(figsize=_size)
+    def init_figure(self, figure, canvas):
+        """ Set up the axis of the figure that canvas draws.  Kept apart from the tkinter
+        frame so the graph can be drawn on any matplotlib canvas, e.g. a FigureCanvasAgg
+        to benchmark it without a display """
+        self.scale_index = 7
+        self.figure = figure
         self.axis = self.figure.add_subplot(111)
 
         self.figure.set_facecolor('white')
-        self.canvas = FigureCanvasTkAgg(self.figure, self)
-        # self.canvas._tkcanvas.config(highlightthickness=0)
-        self.canvas.draw()
-        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.lines = {}
+        self.line_maxes = {}  # largest y value of each line, to find the y scale to use
+        self.received_times = {}  # line label: when the device sent the read waiting to be drawn
+        self.canvas = canvas
+        # the lines are animated so they are left out of a full draw and can be blitted
+        # on top of the background of the axes, grid and legend saved after each draw
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
 
         # self.axis.set_xlim([600, 900])
         self.axis.set_xlabel("wavelength (nm)")
         self.axis.set_xlim([400, 950])
 
-        # self.axis.set_ylim([0, 50000)
+        self.axis.set_ylim([0, COUNT_SCALE[self.scale_index]])
         self.axis.set_ylabel(r'$\mu$W/cm$^2$/s')
         # self.axis.set_ylabel('Counts')
-        self.lines = {}
+        self.canvas.draw()
 
-    def update_data(self, x_data, y_data, label=None):
-        print('label = ', label)
-        if label in MARKERS:
-            marker = MARKERS[label][0]
-            fill = MARKERS[label][1]
-            color = MARKERS[label][2]
+    def update_data(self, x_data, y_data, label=None, received_time=None):
+        """ :param received_time: instrumentation.now() when the read was received, to time
+        how long it takes to be drawn """
+        self.received_times[label] = received_time
+        self.queue_update(label, (x_data, y_data))
+
+    def render_updates(self, updates: dict):
+        self.make_figure()
+        start = instrumentation.now()
+        redraw = not self.background
+        for label, (x_data, y_data) in updates.items():
+            redraw |= self.set_line(x_data, y_data, label)
+        redraw |= self.update_scale()
+        if redraw:
+            # the background changed so everything has to be drawn again
+            self.canvas.draw()
         else:
-            marker = 'o'
-            fill = 'full'
-            color = 'black'
-
+            self.blit_lines()
+        instrumentation.record("draw", start)
+        for label in updates:
+            instrumentation.record_latency("drawn", self.received_times.pop(label, None))
+
+    def set_line(self, x_data, y_data, label):
+        """ Update the data of a line, making it if needed
+        :return: True if a new line was made """
+        logger.debug("label = %s", label)
+        self.line_maxes[label] = max(y_data)
         if label in self.lines:
-            self.lines[label].set_xdata(x_data)
-            self.lines[label].set_ydata(y_data)
-        else:
-            newline, = self.axis.plot(x_data, y_data, label=label)
-            self.lines[label] = newline
+            self.lines[label].set_data(x_data, y_data)
+            return False
+        newline, = self.axis.plot(x_data, y_data, label=label, animated=True)
+        self.lines[label] = newline
+        self.update_legend()
+        return True
+
+    def update_legend(self):
+        """ Only has to be called when a line is added or removed """
+        if not self.lines:
+            if self.axis.get_legend():
+                self.axis.get_legend().remove()
+            return
         handle, labels = self.axis.get_legend_handles_labels()
-        plt.legend(handle, labels, loc='upper right',
-                   bbox_to_anchor=(1, 0.5),
-                   title='Data series',
-                   prop={'size': 10}, fancybox=True)
-        self.axis.relim()
-        self.axis.autoscale_view()
-        self.canvas.draw()
+        self.axis.legend(handle, labels, loc='upper right',
+                         bbox_to_anchor=(1, 0.5),
+                         title='Data series',
+                         prop={'size': 10}, fancybox=True)
+
+    def update_scale(self):
+        """ Set the y axis to the smallest COUNT_SCALE value that fits all the lines, or
+        if the data is past the last scale, to SCALE_ROOM times the data
+        :return: True if the y axis limits were changed """
+        y_max = max(self.line_maxes.values(), default=0)
+        if y_max > COUNT_SCALE[-1]:
+            top = self.axis.get_ylim()[1]
+            if self.scale_index == len(COUNT_SCALE) and y_max <= top:
+                return False  # already fit to the data, leave it till the data is past it
+            self.scale_index = len(COUNT_SCALE)
+            self.axis.set_ylim([0, SCALE_ROOM * y_max])
+            return True
+        scale_index = 0
+        while scale_index < len(COUNT_SCALE) - 1 and y_max > COUNT_SCALE[scale_index]:
+            scale_index += 1
+        if scale_index == self.scale_index:
+            return False
+        self.scale_index = scale_index
+        self.axis.set_ylim([0, COUNT_SCALE[self.scale_index]])
+        return True
+
+    def on_draw(self, event):
+        """ Save the newly drawn background and put the lines on top of it """
+        self.background = self.canvas.copy_from_bbox(self.axis.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.lines.values():
+            self.axis.draw_artist(line)
+
+    def blit_lines(self):
+        """ Redraw just the lines on the saved background """
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.axis.bbox)
 
     # def add_data(self, x_data, y_data, label=None):
     #     newline, = self.axis.plot(x_data, y_data, marker, label=label, fillstyle=fill, c=color)
     #     self.lines[label] = newline
 
     def delete_data(self):
+        self.cancel_updates()
+        if self.canvas is None:
+            return  # nothing has been drawn yet
         keys = list(self.lines.keys())
         for key in keys:
             self.lines.pop(key).remove()
+        self.line_maxes.clear()
+        self.received_times.clear()
+        self.update_legend()
         self.canvas.draw()
@@ -0,0 +1,92 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Fixed size history of the reads of a sensor.  The reads are kept in a preallocated
+numpy array so a long run does not keep growing lists, and the latest reads can be
+used for time course graphs and rolling statistics without copying them.
+
+The array holds 2 copies of the buffer back to back, so the last N reads are always
+in 1 contiguous block and can be returned as a view:
+    history = RingBuffer(1000, 6)
+    history.append(data)
+    history.last(10)  # 10 x 6 view of the latest reads, oldest first
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import time
+# installed libraries
+import numpy as np
+
+DEFAULT_CAPACITY = 4096  # number of reads to keep
+
+
+class RingBuffer:
+    def __init__(self, capacity: int, channels: int, dtype=np.float64):
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((2 * capacity, channels), dtype=dtype)
+        self.timestamps = np.zeros(2 * capacity, dtype=np.float64)
+        self.index = 0  # where the next read goes
+        self.size = 0
+        self.total_reads = 0  # number of reads ever added, including the ones overwritten
+
+    def __len__(self):
+        return self.size
+
+    def append(self, row, timestamp=None):
+        """ Add a read, the oldest read is overwritten if the buffer is full
+        :param row: the data of 1 read, must have 1 value per channel
+        :param timestamp: time of the read, defaults to now
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        i = self.index
+        self.data[i] = row
+        self.data[i + self.capacity] = row
+        self.timestamps[i] = timestamp
+        self.timestamps[i + self.capacity] = timestamp
+        self.index = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total_reads += 1
+
+    def last(self, n=None):
+        """ Get a view of the latest n reads (all reads if n is None), oldest first.  The view
+        is not copied so it will change when more reads are added """
+        end = self.index + self.capacity
+        return self.data[end - self._count(n):end]
+
+    def last_timestamps(self, n=None):
+        """ Get a view of the times of the latest n reads, matches last(n) """
+        end = self.index + self.capacity
+        return self.timestamps[end - self._count(n):end]
+
+    def latest(self):
+        """ Get the latest read or None if nothing has been added """
+        if not self.size:
+            return None
+        return self.data[self.index + self.capacity - 1]
+
+    def mean(self, n=None):
+        """ Mean of each channel over the latest n reads """
+        return self.last(n).mean(axis=0)
+
+    def std(self, n=None):
+        """ Standard deviation of each channel over the latest n reads """
+        return self.last(n).std(axis=0)
+
+    def min(self, n=None):
+        return self.last(n).min(axis=0)
+
+    def max(self, n=None):
+        return self.last(n).max(axis=0)
+
+    def clear(self):
+        self.index = 0
+        self.size = 0
+
+    def _count(self, n):
+        if n is None:
+            return self.size
+        return max(0, min(n, self.size))
@@ -0,0 +1,153 @@
+# Copyright (c) 2017-2018 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+""" Toplevel to save the data shown on the graph to a file, with comments.  Kept apart
+from data_class so the data classes can be used without importing tkinter """
+
+# standard libraries
+import logging
+import tkinter as tk
+from tkinter import messagebox
+from tkinter import filedialog
+# local files
+import device_settings
+
+__author__ = 'Kyle V. Lopin'
+
+logger = logging.getLogger(__name__)
+
+
+class SaveTopLevel(tk.Toplevel):
+    def __init__(self, wavelength_data: list, light_data: list,
+                 data_type: str, settings):
+        tk.Toplevel.__init__(self, master=None)
+        # set basic attributes
+        self.attributes('-topmost', 'true')
+        self.geometry('450x380')
+        self.title("Save data")
+
+        # strings to display data to user
+        self.full_data_string = tk.StringVar()  # string to store wavelength and data
+        self.data_string = tk.StringVar()  # string to hold just the data
+
+        self.full_data_string = "Wavelength (nm), {0}\n".format(data_type)
+        self.data_string = "{0}\n".format(data_type)
+        for i, _data in enumerate(wavelength_data):
+            self.full_data_string += "{0}, {1:4.3f}\n".format(_data, light_data[i])
+            self.data_string += "{0:4.3f}\n".format(light_data[i])
+
+        # make the area
+        self.text_box = tk.Text(self, width=50, height=8)
+        self.text_box.insert(tk.END, self.full_data_string)
+        self.text_box.pack(side='top', pady=6)
+
+        # allow user to display just the data not the wavelengths all the time
+        self.display_type = tk.IntVar()
+        tk.Checkbutton(self, text="Show just data (no wavelengths)", command=self.toggle_data_display,
+                       variable=self.display_type).pack(side='top', pady=6)
+
+        # Allow the user to add comments to the data file
+        tk.Label(self, text="Comments:").pack(side='top', pady=6)
+
+        # make string prepopulated with settings
+        # this dictionary loops are horrible
+        power = None
+        for value, power_setting in device_settings.LED_POWER_MAP.items():
+            if power_setting == settings.run_settings['power']:
+                power = value
+
+        lighting_str = ""
+        if settings.run_settings['LED on']:
+            lighting_str += "LED on with {0}".format(power)
+        elif settings.run_settings['flash']:
+            lighting_str += "LED flash with {0}".format(power)
+        else:
+            lighting_str += "No lighting"
+        # get gain settings
+        gain = None
+        for value, gain_setting in device_settings.GAIN_SETTING_MAP.items():
+            if gain_setting.value == settings.run_settings['gain']:
+                gain = value
+            elif value == settings.run_settings['gain']:  # horrible hack but should work
+                gain = value
+
+        self.details_str = "gain: {0}, integration time: {1} ms\n{2}".format(gain,
+                                                                             settings.run_settings['integration time'],
+                                                                             lighting_str)
+
+        self.comment = tk.Text(self, width=50, height=5)
+        self.comment.insert(tk.END, self.details_str)
+        self.comment.pack(side='top', pady=6)
+
+        # allow user to remove the details
+        self.add_details = tk.IntVar()
+        tk.Checkbutton(self, text="Add run details", command=self.toggle_details,
+                       variable=self.add_details).pack(side='top', pady=6)
+        self.add_details.set(1)
+
+        button_frame = tk.Frame(self)
+        button_frame.pack(side='top', pady=6)
+        tk.Button(button_frame, text="Save Data", command=self.save_data).pack(side='left', padx=10)
+        tk.Button(button_frame, text="Close", command=self.destroy).pack(side='left', padx=10)
+
+    def toggle_data_display(self):
+        if self.display_type.get():  # button is checked
+            self.text_box.delete(1.0, tk.END)
+            self.text_box.insert(tk.END, self.data_string)
+        else:
+            self.text_box.delete(1.0, tk.END)
+            self.text_box.insert(tk.END, self.full_data_string)
+
+    def toggle_details(self):
+        if not self.add_details.get():  # button is checked
+            self.comment.delete(1.0, tk.END)
+        else:
+            self.comment.insert(tk.END, self.details_str)
+
+    def save_data(self):
+        try:
+            _filename = open_file(self, 'saveas')  # open the file
+        except Exception as error:
+            messagebox.showerror(title="Error", message=error)
+        self.attributes('-topmost', 'true')
+
+        if not _filename:
+            self.destroy()
+        # a file was found so open it and add the data to it
+        with open(_filename, mode='a', encoding='utf-8') as _file:
+
+            if self.comment.get(1.0, tk.END):
+                self.data_string += self.comment.get(1.0, tk.END)
+            try:
+                _file.write(self.data_string)
+                _file.close()
+                self.destroy()
+
+            except Exception as error:
+
+                messagebox.showerror(title="Error", message=error)
+                self.lift()
+                _file.close()
+
+
+def open_file(parent, _type: str) -> str:
+    """
+    Make a method to return an open file or a file name depending on the type asked for
+    :param parent:  master tk.TK or toplevel that called the file dialog
+    :param _type:  'open' or 'saveas' to specify what type of file is to be opened
+    :return: filename user selected
+    """
+    """ Make the options for the save file dialog box for the user """
+    file_opt = options = {}
+    options['defaultextension'] = ".csv"
+    # options['filetypes'] = [('All files', '*.*'), ("Comma separate values", "*.csv")]
+    options['filetypes'] = [("Comma separate values", "*.csv")]
+    logger.debug("saving data: 1")
+    if _type == 'saveas':
+        """ Ask the user what name to save the file as """
+        logger.debug("saving data: 2")
+        _filename = filedialog.asksaveasfilename(parent=parent, confirmoverwrite=False, **file_opt)
+        return _filename
+
+    elif _type == 'open':
+        _filename = filedialog.askopenfilename(**file_opt)
+        return _filename
@@ -0,0 +1,101 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+tkinter widgets to control and show the state of the AS7262, AS7263 and AS7265x
+sensors of AS726XX.  Kept apart from the sensor classes so they can be used
+without tkinter.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import logging
+import tkinter as tk
+from tkinter import ttk
+
+logger = logging.getLogger(__name__)
+
+
+def display(sensor, master):
+    """ Make the frame to control a sensor in master, and replace the sensor's
+    read tracker with a TrackerFrame """
+    pad_y = 5
+    sensor_frame = tk.Frame(master, relief=tk.RIDGE, bd=5)
+    text_str = str(sensor)
+    tk.Label(sensor_frame, text=text_str).pack(side=tk.TOP, pady=pad_y)
+    sensor_frame.pack(side=tk.LEFT, expand=2, fill=tk.BOTH, pady=pad_y)
+
+    ind_options = ["Indicator LED off", "Indicator LED on", "Flash Indicator LED"]
+
+    if sensor.has_button:
+        ind_options.extend(["Button LED off", "Button LED on", "Flash Button LED"])
+
+    sensor.ind_opt_var = tk.StringVar()  # TODO: can remove from the sensor ?
+    sensor.ind_opt_var.set(ind_options[0])
+
+    tk.OptionMenu(sensor_frame, sensor.ind_opt_var, *ind_options,
+                  command=sensor.indicator_options).pack(side=tk.TOP, pady=pad_y)
+
+    # LED display options
+    tk.Label(sensor_frame, text="Measurement\nLighting options:").pack(side=tk.TOP, pady=pad_y)
+
+
+    sensor.led_opt_var = tk.StringVar()  # TODO: can remove from the sensor ?
+    sensor.led_opt_var.set(sensor.led_options[2])
+
+    tk.OptionMenu(sensor_frame, sensor.led_opt_var, *sensor.led_options,
+                  command=sensor.set_led_option).pack(side=tk.TOP, pady=pad_y)
+
+    tk.Button(sensor_frame, text="Read Sensor", command=sensor.read_sensor).pack(side=tk.TOP, pady=pad_y)
+
+    sensor.tracker = TrackerFrame(sensor, sensor_frame)
+    tk.Label(sensor_frame, text=text_str).pack(side=tk.TOP)
+    sensor.tracker.pack(side=tk.TOP, pady=5)
+    ttk.Separator(sensor_frame, orient=tk.HORIZONTAL).pack(side=tk.TOP, fill=tk.X, pady=2)
+
+    sensor.display_flag = tk.BooleanVar()
+    sensor.display_checkbutton = tk.Checkbutton(sensor_frame, text="Display reflectance",
+                                                onvalue=True, offvalue=False,
+                                                variable=sensor.display_flag,
+                                                command=sensor.set_reflectance, height=1)
+    sensor.display_checkbutton.deselect()
+    sensor.display_checkbutton.pack()
+    sensor.reference_button = tk.Button(sensor_frame, text="Read reference data",
+                                        command=sensor.get_reference_data)
+    sensor.reference_button.pack(pady=2, fill=tk.X)
+    return sensor_frame
+
+
+class TrackerFrame(tk.Frame):
+    def __init__(self, sensor, master):
+        tk.Frame.__init__(self, master)
+        self.read_num = 1
+        self.leaf_num = tk.IntVar()
+        self.leaf_num.set(1)
+        self.read_label = tk.Label(self,
+                          text="Read: {0}".format(self.read_num))
+        self.read_label.pack(side=tk.TOP)
+        # tk.Label(self, text="hello").pack(side=tk.TOP)
+        leaf_num_frame = tk.Frame(self)
+        tk.Label(leaf_num_frame, text="Leaf number:").pack(side=tk.LEFT)
+        tk.Spinbox(leaf_num_frame, from_=0, textvariable=self.leaf_num,
+                   command=self.increase_leaf, width=2).pack(side=tk.LEFT)
+        leaf_num_frame.pack(side=tk.TOP)
+
+    def update_read(self, increase: bool):
+        if increase:
+            self.read_num += 1
+        else:
+            self.read_num = 1
+        self.read_label.config(text="Read: {0}".format(self.read_num))
+        logger.debug("update read: %s", self.read_num)
+    #
+    def increase_leaf(self):
+        self.update_read(False)
+        self.leaf_num.set(self.leaf_num.get()+1)
+
+    def get_read_num(self):
+        return self.read_num
+
+    def get_leave_num(self):
+        return self.leaf_num.get()
@@ -3,14 +3,21 @@
 """ Class to represent a WiPy connect through the serial port (WLAN can be added
  later) """
 
+from collections import deque, namedtuple
 import logging
-import re
 import time
 # installed libraries
+import numpy as np
 import serial  # pyserial
 import serial.tools.list_ports
 # local files
-import  progress_toplevel
+import auto_gain
+import conversions
+import line_parser
+import port_discovery
+import transport
+
+logger = logging.getLogger(__name__)
 
 # USB-UART Constants
 DESCRIPTOR_NAME_WIN1 = "USB Serial Port"
@@ -26,39 +33,126 @@ ONBOARD_LEDS = ["White LED", "IR LED", "UV LED"]
 LP55231_LEDS = [400, 410, 455, 465, 0, 480, 630, 890, 940]
 # INT_TIMES_AS7265X = [5, 10, 20, 40, 60, 80, 120, 160, 200, 250]  # milliseconds
 INT_TIMES_AS7265X = [100, 200]  # for quick testing
+INT_TIMES_AS7262 = [50, 100, 150, 200, 250]
+RX_BUFFER_SIZE = 64  # bytes of commands the device can buffer, the size of the arduino's UART buffer
+REPLY_TIMEOUT = 5.  # seconds to wait for each read of a sweep after the read before it
 # DELAY_BETWEEN_READS = 1000  # milliseconds
 
-class WiPySerial:
-    def __init__(self, master, sort_index=None):
+# lines sent by the WiPy during a read
+WIPY_READ_PARSER = line_parser.LineParser([
+    ("start", rb"(\w+) START READ", (line_parser.text,)),
+    ("raw_data", rb"(\w+) RAW DATA: ?\[([^\]]*)\]", (line_parser.text, line_parser.float_array)),
+    ("cal_data", rb"(\w+) CAL DATA: ?\[([^\]]*)\]", (line_parser.text, line_parser.float_array)),
+    ("settings", rb"integration cycles:[^|]*\|([^|]*)\|[^|]*\|([^|\r\n]*)", (int, float)),
+    ("end", rb"END READ", ())])
+
+# lines sent by the Arduino during a read
+ARDUINO_READ_PARSER = line_parser.LineParser([
+    ("data", rb"Data:(.*)", (line_parser.float_array,)),
+    ("settings", rb"Gain:([^|]*)\|[^:]*:\s*(\d+)", (int, int)),
+    ("done", rb"DONE", ())])
+
+# result of a read at several integration times, data and raw_data are
+# integration times x channels arrays, saturated has 1 flag for each integration time
+SweepResult = namedtuple("SweepResult", ["int_times", "data", "raw_data", "saturated", "reads"])
+
+
+def is_serial_adapter(port) -> bool:
+    """ Check if a serial.tools.list_ports port could be the USB-UART the device is on """
+    return (DESCRIPTOR_NAME_WIN1 in port.description or DESCRIPTOR_NAME_MAC in port.description or
+            DESCRIPTOR_NAME_WIN2 in port.description)
+
+
+def open_port(port_name: str):
+    """ Open a port with the settings the devices use, or return None if it can not be opened """
+    try:
+        logger.info("Port found: %s", port_name)
+        return serial.Serial(port_name, baudrate=BAUD_RATE, stopbits=STOP_BITS,
+                             parity=PARITY, bytesize=BYTE_SIZE, timeout=1)
+    except Exception as error:  # didn't work so try other ports
+        logger.warning("Port access error: %s", error)
+        return None
+
+
+def auto_find_com_port(device_name: str):
+    """ Open the first USB-UART port that works, in the order the ports are listed.  These
+    devices do not answer an ID command so the port is only checked by opening it """
+    ports = sorted(port_discovery.list_ports(is_serial_adapter))
+    logger.info("possible ports: %s", ports)
+    return port_discovery.find_device(device_name, open_port, ports,
+                                      release=lambda device: device.close(), checks_id=False)
+
+
+class SerialSweeper:
+    """ Read a sensor at a range of integration times.  The read commands are sent
+    ahead of the replies, as many as fit in the device's RX_BUFFER_SIZE byte buffer, so
+    the device starts each read as soon as the last one is done and the host does not
+    wait on a round trip between reads.  The classes using this have to have a write
+    method and a read_reply(sensor_tag, timeout) method that returns an AS726XRead, or
+    None if the read is not sent in timeout seconds """
+    use_auto_gain = False  # set the gain with calibrate before each sweep
+
+    def calibrate(self, sensor_tag: bytes):
+        """ Set the gain of the sensor before a sweep, override for devices that can """
+        pass
+
+    def sweep(self, commands: list, int_times: list, sensor_tag: bytes,
+              progress=None) -> SweepResult:
+        """ Send the read commands and parse the replies as they come in
+        :param commands: the read command for each integration time
+        :param int_times: integration time of each command
+        :param sensor_tag: sensor name the replies are tagged with, e.g. b"AS7262"
+        :param progress: function called with the integration time after each read
+        :raises TimeoutError: if a read is not sent in REPLY_TIMEOUT seconds
+        """
+        if self.use_auto_gain:
+            self.calibrate(sensor_tag)
+        in_flight = deque()  # size of the commands sent that have not been answered
+        commands = deque(commands)
+        reads = []
+        for int_time in int_times:
+            while commands and (not in_flight or
+                                sum(in_flight) + command_size(commands[0]) <= RX_BUFFER_SIZE):
+                in_flight.append(command_size(commands[0]))
+                self.write(commands.popleft())
+            read = self.read_reply(sensor_tag, REPLY_TIMEOUT)
+            if read is None:
+                raise TimeoutError("No {0} read at integration time {1} in {2} s".format(
+                    sensor_tag.decode("utf-8", "replace"), int_time, REPLY_TIMEOUT))
+            in_flight.popleft()
+            reads.append(read)
+            if progress:
+                progress(int_time)
+        return make_sweep_result(int_times, reads)
+
+
+def command_size(command) -> int:
+    """ Number of bytes a command takes in the device buffer, with the carriage return write adds """
+    if isinstance(command, str):
+        command = command.encode()
+    return len(command) + 1
+
+
+def make_sweep_result(int_times, reads: list) -> SweepResult:
+    data = np.array([read.norm_data for read in reads], dtype=float)
+    raw_data = np.array([read.raw_data if read.raw_data is not None else read.calibrated_data
+                         for read in reads], dtype=float)
+    saturated = auto_gain.is_saturated(raw_data)
+    return SweepResult(np.asarray(int_times), data, raw_data, saturated, reads)
+
+
+class WiPySerial(SerialSweeper):
+    use_auto_gain = True
+
+    def __init__(self, master, sort_index=None, device=None):
         self.master = master
-        self.device = self.auto_find_com_port()
+        self.device = device or transport.wrap(auto_find_com_port("WiPy"), "WiPy")
         self.read_all()
         self.gain = 1
         self.reading = False
         self.data_packet = None
         self.sort_index = sort_index
 
-    @staticmethod
-    def auto_find_com_port():
-        available_ports = serial.tools.list_ports
-        # print(available_ports)
-        for port in available_ports.comports():  # type: serial.Serial
-            print("port:", port, DESCRIPTOR_NAME_WIN1 in port.description)
-            print('check: ', DESCRIPTOR_NAME_WIN1, port.description)
-            print(port.device)
-            print(port.name)
-            print('desc:', port.description)
-            if (DESCRIPTOR_NAME_WIN1 in port.description or DESCRIPTOR_NAME_MAC in port.description or
-                    DESCRIPTOR_NAME_WIN2 in port.description):
-                try:
-                    print("Port found: ", port)
-
-                    device = serial.Serial(port.device, baudrate=BAUD_RATE, stopbits=STOP_BITS,
-                                           parity=PARITY, bytesize=BYTE_SIZE, timeout=1)
-                    return device  # a device could connect without an error so return
-                except Exception as error:  # didn't work so try other ports
-                    print("Port access error: ", error)
-
     def is_connected(self):
         return self.device
 
@@ -66,83 +160,80 @@ class WiPySerial:
         try:
             data_packet = self.device.readall()
             data_packets = data_packet.split(b'\r\n')
-            print(data_packets)
+            logger.debug("read all: %s", data_packets)
             return data_packets
         except:
-            print("Error Reading")
+            logger.error("Error Reading")
 
     def write(self, message):
         if type(message) is str:
             message = message.encode()
-        print('writing message: ', message)
+        logger.debug("writing message: %s", message)
         self.device.write(message+b'\r')
 
     def read_as7262(self):
         self.write(b"AS7262_read()")
         return self.read_single_data_read(b"AS7262")
 
-    def read_as7262_read_range(self):
-        data = {}
-        for int_time in [50, 100, 150, 200, 250]:
-            self.write(b"AS7262_read(%d)" % int_time)
-            data[int_time] = self.read_single_data_read(b"AS7262")
-        return data
+    def read_as7262_read_range(self, int_times=INT_TIMES_AS7262) -> SweepResult:
+        return self.sweep([b"AS7262_read(%d)" % int_time for int_time in int_times],
+                          int_times, b"AS7262")
 
-    def read_single_data_read(self, sensor_tag: str):
+    def read_single_data_read(self, sensor_tag: str, timeout=None):
+        """ Read lines till the end of a read of sensor_tag
+        :param timeout: seconds to wait for the read, None to wait till it is sent
+        :return: AS726XRead, or None if the read was not sent in time """
         self.reading = True
-
-        while True:
-            dataline = self.device.readline()
-            print('dataline: ', dataline)
-            # print ((b'%s START READ' % sensor_tag) in dataline))
-            if (b'%s START READ' % sensor_tag) in dataline:
-                self.data_packet = AS726XRead("AS7265X", self.sort_index)
-            elif (b'%s RAW DATA:' % sensor_tag) in dataline:
-                raw_data = self.parse_data_str(dataline)
-                self.data_packet.add_raw_data(raw_data)
-
-            elif (b'%s CAL DATA:' % sensor_tag) in dataline:
-                self.data_packet.add_cal_data(self.parse_data_str(dataline))
-            elif b'integration cycles:' in dataline:
-                _int, gain = self.parse_int_n_gain(dataline)
+        # only return a read started in this call, not one left from an earlier reply
+        self.data_packet = None
+        deadline = time.monotonic() + timeout if timeout else None
+        while not deadline or time.monotonic() < deadline:
+            kind, values = WIPY_READ_PARSER.parse(self.device.readline())
+            if kind == "start" and values[0] == sensor_tag:
+                self.data_packet = AS726XRead(sensor_tag, self.sort_index)
+            elif self.data_packet is None:
+                continue  # the rest of a reply that was not started in this call
+            elif kind == "raw_data" and values[0] == sensor_tag:
+                self.data_packet.add_raw_data(values[1])
+            elif kind == "cal_data" and values[0] == sensor_tag:
+                self.data_packet.add_cal_data(values[1])
+            elif kind == "settings":
+                _int, gain = values
                 self.data_packet.add_gain_n_integration(gain, _int)
-            elif b'END READ' in dataline:
+            elif kind == "end":
                 return self.data_packet
-
-    @staticmethod
-    def parse_data_str(data_str):
-        data_str = data_str.split(b'[')[1].split(b']')[0]
-        return [float(x) for x in data_str.split(b',')]
-
-    @staticmethod
-    def parse_int_n_gain(settings_str):
-        num_str = settings_str.split(b'|')
-        return int(num_str[1]), float(num_str[3])
+        return None
+
+    read_reply = read_single_data_read
+
+    def read_raw_data(self, max_lines=10):
+        """ Read the lines of a read through its END READ line, so none of it is left for
+        the next read, and return its raw data, or None if it is not sent """
+        raw_data = None
+        for _ in range(max_lines):
+            kind, values = WIPY_READ_PARSER.parse(self.device.readline())
+            if kind == "raw_data":
+                raw_data = values[1]
+            elif kind == "end":
+                break
+        return raw_data
+
+    def calibrate(self, sensor_tag: bytes):
+        if sensor_tag == b"AS7262":
+            self.calibrate_as7262()
 
     def calibrate_as7262(self):
-        print('start')
-        self.write(b"AS7262_calibrate()")
-        time.sleep(1)
-        packets = self.read_all()
-        for packet in packets:
-            if b'RAW DATA: ' in packet:
-                data_pts = re.split(b"[[\],]", packet)[1:-1]
-                raw_data = [int(i) for i in data_pts]
-                print(raw_data, max(raw_data))
-                if max(raw_data) < (10000/64):
-                    # set gain to 64
-                    self.gain = 64
-                    self.device.write(b'as7262.set_gain(3)')
-                elif max(raw_data) < (10000/16):
-                    # set gain to 16
-                    self.gain = 16
-                    self.device.write(b'as7262.set_gain(2)')
-                elif max(raw_data) < (10000/3.7):
-                    # set gain to 3.7
-                    self.gain = 3.7
-                    self.device.write(b'as7262.set_gain(1)')
-                time.sleep(0.2)
-                self.read_all()
+        """ Set the AS7262 gain so the brightest channel is near auto_gain.TARGET_COUNTS """
+        def read_counts():
+            self.write(b"AS7262_calibrate()")
+            return self.read_raw_data()
+
+        def set_gain(gain, _int_time):
+            self.gain = gain
+            self.write(b"as7262.set_gain(%d)" % auto_gain.GAINS.index(gain))
+        # the integration time is set with each read command so only the gain is changed here
+        auto_gain.auto_expose(read_counts, set_gain, self.gain, 1)
+        logger.info("AS7262 gain set to: %s", self.gain)
 
 
 class AS726XRead:
@@ -167,79 +258,60 @@ class AS726XRead:
     def add_raw_data(self, raw_data):
         self.raw_data = raw_data
         if self.sort_index:
-            print('sorting')
             # self.raw_data = [raw_data[i] for i in self.sort_index]
+            pass
         else:
             self.raw_data = raw_data
-        print('sorting data: ', raw_data)
-        print(self.raw_data)
+        logger.debug("raw data: %s", self.raw_data)
 
     def add_cal_data(self, cal_data):
-        print('type: ', self.type)
         self.calibrated_data = cal_data
         if self.sort_index:
             # self.calibrated_data = [cal_data[i] for i in self.sort_index]
             pass
         else:
             self.calibrated_data = cal_data
-        print('add cal data', self.calibrated_data)
+        logger.debug("%s calibrated data: %s", self.type, self.calibrated_data)
 
     def print_data(self, with_header=False):
         # print(self.type, self.gain, self.integration_cycles, self.norm_data)
         if with_header:
-            print("Sensor, Gain, int cycles")
+            logger.info("Sensor, Gain, int cycles")
         return ('{0}, {1}, {2}, ' #  Raw data, {3}, '
                 'Calibrated data, {3}'.format(self.type, self.gain,
                                               self.integration_cycles,
                                               # ', '.join(str(x) for x in self.raw_data),
                                               ', '.join(str(x) for x in self.norm_data)))
 
+    def __str__(self):
+        # so the reads can be passed to the loggers and only formatted if they are logged
+        return self.print_data()
+
     @staticmethod
     def normalize_data(spectral_data, int_time):
-        norm_data = [(x * 1000 / (int_time * 2.8)) for x in spectral_data]
-        return norm_data
+        # int_time is in cycles of 2.8 ms, scale the data to a 1 second read
+        return conversions.normalize_counts(spectral_data, int_time * 2.8, 1000)
 
 
-class ArduinoSerial:
-    def __init__(self, master, sort_index=None):
+class ArduinoSerial(SerialSweeper):
+    def __init__(self, master, sort_index=None, device=None):
         self.master = master
-        self.device = self.auto_find_com_port()
+        self.device = device or transport.wrap(auto_find_com_port("Arduino serial"),
+                                               "ArduinoSerial")
         self.read_all()
         self.gain = 1
         self.reading = False
         self.data_packet = None
         self.sort_index = sort_index
 
-    @staticmethod
-    def auto_find_com_port():
-        available_ports = serial.tools.list_ports
-        print('=======')
-        print(available_ports)
-        for port in available_ports.comports():  # type: serial.Serial
-            print("port:", port, DESCRIPTOR_NAME_WIN1 in port.description)
-            print('check: ', DESCRIPTOR_NAME_WIN1, port.description)
-            print(port.device)
-            print(port.name)
-            print('desc:', port.description)
-            if (DESCRIPTOR_NAME_WIN1 in port.description or DESCRIPTOR_NAME_MAC in port.description or
-                    DESCRIPTOR_NAME_WIN2 in port.description):
-                try:
-                    print("Port found: ", port)
-
-                    device = serial.Serial(port.device, baudrate=BAUD_RATE, stopbits=STOP_BITS,
-                                           parity=PARITY, bytesize=BYTE_SIZE, timeout=1)
-                    return device  # a device could connect without an error so return
-                except Exception as error:  # didn't work so try other ports
-                    print("Port access error: ", error)
-
     def read_all(self):
         try:
             data_packet = self.device.readall()
             data_packets = data_packet.split(b'\r\n')
-            print(data_packets)
+            logger.debug("read all: %s", data_packets)
             return data_packets
         except:
-            print("Error Reading")
+            logger.error("Error Reading")
 
     def is_connected(self):
         return self.device
@@ -248,30 +320,31 @@ class ArduinoSerial:
         self.write("R")
         return(self.read_data(b"AS7262"))
 
-    def read_data(self, type):
-        data = b""
-        print('====================START')
-        while b"DONE" not in data:
-            data = self.device.readline()
-            print('data: ', data)
-            if b"Data:" in data:
+    def read_data(self, type, timeout=None):
+        """ Read lines till the end of a read
+        :param timeout: seconds to wait for the read, None to wait till it is sent
+        :return: AS726XRead, or None if the read was not sent in time """
+        data_pkt = None
+        kind = None
+        deadline = time.monotonic() + timeout if timeout else None
+        while kind != "done":
+            if deadline and time.monotonic() >= deadline:
+                return None
+            kind, values = ARDUINO_READ_PARSER.parse(self.device.readline())
+            if kind == "data":
                 data_pkt = AS726XRead(type, self.sort_index)
-                cal_data = data.split(b':')[1].split(b',')
-                cal_data = [float(x) for x in cal_data]
-                data_pkt.add_cal_data(cal_data)
-
-            elif b"Gain:" in data:
-                gain_data_pre = data.split(b':')
-                gain = int(gain_data_pre[1].split(b'|')[0])
-                int_time = int(gain_data_pre[2].split(b'\r')[0])
+                data_pkt.add_cal_data(values[0])
+            elif kind == "settings":
+                gain, int_time = values
                 data_pkt.add_gain_n_integration(gain, int_time)
-        print('====================END')
         return data_pkt
 
+    read_reply = read_data
+
     def write(self, message):
         if type(message) is str:
             message = message.encode()
-        print('writing message: ', message)
+        logger.debug("writing message: %s", message)
         self.device.write(message + b'\r')
 
 
@@ -0,0 +1,198 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Columnar store of all the reads of a session.  The reads are collected in small numpy
+arrays and appended to a folder of memory mapped .npy files every SAVE_EVERY reads, so
+the data can be analyzed without parsing the csv files.  The files grow by doubling, so
+each read is only written once or twice, and the number of saved reads is written last
+(to a temporary file that replaces the old one), so a crash in the middle of a save
+leaves the arrays it had saved before.
+
+To load a session:
+    session = session_store.load("Data/2019-10-18_AS7265x_session")
+    session["data"]  # reads x wavelengths array
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import atexit
+import os
+import threading
+import time
+# installed libraries
+import numpy as np
+from numpy.lib.format import open_memmap
+
+INITIAL_CAPACITY = 256  # number of reads to make room for in the files, doubles when filled
+SAVE_EVERY = 50  # number of reads between saving the session to disk
+SIZE_FILE = "size.npy"  # number of reads saved, the files can have room for more
+
+# name and type of the arrays saved along with the read data, 1 value per read
+COLUMNS = [("leaf", np.int32), ("read", np.int32), ("gain", np.float32),
+           ("int_cycles", np.int32), ("led", "U16"), ("led_current", np.float32),
+           ("time", np.float64)]
+
+_stores = []  # every store made, so they can all be saved when the program exits
+
+
+class SessionStore:
+    def __init__(self, wavelengths, folder: str, capacity=INITIAL_CAPACITY):
+        self.folder = folder
+        self.wavelengths = np.asarray(wavelengths)
+        self.capacity = capacity  # number of reads the files have room for
+        self.size = 0  # number of reads saved to the files
+        self.unsaved_reads = 0
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        # reads waiting to be saved
+        self.data = np.zeros((SAVE_EVERY, len(self.wavelengths)), dtype=np.float32)
+        self.columns = {name: np.zeros(SAVE_EVERY, dtype=dtype)
+                        for name, dtype in COLUMNS}
+        self.files = None  # name: memory mapped array, opened with the first save
+        _stores.append(self)
+
+    def append(self, data, leaf, read, gain, int_cycles, led, led_current,
+               timestamp=None):
+        """ Add a read, led_current is the string of the setting e.g. "12.5 mA" """
+        if isinstance(led, bytes):
+            led = led.decode("utf-8", "replace")
+        with self.lock:
+            if self.unsaved_reads == self.data.shape[0]:
+                self.grow()  # the last save did not finish yet
+            i = self.unsaved_reads
+            self.data[i] = data
+            self.columns["leaf"][i] = leaf
+            self.columns["read"][i] = read
+            self.columns["gain"][i] = gain
+            self.columns["int_cycles"][i] = int_cycles
+            self.columns["led"][i] = led
+            self.columns["led_current"][i] = convert_current(led_current)
+            self.columns["time"][i] = timestamp if timestamp else time.time()
+            self.unsaved_reads += 1
+        if self.unsaved_reads >= SAVE_EVERY:
+            self.save()
+
+    def grow(self):
+        """ Double the room for the reads waiting to be saved """
+        capacity = 2 * self.data.shape[0]
+        new_data = np.zeros((capacity, self.data.shape[1]), dtype=self.data.dtype)
+        new_data[:self.unsaved_reads] = self.data[:self.unsaved_reads]
+        self.data = new_data
+        for name, column in self.columns.items():
+            new_column = np.zeros(capacity, dtype=column.dtype)
+            new_column[:self.unsaved_reads] = column[:self.unsaved_reads]
+            self.columns[name] = new_column
+
+    def save(self):
+        """ Append the reads waiting to be saved to the session files """
+        with self.save_lock:
+            with self.lock:
+                count = self.unsaved_reads
+                if not count:
+                    return
+                data = self.data[:count].copy()
+                columns = {name: column[:count].copy()
+                           for name, column in self.columns.items()}
+                self.unsaved_reads = 0
+            if self.files is None:
+                self.open_files()
+            if self.size + count > self.capacity:
+                capacity = self.capacity
+                while capacity < self.size + count:
+                    capacity *= 2
+                self.resize_files(capacity)
+            new_reads = slice(self.size, self.size + count)
+            self.files["data"][new_reads] = data
+            for name, column in columns.items():
+                self.files[name][new_reads] = column
+            for array in self.files.values():
+                array.flush()
+            self.size += count
+            # the reads only count as saved when the size is, after all the arrays have them
+            atomic_save(os.path.join(self.folder, SIZE_FILE), np.array(self.size))
+
+    def array_types(self):
+        """ :return: dict of name: (shape of 1 read, dtype) of each array saved """
+        types = {"data": ((len(self.wavelengths),), np.float32)}
+        types.update({name: ((), dtype) for name, dtype in COLUMNS})
+        return types
+
+    def open_files(self):
+        """ Open the session files, if the folder already has a session (e.g. the program
+        was started again on the same day) the reads are added after its reads """
+        os.makedirs(self.folder, exist_ok=True)
+        if os.path.exists(os.path.join(self.folder, SIZE_FILE)):
+            self.reopen_files()
+            return
+        atomic_save(os.path.join(self.folder, "wavelengths.npy"), self.wavelengths)
+        self.files = dict()
+        for name, (shape, dtype) in self.array_types().items():
+            self.files[name] = open_memmap(os.path.join(self.folder, name + ".npy"), mode="w+",
+                                           dtype=dtype, shape=(self.capacity,) + shape)
+
+    def reopen_files(self):
+        self.size = int(np.load(os.path.join(self.folder, SIZE_FILE)))
+        self.files = {name: open_memmap(os.path.join(self.folder, name + ".npy"), mode="r+")
+                      for name in self.array_types()}
+        # a crash while the files were being resized can leave them different sizes
+        self.capacity = min(array.shape[0] for array in self.files.values())
+
+    def resize_files(self, capacity: int):
+        """ Copy the saved reads to bigger files, each is made as a temporary file
+        that replaces the old file when it is finished """
+        for name, (shape, dtype) in self.array_types().items():
+            filename = os.path.join(self.folder, name + ".npy")
+            temp_filename = filename + ".tmp"
+            new_file = open_memmap(temp_filename, mode="w+", dtype=dtype,
+                                   shape=(capacity,) + shape)
+            new_file[:self.size] = self.files[name][:self.size]
+            new_file.flush()
+            # the files have to be unmapped before they can be replaced on windows
+            del new_file
+            self.files[name] = None
+            os.replace(temp_filename, filename)
+            self.files[name] = open_memmap(filename, mode="r+")
+        self.capacity = capacity
+
+
+def atomic_save(filename: str, array):
+    """ Save an array to a temporary file and then replace filename with it """
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as file:
+        np.save(file, array)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filename, filename)
+
+
+def convert_current(led_current) -> float:
+    """ Change a LED current setting string such as "12.5 mA" to a number of mA,
+    or NaN if the current is not known """
+    try:
+        return float(str(led_current).split()[0])
+    except (ValueError, IndexError):
+        return float("nan")
+
+
+def save_all():
+    for store in _stores:
+        store.save()
+
+
+# make sure the last reads are saved when the program exits
+atexit.register(save_all)
+
+
+def load(folder: str, mmap_mode='r') -> dict:
+    """ Load a saved session, by default the arrays are memory mapped so only the
+    parts used are read from the disk """
+    session = dict()
+    session["wavelengths"] = np.load(os.path.join(folder, "wavelengths.npy"))
+    size_filename = os.path.join(folder, SIZE_FILE)
+    # sessions saved before the size file was added have no unused room
+    size = int(np.load(size_filename)) if os.path.exists(size_filename) else None
+    for name in ["data"] + [name for name, _ in COLUMNS]:
+        array = np.load(os.path.join(folder, name + ".npy"), mmap_mode=mmap_mode)
+        session[name] = array[:size]
+    return session
@@ -14,6 +14,7 @@ from enum import Enum
 
 # installed libraries
 # local files
+import averaging
 import device_settings
 # import psoc_spectrometers
 import pyplot_embed
@@ -21,6 +22,8 @@ import reg_toplevel
 
 __author__ = 'Kyle Vitautas Lopin'
 
+logger = logging.getLogger(__name__)
+
 
 class DisplayTypes(Enum):
     counts = "Counts"
@@ -144,6 +147,21 @@ class ButtonFrame(tk.Frame):
         self.run_button = tk.Button(self, text="Start Reading", command=self.run_toggle)
         self.run_button.pack(side="top", pady=BUTTON_PADY)
 
+        tk.Label(self, text="Read period:").pack(side='top', pady=BUTTON_PADY)
+        tk.OptionMenu(self, settings.read_period_var,
+                      *device_settings.READ_RATE_MAP.keys()).pack(side='top', pady=BUTTON_PADY)
+
+        tk.Checkbutton(self, text="Auto gain", variable=self.settings.use_auto_gain
+                       ).pack(side="top", pady=BUTTON_PADY)
+
+        # options to average the reads before they are displayed
+        tk.Checkbutton(self, text="Average reads", variable=self.settings.average_reads,
+                       command=self.average_reads).pack(side="top", pady=BUTTON_PADY)
+        tk.OptionMenu(self, self.settings.average_mode_var,
+                      *averaging.AVERAGE_MODES).pack(side="top", pady=BUTTON_PADY)
+        tk.OptionMenu(self, self.settings.average_number_var,
+                      *[str(n) for n in averaging.AVERAGE_NUMBERS]).pack(side="top", pady=BUTTON_PADY)
+
         # button to save the data, this will open a toplevel with the data printed out, and an option to save to file
         tk.Button(self, text="Save Data", command=self.save_data).pack(side="top", pady=BUTTON_PADY)
 
@@ -206,6 +224,7 @@ class ButtonFrame(tk.Frame):
         else:  # start reading
             # don't let the user do a single read when doing continous reads
             self.read_button.config(state=tk.DISABLED)
+            self.settings.graph = self.graph
             self.settings.reading.set(True)
 
             self.run_button.config(text="Stop Reading")
@@ -219,20 +238,22 @@ class ButtonFrame(tk.Frame):
         self.read_button.config(state=tk.ACTIVE)
 
     def average_reads(self):
-        """ Not implemented yet """
-        print("average read: ", self.settings.average_reads.get())
+        """ Turn averaging on or off, start the average over either way """
+        logger.debug("average reads: %s", self.settings.average_reads.get())
+        self.settings.averager.reset()
 
     def read_once(self):
         """
         Take a single sensor read
         """
         self.read_button.config(state=tk.DISABLED)
-        logging.debug("read once with flash: {0}".format(self.use_flash.get()))
-        self.settings.single_read(self.graph, self.use_flash.get())
-        self.read_button.config(state=tk.ACTIVE)
+        logger.debug("read once with flash: %s", self.use_flash.get())
+        # the read is done in the background, turn the button back on when it is finished
+        self.settings.single_read(self.graph, self.use_flash.get(),
+                                  callback=lambda _data: self.read_button.config(state=tk.ACTIVE))
 
     def read_just_data(self):
-        self.settings.device.read_data()
+        self.settings.device.read_data(self.graph)
 
     def save_data(self):
         """
@@ -241,7 +262,7 @@ class ButtonFrame(tk.Frame):
         self.graph.data.save_data()
 
     def toggle_display_type(self, *args):
-        logging.debug("Changing display type to: {0}".format(self.display_type.get()))
+        logger.debug("Changing display type to: %s", self.display_type.get())
         self.graph.change_data_units(self.display_type.get())
 
 
@@ -290,7 +311,7 @@ class StatusFrame(tk.Frame):
 
 
     def device_connection_test(self, *args):
-        logging.debug("Checking the status of the device")
+        logger.debug("Checking the status of the device")
 
         psoc_spectrometers.ConnectionStatusToplevel(self.master, self.status_str)
 
@@ -0,0 +1,306 @@
+# Copyright (c) 2019 Kyle Lopin (Naresuan University) <kylel@nu.ac.th>
+
+"""
+Record the bytes sent to and from a device to a file, and replay a recording through
+the same interface as the device so the program can be run without the hardware.
+
+To record, set RECORD_FOLDER and every port opened by arduino.Arduino,
+serial_comm.WiPySerial / ArduinoSerial and usb_comm.PSoC_USB is saved to a new
+file in it.  To replay, open the recording and give it to the class in place of
+the device:
+    device = transport.open_replay("recordings/Arduino_2019-10-18_10-00-00.rec", speed=100)
+    arduino.ArduinoColorSensors(master, device=device)
+
+File format: a header line of b"SGTR1 <serial or usb>\\n", then a record for every
+read and write: time since the start (float64), direction (b"r" or b"w"),
+number of bytes (uint32), all little endian, then the bytes.
+"""
+
+__author__ = "Kyle Vitatus Lopin"
+
+# standard libraries
+import array
+from datetime import datetime
+import os
+import struct
+import threading
+import time
+
+RECORD_FOLDER = None  # folder to record the device sessions to, None to not record
+MAGIC = b"SGTR1"
+SERIAL = b"serial"
+USB = b"usb"
+READ = b"r"
+WRITE = b"w"
+RECORD_HEADER = struct.Struct("<dcI")
+
+
+class Recorder:
+    """ Write the records of 1 device session to a file """
+    def __init__(self, filename: str, kind=SERIAL):
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC + b" " + kind + b"\n")
+        self.start_time = time.monotonic()
+        self.lock = threading.Lock()  # the reader and writer threads can both record
+
+    def record(self, direction: bytes, data):
+        if not data:
+            return
+        data = bytes(data)
+        with self.lock:
+            self.file.write(RECORD_HEADER.pack(time.monotonic() - self.start_time,
+                                               direction, len(data)))
+            self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_recording(filename: str):
+    """ Load a recording
+    :return: (kind of device, list of (time, direction, bytes) records) """
+    with open(filename, 'rb') as _file:
+        header = _file.readline().split()
+        if not header or header[0] != MAGIC:
+            raise ValueError("{0} is not a device recording".format(filename))
+        kind = header[1]
+        records = []
+        while True:
+            record_header = _file.read(RECORD_HEADER.size)
+            if len(record_header) < RECORD_HEADER.size:
+                break
+            timestamp, direction, length = RECORD_HEADER.unpack(record_header)
+            records.append((timestamp, direction, _file.read(length)))
+    return kind, records
+
+
+def make_filename(name: str) -> str:
+    os.makedirs(RECORD_FOLDER, exist_ok=True)
+    return os.path.join(RECORD_FOLDER, "{0}_{1}.rec".format(
+        name, datetime.now().strftime("%Y-%m-%d_%H-%M-%S")))
+
+
+def wrap(device, name: str):
+    """ Record the device if RECORD_FOLDER is set, else return the device as it is
+    :param device: an open serial.Serial or pyusb device
+    :param name: name to start the recording file name with
+    """
+    if not RECORD_FOLDER or device is None or isinstance(device, (ReplaySerial, ReplayUSB)):
+        return device
+    if hasattr(device, "readline"):
+        return RecordingSerial(device, make_filename(name))
+    return RecordingUSB(device, make_filename(name))
+
+
+class RecordingSerial:
+    """ serial.Serial that saves all the bytes read and written """
+    def __init__(self, device, filename: str):
+        self.__dict__["device"] = device
+        self.__dict__["recorder"] = Recorder(filename, SERIAL)
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.device, name, value)  # e.g. the timeout
+
+    def read(self, size=1):
+        data = self.device.read(size)
+        self.recorder.record(READ, data)
+        return data
+
+    def readline(self, *args):
+        data = self.device.readline(*args)
+        self.recorder.record(READ, data)
+        return data
+
+    def readall(self):
+        data = self.device.readall()
+        self.recorder.record(READ, data)
+        return data
+
+    def read_all(self):
+        data = self.device.read_all()
+        self.recorder.record(READ, data)
+        return data
+
+    def write(self, data):
+        self.recorder.record(WRITE, data)
+        return self.device.write(data)
+
+    def close(self):
+        self.device.close()
+        self.recorder.close()
+
+
+class RecordingUSB:
+    """ pyusb device that saves all the packets read and written """
+    def __init__(self, device, filename: str):
+        self.device = device
+        self.recorder = Recorder(filename, USB)
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def read(self, endpoint, size, timeout=None):
+        data = self.device.read(endpoint, size, timeout)
+        self.recorder.record(READ, data)
+        return data
+
+    def write(self, endpoint, data, timeout=None):
+        if isinstance(data, str):
+            data = data.encode()
+        self.recorder.record(WRITE, data)
+        return self.device.write(endpoint, data, timeout)
+
+
+class Replay:
+    """ Give back the bytes read in a recording at the times they were read, sped up
+    by speed.  A speed of 0 gives everything back as fast as it is asked for.
+    What is written to the replay is ignored. """
+    def __init__(self, records, speed=1.0):
+        self.reads = [(timestamp, data) for timestamp, direction, data in records
+                      if direction == READ]
+        self.speed = speed
+        self.start_time = time.monotonic()
+        self.next_read = 0  # index of the next read record to give back
+        self.written = []  # what the program wrote, to check it in tests
+
+    def time_until(self, index) -> float:
+        """ Seconds till a read record is due, 0 if it is already due """
+        if not self.speed:
+            return 0
+        due = self.start_time + self.reads[index][0] / self.speed
+        return max(0., due - time.monotonic())
+
+    def finished(self) -> bool:
+        return self.next_read >= len(self.reads)
+
+
+class ReplaySerial(Replay):
+    def __init__(self, records, speed=1.0, port="replay"):
+        Replay.__init__(self, records, speed)
+        self.buffer = b""
+        self.timeout = None
+        self.port = port
+        self.name = port
+        self.is_open = True
+
+    def fill_buffer(self, wait=0.):
+        """ Move the records that are due to the buffer, waiting up to wait seconds for one """
+        deadline = time.monotonic() + wait
+        added = False
+        while not self.finished():
+            delay = self.time_until(self.next_read)
+            if delay > 0:
+                remaining = deadline - time.monotonic()
+                if added or remaining <= 0:
+                    return
+                time.sleep(min(delay, remaining))
+                continue
+            self.buffer += self.reads[self.next_read][1]
+            self.next_read += 1
+            added = True
+        # the recording is over, act like a device that is not sending anything
+        remaining = deadline - time.monotonic()
+        if remaining > 0 and not self.buffer:
+            time.sleep(remaining)
+
+    @property
+    def in_waiting(self):
+        self.fill_buffer()
+        return len(self.buffer)
+
+    def _wait_time(self):
+        return self.timeout if self.timeout is not None else 1.0
+
+    def read(self, size=1):
+        deadline = time.monotonic() + self._wait_time()
+        self.fill_buffer()
+        while len(self.buffer) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.fill_buffer(remaining)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        deadline = time.monotonic() + self._wait_time()
+        self.fill_buffer()
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.fill_buffer(remaining)
+        end = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def readall(self):
+        self.fill_buffer(self._wait_time())
+        data, self.buffer = self.buffer, b""
+        return data
+
+    def read_all(self):
+        self.fill_buffer()
+        data, self.buffer = self.buffer, b""
+        return data
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.written.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    reset_input_buffer = flushInput
+    reset_output_buffer = flushOutput
+    out_waiting = 0
+
+    def close(self):
+        self.is_open = False
+
+
+class ReplayUSB(Replay):
+    """ Each read gives back 1 recorded packet """
+    def read(self, endpoint, size, timeout=None):
+        if self.finished():
+            raise IOError("Replay finished")
+        delay = self.time_until(self.next_read)
+        if timeout and delay > timeout / 1000.:
+            time.sleep(timeout / 1000.)
+            raise IOError("Operation timed out")
+        time.sleep(delay)
+        data = self.reads[self.next_read][1]
+        self.next_read += 1
+        return array.array('B', data)
+
+    def write(self, endpoint, data, timeout=None):
+        if isinstance(data, str):
+            data = data.encode()
+        self.written.append(data)
+        return len(data)
+
+    def set_configuration(self):
+        pass
+
+
+def open_replay(filename: str, speed=1.0):
+    """ Open a recording to use in place of a device
+    :param speed: how many times faster than recorded to replay, 0 for as fast as possible
+    :return: ReplaySerial or ReplayUSB depending on what was recorded
+    """
+    kind, records = read_recording(filename)
+    if kind == USB:
+        return ReplayUSB(records, speed)
+    return ReplaySerial(records, speed, port=filename)
@@ -3,6 +3,7 @@
 """ Classes to communication with a spectrophotometer"""
 
 # standard libraries
+from collections import deque
 from enum import Enum
 import glob
 import logging
@@ -12,17 +13,16 @@ import serial
 import struct
 import sys
 import threading
-import time
-
 import time
 # installed libraries
-import usb
-import usb.core
-import usb.util
-import usb.backend
+# usb (pyUSB) is imported in connect_usb, only the PSoC needs it
 
 # local files
+import port_discovery
 import psoc_spectrometers
+import transport
+
+logger = logging.getLogger(__name__)
 
 PSOC_ID_MESSAGE = "PSoC-Spectrometer"
 NO_SENSOR_ID_MESSAGE = "No Sensor"
@@ -33,6 +33,12 @@ BOTH__ID_MESSAGE = "Both AS726X"
 END_CHAR = '\r'
 
 USB_DATA_BYTE_SIZE = 40
+FLOAT32_FRAME_SIZE = 25  # 6 float32 channels and 1 error byte
+FLOAT32_FORMAT = '>ffffffB'
+DEFAULT_TIMEOUT = 3000  # milliseconds to wait for a response
+INTER_BYTE_TIMEOUT = 0.02  # seconds without a new byte that ends a message with no set length
+TIMING_SAMPLES = 100  # number of the latest round trip times to keep for each command
+STREAM_BUFFER_SIZE = 64  # number of streamed frames to hold for the main program
 IN_ENDPOINT = 0x81
 OUT_ENDPOINT = 0x02
 
@@ -54,8 +60,10 @@ class DeviceTypes(Enum):
 
 class PSoC_USB(object):
     def __init__(self, master, queue: queue.Queue, event: threading.Event(),
-                 termination_flag: bool,
-                 vendor_id=0x04B4, product_id=0x8051):
+                 termination_flag: threading.Event,
+                 vendor_id=0x04B4, product_id=0x8051, device=None):
+        """ :param device: open device or transport replay to use, if None the PSoC is looked
+        for on the USB and then the serial ports """
         self.master_device = master
         self.usb_device_found = False
         self.found = False
@@ -63,11 +71,23 @@ class PSoC_USB(object):
         self.connected = False
         self.spectrometer = None
         self.received_message = "No device"
-        self.device = self.connect_usb(vendor_id, product_id)
-        # if the usb was not found
-        if not self.usb_device_found:
-            logging.info("No USB device find, looking for serial")
-            self.device = self.connect_serial()
+        # round trip times of the commands, in seconds
+        self.timings = dict()
+        self.last_command = None
+        self.last_write_time = None
+        # hold to write a command and read its response without another thread writing in between
+        self.io_lock = threading.RLock()
+        if device:
+            self.device = device
+            self.found = True
+            self.device_type = DeviceTypes.serial if hasattr(device, "readline") else DeviceTypes.usb
+        else:
+            self.device = self.connect_usb(vendor_id, product_id)
+            # if the usb was not found
+            if not self.usb_device_found:
+                logger.info("No USB device find, looking for serial")
+                self.device = self.connect_serial()
+            self.device = transport.wrap(self.device, "PSoC")
 
         if not self.device:
             # no device was found so just return and dont try a connection test
@@ -80,6 +100,7 @@ class PSoC_USB(object):
         self.data_aquire_thread = ThreadedUSBDataCollector(self, master, self.data_queue,
                                                            self.data_ready_event,
                                                            termination_flag)
+        self.data_aquire_thread.start()
 
     def connect_usb(self, vendor_id, product_id):
         """
@@ -94,19 +115,23 @@ class PSoC_USB(object):
         :param product_id: the USB product id
         :return: USB device that can use the pyUSB API if found, else returns None if not found
         """
-        dev = usb.core.find(find_all=True)
+        try:
+            import usb.core
+        except ImportError:
+            logger.warning("pyusb not installed, can only look for the PSoC on the serial ports")
+            return None
         # for cfg in dev:
         #     print(cfg)
         device = usb.core.find(idVendor=vendor_id, idProduct=product_id)
         if device is None:
-            logging.info("Device not found")
+            logger.info("Device not found")
             return None
         else:  # device was found
-            logging.info("PSoC found")
+            logger.info("PSoC found")
             self.usb_device_found = True
             self.found = True
             self.device_type = DeviceTypes.usb
-            logging.info("Device type: {0}".format(self.device_type))
+            logger.info("Device type: %s", self.device_type)
 
         # set the active configuration. the pyUSB module deals with the details
         device.set_configuration()
@@ -124,17 +149,17 @@ class PSoC_USB(object):
         # first test if the PSoC is connected correctly
         self.usb_write("ID")  # device should identify itself; only the first I is important
         received_message = self.usb_read_data(encoding='string')
-        logging.debug('Received identifying message: {0}'.format(received_message))
+        logger.debug("Received identifying message: %s", received_message)
         if received_message != PSOC_ID_MESSAGE:
             # set the connected state to false if the device is not working properly
-            logging.debug("PSoC send wrong message")
+            logger.debug("PSoC send wrong message")
             self.connected = False
             return
-        logging.debug("PSoC send correct message")
+        logger.debug("PSoC send correct message")
         # test for the spectrometer if the PSoC is connected
         self.usb_write('ID-Spectrometer')  # device will return string of the spectrometer it is connected to
         received_message = self.usb_read_data(encoding='string')
-        logging.debug('Received identifying message: {0}'.format(received_message))
+        logger.debug("Received identifying message: %s", received_message)
         self.sensor_message = received_message
         if received_message == "Both AS726X":
             self.spectrometer = ["AS7262", "AS7263"]
@@ -143,76 +168,85 @@ class PSoC_USB(object):
         else:
             self.spectrometer = [received_message[0:6]]
 
-        logging.info("sensors attached: {0}".format(received_message))
+        logger.info("sensors attached: %s", received_message)
 
     def connect_serial(self):
         available_ports = find_available_ports()
-        logging.info("serial ports found: {0}".format(available_ports))
-        for port in available_ports:
-            try:
-
-                logging.info("writing to port: {0}".format(port.port))
-                device = serial.Serial(port.port, baudrate=BAUDRATE, stopbits=STOPBITS,
-                                       parity=PARITY, bytesize=BYTESIZE, timeout=1)
-                device.flushInput()
-                device.flushOutput()
-                sent_message = b"ID\r"
-                device.write(sent_message)
-
-                time.sleep(0.5)
-                from_device = device.read_all().decode("utf-8")
-                logging.info("From the device: {0}".format(from_device))
-                if from_device == PSOC_ID_MESSAGE:
-                    logging.info("Found serial device")
-                    self.found = True
-                    self.device_type = DeviceTypes.serial
-                    self.connected = True
-                    return device
-
-                device.close()
-
-            except Exception as exception:
-                # not the correct device
-                exc_type, exc_obj, exc_tb = sys.exc_info()
-                logging.info("No device at port: {0}".format(port))
-                logging.info("Exception: {0} at {1}".format(exception, exc_tb.tb_lineno))
+        logger.info("serial ports found: %s", available_ports)
+        device = port_discovery.find_device(PSOC_ID_MESSAGE, self.probe_serial_port,
+                                            available_ports, release=lambda _device: _device.close())
+        if device:
+            logger.info("Found serial device")
+            self.found = True
+            self.device_type = DeviceTypes.serial
+            self.connected = True
+        return device
+
+    @staticmethod
+    def probe_serial_port(port: str):
+        """ Check if the PSoC is on a serial port
+        :return: the opened serial port if the PSoC responded correctly, else None """
+        try:
+            logger.info("writing to port: %s", port)
+            device = serial.Serial(port, baudrate=BAUDRATE, stopbits=STOPBITS,
+                                   parity=PARITY, bytesize=BYTESIZE, timeout=1)
+            device.flushInput()
+            device.flushOutput()
+            sent_message = b"ID\r"
+            device.write(sent_message)
+
+            from_device = read_serial_message(device, num_bytes=len(PSOC_ID_MESSAGE),
+                                              timeout=500).decode("utf-8")
+            logger.info("From the device: %s", from_device)
+            if from_device == PSOC_ID_MESSAGE:
+                return device
+
+            device.close()
+
+        except Exception as exception:
+            # not the correct device
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            logger.info("No device at port: %s", port)
+            logger.info("Exception: %s at %s", exception, exc_tb.tb_lineno)
+        return None
 
     def usb_write(self, message, endpoint=OUT_ENDPOINT):
         # logging.debug("writing message: {0} with a device: {1}".format(message, self.device_type))
-        if self.device_type == DeviceTypes.usb:
-            self.usb_write_usb(message, endpoint=endpoint)
-        elif self.device_type == DeviceTypes.serial:
-            self.usb_write_serial(message)
+        with self.io_lock:
+            self.last_command = command_name(message)
+            self.last_write_time = time.monotonic()
+            if self.device_type == DeviceTypes.usb:
+                self.usb_write_usb(message, endpoint=endpoint)
+            elif self.device_type == DeviceTypes.serial:
+                self.usb_write_serial(message)
 
     def usb_write_serial(self, message):
         if not self.device:
-            logging.error("No device")
+            logger.error("No device")
             return
         try:
 
-            logging.debug("write to usb/uart: {0}{1}".format(message, END_CHAR))
+            logger.debug("write to usb/uart: %s%s", message, END_CHAR)
             self.device.write("{0}{1}".format(message, END_CHAR).encode('utf-8'))
-            while self.device.out_waiting != 0:
-                print(self.device.out_waiting)
+            self.device.flush()  # wait till the message is sent
 
         except Exception as error:
-            logging.error("USB writing error: {0}".format(error))
+            logger.error("USB writing error: %s", error)
             self.connected = False
 
     def usb_write_usb(self, message, endpoint=OUT_ENDPOINT):
-        time.sleep(0.1)
         if not self.device:
-            logging.error("No device")
+            logger.error("No device")
             return
         if not endpoint:
             endpoint = self.master_device.OUT_ENDPOINT
 
         try:
-            logging.debug("write to usb: {0}".format(message))
+            logger.debug("write to usb: %s", message)
             self.device.write(endpoint, message)
 
         except Exception as error:
-            logging.error("USB writing error: {0}".format(error))
+            logger.error("USB writing error: %s", error)
             # self.master_device.update_status("Device not connected")
             self.connected = False
             self.spectrometer = None
@@ -227,35 +261,40 @@ class PSoC_USB(object):
 
     def usb_read_data(self, num_bytes=USB_DATA_BYTE_SIZE,
                       endpoint=IN_ENDPOINT, encoding=None,
-                      timeout=3000):
+                      timeout=DEFAULT_TIMEOUT):
         if self.device_type == DeviceTypes.usb:
             return self.usb_read_data_usb(num_bytes, endpoint=endpoint,
                                           encoding=encoding, timeout=timeout)
 
         elif self.device_type == DeviceTypes.serial:
-            return self.usb_read_data_serial(encoding=encoding)
+            return self.usb_read_data_serial(encoding=encoding, timeout=timeout)
 
-    def usb_read_data_serial(self, encoding=None, timeout=3000):
+    def usb_read_data_serial(self, encoding=None, timeout=DEFAULT_TIMEOUT):
+        """ Read a message from the serial port, float32 data is read till the whole frame
+        is received, other messages till the device stops sending
+        :param timeout: milliseconds to wait for the message
+        """
         if not self.connected:
-            logging.info("not working")
+            logger.info("not working")
             return None
+        num_bytes = FLOAT32_FRAME_SIZE if encoding == "float32" else None
         try:
-            # usb_input = self.device.readline(timeout=1.0)  # TODO fix this
-            time.sleep(0.3)
-            usb_input = self.device.read_all()
-            logging.debug(usb_input)
+            usb_input = read_serial_message(self.device, num_bytes=num_bytes, timeout=timeout)
+            logger.debug(usb_input)
         except Exception as error:
-            logging.error("Failed data read")
+            logger.error("Failed data read")
             return None
+        if usb_input:
+            self.record_timing()
         if encoding == 'uint16':
             pass
             # return convert_uint8_uint16(usb_input)
         elif encoding == "float32":
-            if (len(usb_input)) == 25:
+            if (len(usb_input)) == FLOAT32_FRAME_SIZE:
                 # return struct.iter_unpack('f', usb_input)
-                return struct.unpack('>ffffffB', usb_input)
+                return struct.unpack(FLOAT32_FORMAT, usb_input)
             else:
-                logging.error("Error in reading")
+                logger.error("Error in reading")
         elif encoding == 'string':
             # change bytes to string and change to regular string not byte string
             return usb_input.decode("utf-8")
@@ -264,7 +303,7 @@ class PSoC_USB(object):
 
     def usb_read_data_usb(self, num_bytes=USB_DATA_BYTE_SIZE,
                           endpoint=IN_ENDPOINT, encoding=None,
-                          timeout=3000):
+                          timeout=DEFAULT_TIMEOUT):
         """ Read data from the usb and return it, if the read fails, log the miss and return None
         :param num_usb_bytes: number of bytes to read
         :param endpoint: hexidecimal of endpoint to read, has to be formatted as 0x8n where
@@ -274,33 +313,55 @@ class PSoC_USB(object):
         :return: array of the bytes read
         """
         if not self.connected:
-            logging.info("not working")
+            logger.info("not working")
             return None
         try:
             usb_input = self.device.read(endpoint, num_bytes, timeout)  # TODO fix this
-            logging.debug(usb_input)
+            logger.debug(usb_input)
         except Exception as error:
-            logging.error("Failed data read")
-            logging.error("No IN ENDPOINT: %s", error)
+            logger.error("Failed data read")
+            logger.error("No IN ENDPOINT: %s", error)
             return None
+        self.record_timing()
         if encoding == 'uint16':
             pass
             # return convert_uint8_uint16(usb_input)
         elif encoding == "float32":
             if (len(usb_input) % 4) == 0:
                 # return struct.iter_unpack('f', usb_input)
-                return struct.unpack('>ffffffB', usb_input)
+                return struct.unpack(FLOAT32_FORMAT, usb_input)
             else:
-                logging.error("Error in reading")
+                logger.error("Error in reading")
         elif encoding == 'string':
             # change bytes to string and change to regular string not byte string
-            return usb_input.tostring().decode("utf-8")
+            return usb_input.tobytes().decode("utf-8")
         else:  # no encoding so just return raw data
             return usb_input
 
-    def read_all_data(self):
-        # mock a data read now
-        return self.usb_read_data(num_bytes=24, encoding="float32")
+    def read_all_data(self, timeout=DEFAULT_TIMEOUT):
+        """ Read a data frame, waits up to timeout milliseconds for the sensor to finish """
+        with self.io_lock:
+            return self.usb_read_data(num_bytes=24, encoding="float32", timeout=timeout)
+
+    def record_timing(self):
+        """ Save the time from the last command being written to its response being read """
+        if not self.last_write_time:
+            return
+        if self.last_command not in self.timings:
+            self.timings[self.last_command] = deque(maxlen=TIMING_SAMPLES)
+        self.timings[self.last_command].append(time.monotonic() - self.last_write_time)
+        self.last_write_time = None  # only time the first response to a command
+
+    def get_timings(self) -> dict:
+        """ Get the round trip times, in milliseconds, of each command that got a response """
+        stats = dict()
+        for command, times in self.timings.items():
+            times = sorted(times)
+            stats[command] = {"count": len(times),
+                              "mean": 1000 * sum(times) / len(times),
+                              "p95": 1000 * times[int(0.95 * (len(times) - 1))],
+                              "max": 1000 * times[-1]}
+        return stats
 
     def start_reading(self):
         pass
@@ -309,71 +370,125 @@ class PSoC_USB(object):
 class ThreadedUSBDataCollector(threading.Thread):
     def __init__(self, device: PSoC_USB, master: 'psoc_spectrometers.BaseSpectrometer()',
                  data_queue: queue.Queue, data_event: threading.Event,
-                 function_call=None, termination_flag=False):
-        threading.Thread.__init__(self)
+                 termination_flag: threading.Event):
+        threading.Thread.__init__(self, daemon=True)
         self.device = device
         self.master = master
-        self.data_queue = data_queue
         self.data_event = data_event
-        # self.func_call = function_call
-        self.running = True  # bool: Flag to know when the data read should stop
-        self.termination_flag = termination_flag  # Flag to know when the thread should stop
+        # latest frames streamed from the device, (time, data) tuples, the oldest frames are
+        # dropped if they are not used fast enough
+        self.frames = deque(maxlen=STREAM_BUFFER_SIZE)
+        self.frame_callback = None
+        self.frame_timeout = DEFAULT_TIMEOUT
+        self.running = threading.Event()  # set while the device is streaming data
+        self.termination_flag = termination_flag  # set to stop the thread
 
     def run(self):
-        """ Poll the USB for new data packets and pass it through the queue and set the event flag so the main
-        program will update the graph.  Structure the program so if the termination flag is set, collect the last
-        data point to clear the data from the sensor."""
-
-        while not self.termination_flag:
-            logging.debug("In data collection thread")
-            if self.running:
-                data = self.device.read_all_data()
-                logging.debug("Got data: {0}".format(data))
-                # make sure there is data and that the previous data has been processed
-                # if data and self.data_queue.empty():
-                #     self.data_queue.put(data)
-                #     self.data_event.set()
-                if data:
-                    # self.func_call(data)
-                    self.master.data_processing(data)
-                elif not data:
-                    self.termination_flag = True
-                    logging.error("=================== Device not working =====================")
-            else:  # the main program wants to stop the program
-                self.termination_flag = True
-        logging.debug("exiting data thread call: {0}".format(self.termination_flag, hex(id(self.termination_flag))))
-        # print(hex(id(self.termination_flag)))
+        """ Read the frames the device streams and put them in the frames buffer, then call
+        the frame callback so the main program will update the graph.  A callback of None
+        means the device stopped working. """
+        while not self.termination_flag.is_set():
+            if not self.running.wait(timeout=0.2):
+                continue
+            data = self.device.read_all_data(timeout=self.frame_timeout)
+            if not self.running.is_set():
+                continue  # the stream was stopped while waiting for the frame
+            if data:
+                self.frames.append((time.monotonic(), data))
+            elif not self.device.connected:
+                logger.error("=================== Device not working =====================")
+                self.running.clear()
+            else:
+                continue  # missed a frame
+            self.data_event.set()
+            if self.frame_callback:
+                self.frame_callback(data)
+        logger.debug("exiting data thread")
         self.data_event.set()  # let the main program exit the data_read wait loop
 
-    def stop_running(self):
-        logging.debug("Stopping data stream")
-        self.running = False
+    def start_streaming(self, frame_callback, frame_timeout=DEFAULT_TIMEOUT):
+        """ Start putting the frames the device sends in the frames buffer
+        :param frame_callback: function to call from this thread with each frame
+        :param frame_timeout: milliseconds to wait for a frame before it is counted as missed
+        """
+        logger.debug("Starting data stream")
+        self.frames.clear()
+        self.frame_callback = frame_callback
+        self.frame_timeout = frame_timeout
+        self.running.set()
 
-    def single_run(self):
-        pass
+    def stop_running(self):
+        logger.debug("Stopping data stream")
+        self.running.clear()
+
+    def get_frames(self) -> list:
+        """ Remove and return all of the frames in the buffer, oldest first """
+        frames = []
+        while self.frames:
+            frames.append(self.frames.popleft())
+        return frames
+
+
+def command_name(message) -> str:
+    """ Remove the settings from a command so the timings of e.g. "AS7262|GAIN|1" and
+    "AS7262|GAIN|3" are grouped together """
+    if isinstance(message, bytes):
+        message = message.decode("utf-8", "replace")
+    return "|".join(part for part in str(message).split("|")
+                    if not part.replace(".", "").isdigit())
+
+
+def read_serial_message(device: serial.Serial, num_bytes=None, terminator=None,
+                        timeout=DEFAULT_TIMEOUT) -> bytes:
+    """ Read from a serial port till num_bytes are received, the terminator is received or,
+    if neither are given, the device stops sending.  Returns as soon as the message is done,
+    or what was received if the timeout is reached.
+
+    :param device: open serial port
+    :param num_bytes: length of the message if known
+    :param terminator: bytes the message ends with, it is not included in the returned message
+    :param timeout: milliseconds to wait for the message
+    :return: bytes read
+    """
+    deadline = time.monotonic() + timeout / 1000.
+    open_ended = not num_bytes and not terminator
+    message = bytearray()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if open_ended and message:
+            # the message is done when the device stops sending
+            remaining = min(remaining, INTER_BYTE_TIMEOUT)
+        device.timeout = remaining
+        if num_bytes:
+            new_bytes = device.read(num_bytes - len(message))
+        else:
+            new_bytes = device.read(max(1, device.in_waiting))
+        if not new_bytes:
+            if open_ended and message:
+                break
+            continue
+        message.extend(new_bytes)
+        if num_bytes and len(message) >= num_bytes:
+            break
+        if terminator and terminator in message:
+            return bytes(message[:message.index(terminator)])
+    return bytes(message)
 
 
 def find_available_ports():
+    """ Get the names of the serial ports on the computer.  The ports are just listed,
+    they are opened and checked when the device is looked for """
 
     # taken from http://stackoverflow.com/questions/12090503/listing-available-com-ports-with-python
 
     if sys.platform.startswith('win'):
-        ports = ['COM%s' % (i+1) for i in range(32)]
+        ports = port_discovery.list_ports()
     elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
         ports = glob.glob('/dev/tty[A-Za-z]*')
     elif sys.platform.startswith('darwin'):
         ports = glob.glob('/dev/tty.*')
     else:
         raise EnvironmentError('Unsupported platform')
-
-    available_ports = []
-    for port in ports:
-        try:
-            device = serial.Serial(port=port, write_timeout=0.5,
-                                   inter_byte_timeout=1, baudrate=115200,
-                                   parity=serial.PARITY_EVEN, stopbits=1)
-            device.close()
-            available_ports.append(device)
-        except (OSError, serial.SerialException):
-            pass
-    return available_ports
+    return ports